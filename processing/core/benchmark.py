@@ -0,0 +1,249 @@
+"""A subservice for benchmarking the analysis engines."""
+
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from processing.core.motion import motion_frames
+from processing.core.redact import detect_faces, detect_faces_ssd
+from processing.core.vectors import motion_scores
+from processing.utils.inference import iou_matrix
+
+
+def _timed(func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+  """Return result of the function along with it's runtime in secs."""
+  start_time = time.time()
+  result = func(*args, **kwargs)
+  return result, max(time.time() - start_time, 1e-3)
+
+
+def _coverage(mask: np.ndarray, padding: int = 32) -> np.ndarray:
+  """Return frames covered by the motion segments of the mask."""
+  kernel = np.ones(2 * padding + 1, dtype=np.int64)
+  return np.convolve(mask.astype(np.int64), kernel, mode='same') > 0
+
+
+def compare_motion_detectors(file: str,
+                             log: logging.Logger,
+                             precision: int = 1500,
+                             min_magnitude: float = 1.0,
+                             padding: int = 32) -> Dict:
+  """Compare motion vector based detector against pixel based detector.
+
+  Runs both the detectors on the same video and compares their speed
+  along with the agreement of their decisions, both per frame & per
+  frame kept in the motion segments.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    precision: Minimum moving area (default: 1500) in pixels.
+    min_magnitude: Minimum displacement (default: 1.0) in pixels for a
+                   block to be considered as moving.
+    padding: Number of frames (default: 32) kept around every frame
+             with motion.
+
+  Returns:
+    Dictionary of speed & agreement of the detectors.
+  """
+  log.info(f'Benchmarking motion detectors on "{os.path.basename(file)}"...')
+  pixels, pixel_time = _timed(motion_frames, file, precision)
+  (scores, _), vector_time = _timed(motion_scores, file, min_magnitude)
+
+  pixel_mask = np.zeros(len(scores), dtype=bool)
+  pixel_mask[[idx for idx in pixels if idx < len(scores)]] = True
+  vector_mask = scores >= precision
+  vector_mask[:1] = False
+
+  pixel_kept, vector_kept = (_coverage(pixel_mask, padding),
+                             _coverage(vector_mask, padding))
+  union = np.count_nonzero(pixel_kept | vector_kept)
+  results = {
+      'frames': len(scores),
+      'pixel_fps': len(scores) / pixel_time,
+      'vector_fps': len(scores) / vector_time,
+      'speedup': pixel_time / vector_time,
+      'frame_agreement': float(np.mean(pixel_mask[1:] == vector_mask[1:])),
+      'segment_iou': float(np.count_nonzero(pixel_kept & vector_kept) /
+                           union if union else 1.0),
+      'segment_recall': float(np.count_nonzero(pixel_kept & vector_kept) /
+                              np.count_nonzero(pixel_kept)
+                              if pixel_kept.any() else 1.0),
+  }
+
+  log.info(f'Pixel detector: {results["pixel_fps"]:.1f} fps, motion vector '
+           f'detector: {results["vector_fps"]:.1f} fps '
+           f'({results["speedup"]:.1f}x).')
+  log.info(f'Frame agreement: {results["frame_agreement"]:.2%}, segment IoU: '
+           f'{results["segment_iou"]:.2%}, segment recall: '
+           f'{results["segment_recall"]:.2%}.')
+  return results
+
+
+def compare_face_engines(file: str,
+                         log: logging.Logger,
+                         frame_step: int = 5,
+                         batch_size: int = 8,
+                         iou_threshold: float = 0.3) -> Dict:
+  """Compare SSD face detector against MTCNN.
+
+  Runs both the face detectors on the same sampled frames and compares
+  their speed. Faces detected by MTCNN are used as the reference for the
+  recall of the SSD detector.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    frame_step: Every Nth (default: 5) frame is sampled.
+    batch_size: Number (default: 8) of frames in a batch of SSD detector.
+    iou_threshold: Minimum IoU (default: 0.3) for the faces detected by
+                   both the detectors to be considered the same face.
+
+  Returns:
+    Dictionary of speed & agreement of the detectors.
+  """
+  log.info(f'Benchmarking face detectors on "{os.path.basename(file)}"...')
+  stream = cv2.VideoCapture(file)
+  frames, batch = 0, []
+  mtcnn_time, ssd_time = 0.0, 0.0
+  mtcnn_faces, ssd_faces, matched_mtcnn, matched_ssd = 0, 0, 0, 0
+
+  while True:
+    valid_frame = stream.grab()
+
+    if valid_frame and frames % frame_step:
+      frames += 1
+      continue
+
+    if valid_frame:
+      batch.append(stream.retrieve()[1])
+      frames += 1
+
+    if batch and (len(batch) == batch_size or not valid_frame):
+      references = []
+
+      for frame in batch:
+        faces, elapsed = _timed(detect_faces, frame)
+        references.append(faces)
+        mtcnn_time += elapsed
+
+      detections, elapsed = _timed(detect_faces_ssd, batch)
+      ssd_time += elapsed
+
+      for reference, detected in zip(references, detections):
+        mtcnn_faces += len(reference)
+        ssd_faces += len(detected)
+
+        if reference and detected:
+          overlap = iou_matrix(reference, detected) >= iou_threshold
+          matched_mtcnn += int(np.count_nonzero(overlap.any(axis=1)))
+          matched_ssd += int(np.count_nonzero(overlap.any(axis=0)))
+
+      batch = []
+
+    if not valid_frame:
+      break
+
+  stream.release()
+  sampled = -(-frames // frame_step)
+  results = {
+      'frames': sampled,
+      'mtcnn_fps': sampled / max(mtcnn_time, 1e-3),
+      'ssd_fps': sampled / max(ssd_time, 1e-3),
+      'speedup': max(mtcnn_time, 1e-3) / max(ssd_time, 1e-3),
+      'mtcnn_faces': mtcnn_faces,
+      'ssd_faces': ssd_faces,
+      'recall': matched_mtcnn / mtcnn_faces if mtcnn_faces else 1.0,
+      'precision': matched_ssd / ssd_faces if ssd_faces else 1.0,
+  }
+
+  log.info(f'MTCNN: {results["mtcnn_fps"]:.1f} fps, SSD: '
+           f'{results["ssd_fps"]:.1f} fps ({results["speedup"]:.1f}x).')
+  log.info(f'SSD recall: {results["recall"]:.2%}, precision: '
+           f'{results["precision"]:.2%} against {mtcnn_faces} MTCNN '
+           'face(s).')
+  return results
+
+
+def compare_face_scales(file: str,
+                        log: logging.Logger,
+                        scales: Sequence[float] = (0.75, 0.5, 0.33, 0.25),
+                        frame_step: int = 5,
+                        iou_threshold: float = 0.3,
+                        min_recall: float = 0.95) -> Dict:
+  """Check recall of MTCNN running on downscaled frames.
+
+  Faces detected on the full resolution frames are used as reference
+  for the recall of the detections made at every scale, so that a safe
+  `detection_scale` can be chosen for the camera.
+
+  Args:
+    file: Path of the video file from the camera.
+    log: Logger object for logging the status.
+    scales: Scales (default: 0.75, 0.5, 0.33, 0.25) to be checked.
+    frame_step: Every Nth (default: 5) frame is sampled.
+    iou_threshold: Minimum IoU (default: 0.3) for the faces detected at
+                   both the scales to be considered the same face.
+    min_recall: Minimum recall (default: 0.95) for the scale to be
+                considered safe.
+
+  Returns:
+    Dictionary of speed & recall of every scale along with the smallest
+    safe scale.
+  """
+  log.info(f'Checking face detection scales on "{os.path.basename(file)}"...')
+  stream = cv2.VideoCapture(file)
+  frames, sampled, reference_time = 0, 0, 0.0
+  reference_faces = 0
+  elapsed = {scale: 0.0 for scale in scales}
+  matched = {scale: 0 for scale in scales}
+
+  while stream.grab():
+    frames += 1
+
+    if (frames - 1) % frame_step:
+      continue
+
+    frame = stream.retrieve()[1]
+    sampled += 1
+    reference, spent = _timed(detect_faces, frame)
+    reference_faces += len(reference)
+    reference_time += spent
+
+    for scale in scales:
+      detected, spent = _timed(detect_faces, frame, scale=scale)
+      elapsed[scale] += spent
+
+      if reference and detected:
+        overlap = iou_matrix(reference, detected) >= iou_threshold
+        matched[scale] += int(np.count_nonzero(overlap.any(axis=1)))
+
+  stream.release()
+  results = {'frames': sampled, 'faces': reference_faces,
+             'fps': sampled / max(reference_time, 1e-3), 'scales': {},
+             'safe_scale': 1.0}
+  safe = True
+
+  for scale in sorted(scales, reverse=True):
+    recall = matched[scale] / reference_faces if reference_faces else 1.0
+    results['scales'][scale] = {
+        'fps': sampled / max(elapsed[scale], 1e-3),
+        'speedup': max(reference_time, 1e-3) / max(elapsed[scale], 1e-3),
+        'recall': recall,
+    }
+    log.info(f'Scale {scale}: {results["scales"][scale]["fps"]:.1f} fps '
+             f'({results["scales"][scale]["speedup"]:.1f}x), recall: '
+             f'{recall:.2%} against {reference_faces} face(s).')
+
+    # Scale is safe only if the larger scales are safe as well.
+    safe = safe and recall >= min_recall
+
+    if safe:
+      results['safe_scale'] = scale
+
+  log.info(f'Smallest safe scale for the camera: {results["safe_scale"]}')
+  return results
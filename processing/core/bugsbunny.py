@@ -6,8 +6,9 @@ import os
 import random
 import shutil
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
 import requests
@@ -16,26 +17,54 @@ import requests
 from app import models
 from processing.core.email import (email_to_admin_for_order_failure,
                                    email_to_admin_for_order_success)
-from processing.core.motion import track_motion
+from processing.core.graph import analyze_clip
+from processing.core.motion import track_motion, track_motion_in_chunks
+from processing.core.pipeline import (STAGE_WORKERS, Stage, StageFailure,
+                                      run_pipeline)
 from processing.core.redact import redact_faces, redact_license_plates
 from processing.core.sylvester import (calc_ssim_psnr, compress_video,
                                        new_bitrate)
+from processing.core.triage import needs_redaction
 from processing.core.trim import duration, trim_uniformly
+from processing.core.vectors import track_motion_vectors
 from processing.utils.boto_wrap import (access_file, create_s3_bucket,
-                                        upload_to_bucket)
+                                        object_size, upload_to_bucket)
+from processing.utils.background import BackgroundModel
 from processing.utils.bs_postgres import create_video_map_obj
-from processing.utils.common import now
+from processing.utils.cache import ResultCache, model_versions
+from processing.utils.checkpoint import Checkpoint, existing, succeeded
+from processing.utils.common import footage_epoch, now
 from processing.utils.generate import bucket_name, order_name, video_type
-from processing.utils.local import rename_aaaa_file, rename_original_file
+from processing.utils.local import (content_hash, filename, rename_aaaa_file,
+                                    rename_original_file)
 from processing.utils.paths import videos
+from processing.utils.proxy import make_proxy
+from processing.utils.roi import RegionOfInterest, camera_key, camera_roi
+from processing.utils.sidecar import encoded_hash
 
 _AWS_ACCESS_KEY = 'XAMES3'
 _AWS_SECRET_KEY = 'XAMES3'
 
 
+def stage_reader(readers: Union[Dict[str, str], str], stage: str) -> str:
+  """Return frame reader of the stage, the same for all if it's a string."""
+  if isinstance(readers, dict):
+    return readers.get(stage, 'opencv')
+  return readers
+
+
+def source_size(json_data: dict, log: logging.Logger) -> Optional[int]:
+  """Return size (in bytes) of the source video of the order on S3."""
+  return object_size(_AWS_ACCESS_KEY, _AWS_SECRET_KEY,
+                     json_data.get('org_file', None), log,
+                     'archived-order-uploads')
+
+
 def trimming_callable(json_data: dict,
                       final_file: str,
-                      log: logging.Logger) -> Union[Optional[List], str]:
+                      log: logging.Logger,
+                      offsets: Optional[Dict[str, float]] = None
+                      ) -> Union[Optional[List], str]:
   """Trimming function."""
   trimmed = []
 
@@ -50,12 +79,173 @@ def trimming_callable(json_data: dict,
 
   log.info(f"Processing Engine will create {_files}-{_files + 1} "
            f"video(s) for Order ID: {db_order}.")
-  trimmed = trim_uniformly(final_file, sampling_rate, clip_length)
+  trimmed = trim_uniformly(final_file, sampling_rate, clip_length, offsets)
   json_data['clips_count'] = len(trimmed)
 
   return trimmed
 
 
+def analyze_upload(file: str,
+                   log: logging.Logger,
+                   objects: Union[list, str] = None,
+                   count_obj: bool = False,
+                   analyze_face: bool = False,
+                   analyze_license_plate: bool = False,
+                   single_decode: bool = True,
+                   detect_every: int = 1,
+                   triage: bool = False,
+                   face_engine: str = 'mtcnn',
+                   face_scale: float = 1.0,
+                   tiles: Optional[Tuple[int, int]] = None,
+                   analysis_fps: Optional[float] = None,
+                   roi: Optional[RegionOfInterest] = None,
+                   source_hash: Optional[str] = None,
+                   offsets: Optional[Dict[str, float]] = None,
+                   motion_crops: bool = False,
+                   sweep_every: int = 30,
+                   preset: str = 'medium',
+                   readers: Union[Dict[str, str], str] = 'opencv',
+                   proxy: Optional[str] = None) -> str:
+  """Count objects and redact faces & license plates in the clip.
+
+  Runs the passes requested for the order on a single clip, so that
+  every clip can go through the analysis on it's own. Clips which fail
+  a pass are passed on to the next one as they are.
+
+  Returns:
+    Path of the analyzed clip.
+
+  Raises:
+    StageFailure: If any of the passes failed, with the clip as analyzed
+                  by the other passes.
+  """
+  name = os.path.basename(file)
+  # Stages work on their own copies of the clips, so the offsets are
+  # matched by the names of the clips.
+  offsets = {os.path.basename(clip): start
+             for clip, start in (offsets or {}).items()}
+  offset = offsets.get(name, 0.0)
+  # Clips without a known offset into the source are analyzed as they
+  # are, since their frames can not be matched to the proxy.
+  proxy = proxy if name in offsets else None
+
+  if triage and (analyze_face or analyze_license_plate):
+    try:
+      if not needs_redaction(file, log, analyze_face, analyze_license_plate,
+                             roi):
+        analyze_face, analyze_license_plate = False, False
+    except Exception:
+      log.warning(f'Triage failed for {name}, redacting it anyway.')
+
+  passes = [count_obj, analyze_face, analyze_license_plate]
+
+  # Tracked redaction holds frames back, so it runs as separate passes.
+  # Motion segments are only cut from the proxy in the single pass.
+  if (single_decode and detect_every <= 1 and
+          (sum(map(bool, passes)) > 1 or (count_obj and proxy))):
+    log.info(f'Analyzing video {name} in a single pass...')
+    analyzed = None
+
+    try:
+      analyzed = analyze_clip(file, log, objects, count_obj, analyze_face,
+                              analyze_license_plate, face_engine=face_engine,
+                              face_scale=face_scale, tiles=tiles,
+                              analysis_fps=analysis_fps, roi=roi,
+                              source_hash=source_hash, offset=offset,
+                              motion_crops=motion_crops,
+                              sweep_every=sweep_every, preset=preset,
+                              proxy=proxy)
+    except Exception as error:
+      log.exception(error)
+
+    if analyzed is None:
+      raise StageFailure(f'Analysis failed for {name}.', file)
+    return analyzed
+
+  # Passes which failed, the clip is not considered analyzed then.
+  failed = []
+
+  if count_obj:
+    log.info(f'Counting object(s) in video {name}...')
+    counted = None
+
+    try:
+      counted = track_motion(file, log, objects, tiles=tiles,
+                             analysis_fps=analysis_fps, roi=roi,
+                             source_hash=source_hash, offset=offset,
+                             preset=preset,
+                             reader=stage_reader(readers, 'objects'))
+    except Exception as error:
+      log.exception(error)
+
+    if counted is None:
+      failed.append('object counting')
+    file = counted or file
+    # Clip is reduced to it's motion segments, so it's frames no longer
+    # line up with the source.
+    source_hash = None
+
+  if analyze_face:
+    log.info(f'Redacting face(s) in video {name}...')
+    redacted = None
+
+    try:
+      redacted = redact_faces(file, log, roi=roi, engine=face_engine,
+                              detect_every=detect_every,
+                              detection_scale=face_scale,
+                              source_hash=source_hash, offset=offset,
+                              motion_crops=motion_crops,
+                              sweep_every=sweep_every, preset=preset,
+                              reader=stage_reader(readers, 'faces'))
+    except Exception as error:
+      log.exception(error)
+
+    if redacted is None:
+      failed.append('face redaction')
+    file = redacted or file
+
+  if analyze_license_plate:
+    log.info(f'Redacting license plate(s) in video {name}...')
+    redacted = None
+
+    try:
+      redacted = redact_license_plates(file, log, tiles=tiles, roi=roi,
+                                       detect_every=detect_every,
+                                       source_hash=source_hash,
+                                       offset=offset,
+                                       motion_crops=motion_crops,
+                                       sweep_every=sweep_every,
+                                       preset=preset,
+                                       reader=stage_reader(readers,
+                                                           'license_plates'))
+    except Exception as error:
+      log.exception(error)
+
+    if redacted is None:
+      failed.append('license plate redaction')
+    file = redacted or file
+
+  if failed:
+    raise StageFailure(f'{", ".join(failed).capitalize()} failed for '
+                       f'{name}.', file)
+  return file
+
+
+def stage_copy(function: Callable[[str], Any],
+               directory: str,
+               file: str) -> Any:
+  """Run the function on a copy of the clip in the directory of the stage.
+
+  Stages edit the clips in place, so every stage works on it's own copy
+  under the same name. The input of a stage is then never changed and a
+  resumed order can repeat the stage from it, even if the order stopped
+  after the stage was done but before it was recorded.
+  """
+  os.makedirs(directory, exist_ok=True)
+  return function(shutil.copy(file, os.path.join(directory,
+                                                 os.path.basename(file))))
+
+
 def write_to_db(order_id: Union[int, str],
                 video_obj: List[dict],
                 log: logging.Logger) -> None:
@@ -101,7 +291,7 @@ def spin(json_obj: str,
   """Spin the Video Processing Engine."""
   try:
     start = now()
-    upload, trimmed, urls, addons = [], [], [], []
+    upload, trimmed, urls = [], [], []
 
     json_data = json.loads(json_obj)
     log.info('Parsed consumer JSON request.')
@@ -115,25 +305,111 @@ def spin(json_obj: str,
     camera = json_data.get('camera_id', 0)
     org_file = json_data.get('org_file', None)
     motion = json_data.get('analyze_motion', False)
+    parallel_motion = json_data.get('parallel_motion', False)
+    motion_processes = json_data.get('motion_processes', None)
+    analysis_fps = json_data.get('analysis_fps', None)
+    motion_detector = json_data.get('motion_detector', 'pixels')
+    motion_blocks = json_data.get('motion_blocks', 6.0)
+    warm_background = json_data.get('warm_background', True)
     count_obj = json_data.get('count_obj', False)
     objects = json_data.get('objects', None)
     analyze_face = json_data.get('analyze_face', False)
     analyze_license_plate = json_data.get('analyze_license_plate', False)
+    face_engine = json_data.get('face_engine', 'mtcnn')
+    face_scale = json_data.get('face_detection_scale', 1.0)
+    motion_crops = json_data.get('motion_crops', False)
+    sweep_every = json_data.get('sweep_every', 30)
+    preset = json_data.get('encoder_preset', 'medium')
+    readers = json_data.get('frame_reader', 'opencv')
+    analysis_proxy = json_data.get('analysis_proxy', False)
+    proxy_width = json_data.get('proxy_width', 640)
+    triage = json_data.get('triage_clips', False)
+    workers = {**STAGE_WORKERS, **json_data.get('stage_workers', {})}
+    tiles = json_data.get('detection_tiles', None)
+    single_decode = json_data.get('single_decode', True)
+    detect_every = json_data.get('detect_every', 1)
+    reuse_detections = json_data.get('reuse_detections', True)
     compress = json_data.get('perform_compression', True)
     trim = json_data.get('perform_trimming', True)
     trimpress = json_data.get('trim_compressed', True)
     db_order = json_data.get('order_pk', 0)
+    resume = json_data.get('resume_order', True)
+    cache_results = json_data.get('cache_results', True)
+
+    tiles = tuple(tiles) if tiles else None
+    roi = camera_roi(store, area, camera)
+    background = None
+
+    if warm_background:
+      # Staleness of the saved background is judged by when the footage
+      # was recorded, not by when it's processed.
+      recorded_at = footage_epoch(json_data.get('start_date'),
+                                  json_data.get('start_time'))
+      background = BackgroundModel(camera_key(store, area, camera),
+                                   recorded_at=recorded_at)
+
+    results = ResultCache() if cache_results else None
+
+    # Saved background is updated by every run, so the results of a warm
+    # started motion analysis can never be asked for again.
+    if results and motion and background and background.usable():
+      log.info('Skipping result cache for the warm started motion analysis.')
+      results = None
+    # Only the parameters which change the results are part of their key,
+    # the ones of the features which are turned off are left out.
+    motion_params = {'roi': roi and roi.polygons,
+                     'motion': motion,
+                     'motion_detector': motion and motion_detector,
+                     'motion_blocks': (motion and motion_detector == 'vectors'
+                                       and float(motion_blocks)),
+                     'parallel_motion': motion and parallel_motion,
+                     'analysis_fps': motion and analysis_fps,
+                     'preset': preset}
+    clip_params = {**motion_params,
+                   'sampling_rate': float(json_data.get('sampling_rate', 0)),
+                   'clip_length': int(json_data.get('clip_length', 30)),
+                   'compress': compress, 'trim': trim, 'trimpress': trimpress,
+                   'count_obj': count_obj,
+                   'objects': count_obj and objects,
+                   'analyze_face': analyze_face,
+                   'face_engine': analyze_face and face_engine,
+                   'face_scale': analyze_face and float(face_scale),
+                   'analyze_license_plate': analyze_license_plate,
+                   'tiles': tiles, 'detect_every': detect_every,
+                   'single_decode': single_decode, 'triage': triage,
+                   'motion_crops': motion_crops, 'sweep_every': sweep_every,
+                   'analysis_proxy': analysis_proxy and proxy_width,
+                   'models': model_versions()}
 
     bucket = bucket_name(country, customer, contract, order)
-    order = order_name(store, area, camera, current)
+    checkpoint = Checkpoint(db_pk)
+
+    if not resume:
+      checkpoint.clear()
+
+    # Retries keep the name of the order, and so it's workspace, so that
+    # the outputs of the stages finished earlier are found again.
+    order = checkpoint.get('order') or order_name(store, area, camera,
+                                                  current)
+    checkpoint.save(order=order)
 
     log.info('Processing Engine loaded.')
     log.info(f'Processing Engine started spinning for angle #{camera}...')
-    log.info("Fetching file for processing from S3 bucket...")
-    status, org_file = access_file(_AWS_ACCESS_KEY, _AWS_SECRET_KEY, org_file,
-                                   str(uuid4()), log, "archived-order-uploads")
+    final = checkpoint.get('final')
 
-    if status:
+    if final and os.path.isfile(final):
+      log.info(f'Resuming order from "{os.path.basename(final)}"...')
+      status = True
+      init_path = checkpoint.get('workspace')
+      json_data['f_name'] = checkpoint.get('f_name')
+    else:
+      final = None
+      log.info("Fetching file for processing from S3 bucket...")
+      status, org_file = access_file(_AWS_ACCESS_KEY, _AWS_SECRET_KEY,
+                                     org_file, str(uuid4()), log,
+                                     "archived-order-uploads")
+
+    if status and final is None:
       json_data['f_name'] = os.path.basename(org_file)
       log.info(f'Prime base file "{os.path.basename(org_file)}" acquired.')
       log.info(f'Creating directory for processing...')
@@ -147,125 +423,200 @@ def spin(json_obj: str,
       cloned = shutil.copy(init_clone, os.path.join(init_clone, temp_clone))
       os.remove(init_clone)
       temp = cloned
-
-      if motion:
-        cloned = track_motion(cloned, log)
+      # Results are cached against the content of the downloaded video,
+      # so the same video submitted again reuses them.
+      origin_hash = content_hash(cloned) if results else None
+      motion_key = results and results.key('motion', origin_hash,
+                                           motion_params)
+
+      if motion and results and results.restore(motion_key, lambda _: temp):
+        log.info('Reusing motion analysis of the same video...')
+      elif motion:
+        if motion_detector == 'vectors':
+          cloned = track_motion_vectors(cloned, log, motion_blocks)
+        elif parallel_motion:
+          cloned = track_motion_in_chunks(cloned, log,
+                                          processes=motion_processes,
+                                          analysis_fps=analysis_fps, roi=roi,
+                                          background=background,
+                                          preset=preset,
+                                          reader=stage_reader(readers,
+                                                              'motion'))
+        else:
+          cloned = track_motion(cloned, log, analysis_fps=analysis_fps,
+                                roi=roi, background=background,
+                                preset=preset,
+                                reader=stage_reader(readers, 'motion'))
         log.info('Fixing up the symbolic link of the motion detected video...')
         shutil.move(cloned, temp)
         log.info('Symbolic link has been restored for motion detected video.')
         cloned = temp
+
+        if results:
+          results.put(motion_key, [cloned])
       else:
         log.info('Skipping motion analysis...')
 
-      log.info('Updating Event Milestone 02 - Motion Trimming...')
-      milestone_db = models.MilestoneStatus(work_status_id=db_pk,
-                                            milestone_id=2)
-      milestone_db.save()
-      log.info('Event Milestone 02 - Motion Trimming: UPDATED')
+      update_milestone(db_pk, 2, '02 - Motion Trimming', log, checkpoint)
 
       if not trim:
         trimpress = False
 
       log.info('Renaming original video as per internal nomenclature...')
       final = rename_aaaa_file(cloned, video_type(compress, trim, trimpress))
+      checkpoint.save(workspace=init_path, final=final,
+                      f_name=json_data['f_name'], origin_hash=origin_hash)
 
-      trimmed = trimming_callable(json_data, final, log)
-      log.info('Updating Event Milestone 03 - Trimming Videos...')
-      milestone_db = models.MilestoneStatus(work_status_id=db_pk,
-                                            milestone_id=4)
-      milestone_db.save()
-      log.info('Event Milestone 03 - Trimming Videos: UPDATED')
-
-      log.info('Analyzing and compressing video...')
-      analyze_video = random.choice(trimmed[0])
-      score, _ = calc_ssim_psnr(analyze_video)
-      log.info(f'Analyzed score: {round(score, 2)}%')
-
-      if score < 50.0:
-        log.info('Applying 20% compression...')
-        bitrate = int(new_bitrate(analyze_video) * 0.8)
-      elif 88.0 >= score >= 50.0:
-        log.info('Applying 50% compression...')
-        bitrate = int(new_bitrate(analyze_video) * 0.5)
+    if status:
+      origin_hash = checkpoint.get('origin_hash')
+      clips_key = None
+
+      if results and origin_hash:
+        clips_key = results.key('clips', origin_hash, clip_params)
+      trimmed = checkpoint.get('trimmed')
+      cached = checkpoint.get('cached', False)
+      restored = None
+
+      if not (trimmed and all(map(os.path.isfile, trimmed[0]))) and clips_key:
+        restored = results.restore(clips_key,
+                                   lambda idx: filename(final, idx + 1))
+
+      if restored:
+        log.info(f'Reusing {len(restored)} processed clip(s) of the same '
+                 'video, skipping to the upload...')
+        trimmed, cached = [restored], True
+        source_hash, offsets, proxy = None, {}, None
+        json_data['clips_count'] = len(trimmed)
+        checkpoint.save(trimmed=trimmed, cached=cached, clips={})
+      elif trimmed and all(map(os.path.isfile, trimmed[0])):
+        log.info(f'Reusing {len(trimmed[0])} clip(s) trimmed earlier.')
+        source_hash = checkpoint.get('source_hash')
+        offsets = checkpoint.get('offsets', {})
+        proxy = checkpoint.get('proxy')
+        json_data['clips_count'] = len(trimmed)
       else:
-        log.info('Applying 70% compression...')
-        bitrate = int(new_bitrate(analyze_video) * 0.3)
-
-      if compress:
-        for comp_idx in trimmed[0]:
-          log.info(f"Compressing video {comp_idx + 1}/{len(trimmed[0])}...")
-          upload.append(compress_video(comp_idx, bitrate))
-
-        log.info('Updating Event Milestone 04 - QA & Compression...')
-        milestone_db = models.MilestoneStatus(work_status_id=db_pk,
-                                              milestone_id=3)
-        milestone_db.save()
-        log.info('Event Milestone 04 - QA & Compression: UPDATED')
-
-      if count_obj:
-        for idx in upload:
-          log.info(f'Counting object(s) in video {os.path.basename(idx)}...')
-          try:
-            addon_temp = track_motion(idx, log, objects)
-          except Exception:
-            addon_temp = idx
-          addons.append(addon_temp)
-        upload = addons
-        addons = []
-
-      if analyze_face:
-        for idx in upload:
-          log.info(f'Redacting face(s) in video {os.path.basename(idx)}...')
-          try:
-            addon_temp = redact_faces(idx, log)
-          except Exception:
-            addon_temp = idx
-          addons.append(addon_temp)
-        upload = addons
-        addons = []
-
-      if analyze_license_plate:
-        for idx in upload:
-          log.info('Redacting license plate(s) in video '
-                   f'{os.path.basename(idx)}...')
-          try:
-            addon_temp = redact_license_plates(idx, log)
-          except Exception:
-            addon_temp = idx
-          addons.append(addon_temp)
-        upload = addons
-        addons = []
-
-      log.info('Updating Event Milestone 05 - Addon Features...')
-      save_milestone(db_pk, 5)
-      log.info('Event Milestone 05 - Addon Features: UPDATED')
+        # Detections are saved against the content of the video the clips
+        # are cut from, so re-runs of the same video reuse them.
+        source_hash = content_hash(final) if reuse_detections else None
+        offsets = {}
+
+        trimmed = trimming_callable(json_data, final, log, offsets)
+        proxy = None
+
+        # Proxy only saves decoding while the clips are reduced to their
+        # motion segments in a single pass.
+        if (analysis_proxy and count_obj and single_decode and
+                detect_every <= 1):
+          log.info('Encoding low resolution analysis proxy...')
+          # Clips without a known offset into the source are analyzed as
+          # they are, since their frames can not be matched to the proxy.
+          proxy = make_proxy(final, proxy_width)
+        # Outputs of the clips trimmed earlier no longer match the clips.
+        cached = False
+        checkpoint.save(trimmed=trimmed, source_hash=source_hash,
+                        offsets=offsets, proxy=proxy, bitrate=None,
+                        cached=cached, clips={})
+      update_milestone(db_pk, 4, '03 - Trimming Videos', log, checkpoint)
+
+      bitrate = checkpoint.get('bitrate')
+
+      if cached:
+        if compress:
+          update_milestone(db_pk, 3, '04 - QA & Compression', log,
+                           checkpoint)
+        update_milestone(db_pk, 5, '05 - Addon Features', log, checkpoint)
+      elif bitrate is None:
+        log.info('Analyzing and compressing video...')
+        analyze_video = random.choice(trimmed[0])
+        score, _ = calc_ssim_psnr(analyze_video)
+        log.info(f'Analyzed score: {round(score, 2)}%')
+
+        if score < 50.0:
+          log.info('Applying 20% compression...')
+          bitrate = int(new_bitrate(analyze_video) * 0.8)
+        elif 88.0 >= score >= 50.0:
+          log.info('Applying 50% compression...')
+          bitrate = int(new_bitrate(analyze_video) * 0.5)
+        else:
+          log.info('Applying 70% compression...')
+          bitrate = int(new_bitrate(analyze_video) * 0.3)
+        checkpoint.save(bitrate=bitrate)
 
       try:
         create_s3_bucket(_AWS_ACCESS_KEY, _AWS_SECRET_KEY, bucket[:-4], log)
       except Exception:
         pass
 
-      log.info(f'Uploading {len(upload)} video(s) on S3 bucket...')
-      for idx, file in enumerate(upload):
-        url = upload_to_bucket(_AWS_ACCESS_KEY, _AWS_SECRET_KEY, bucket[:-4],
-                               file, log, directory=bucket)
-        urls.append(url)
-        log.info(f'Uploaded {idx + 1}/{len(upload)} on to S3 bucket.')
-
-      log.info('Updating Event Milestone 06 - Video Upload...')
-      save_milestone(db_pk, 6)
-      log.info('Event Milestone 06 - Video Upload: UPDATED')
-
-      smash_db(db_order, upload, urls, log)
-      log.info('Updating Event Milestone 07 - Database Hit...')
-      save_milestone(db_pk, 7)
-      log.info('Event Milestone 07 - Database Hit: UPDATED')
+      stages = []
+
+      if compress and not cached:
+        stages.append(Stage('compression',
+                            partial(stage_copy,
+                                    partial(compress_video, bitrate=bitrate),
+                                    os.path.join(init_path, 'compression')),
+                            workers['compress'],
+                            on_complete=partial(update_milestone, db_pk, 3,
+                                                '04 - QA & Compression', log,
+                                                checkpoint),
+                            on_result=partial(checkpoint.record,
+                                              'compression'),
+                            done=existing(checkpoint.clips('compression'))))
+
+      analyzer = partial(analyze_upload, log=log, objects=objects,
+                         count_obj=count_obj, analyze_face=analyze_face,
+                         analyze_license_plate=analyze_license_plate,
+                         single_decode=single_decode,
+                         detect_every=detect_every, triage=triage,
+                         face_engine=face_engine, face_scale=face_scale,
+                         tiles=tiles, analysis_fps=analysis_fps, roi=roi,
+                         source_hash=encoded_hash(
+                             source_hash,
+                             bitrate=bitrate if compress else None),
+                         offsets=offsets,
+                         motion_crops=motion_crops, sweep_every=sweep_every,
+                         preset=preset, readers=readers, proxy=proxy)
+      analysis = Stage('analysis',
+                       partial(stage_copy, analyzer,
+                               os.path.join(init_path, 'analysis')),
+                       workers['analysis'], fallback=True,
+                       on_complete=partial(update_milestone, db_pk, 5,
+                                           '05 - Addon Features', log,
+                                           checkpoint),
+                       on_result=partial(checkpoint.record, 'analysis'),
+                       done=existing(checkpoint.clips('analysis')))
+
+      if not cached:
+        stages.append(analysis)
+
+      stages.append(Stage('upload', partial(upload_to_bucket, _AWS_ACCESS_KEY,
+                                            _AWS_SECRET_KEY, bucket[:-4],
+                                            log=log, directory=bucket),
+                          workers['upload'], processes=False,
+                          on_complete=partial(update_milestone, db_pk, 6,
+                                              '06 - Video Upload', log,
+                                              checkpoint),
+                          on_result=partial(checkpoint.record, 'upload'),
+                          done=succeeded(checkpoint.clips('upload'))))
+
+      log.info(f'Moving {len(trimmed[0])} clip(s) through '
+               f'{", ".join(stage.name for stage in stages)}...')
+      outputs = run_pipeline(trimmed[0], stages, log)
+      upload = trimmed[0] if cached else outputs[-2]
+      urls = outputs[-1]
+
+      # Clips which failed the analysis are not cached, so that they are
+      # analyzed again the next time.
+      if clips_key and not cached and not analysis.failed:
+        results.put(clips_key, upload)
+
+      if not checkpoint.reached(7):
+        smash_db(db_order, upload, urls, log)
+      update_milestone(db_pk, 7, '07 - Database Hit', log, checkpoint)
 
       log.info('Cleaning up secure directory...')
       shutil.rmtree(init_path)
-      log.info('Updating Event Milestone 08 - Final Cleanup...')
-      save_milestone(db_pk, 8)
-      log.info('Event Milestone 08 - Final Cleanup: UPDATED')
+      update_milestone(db_pk, 8, '08 - Final Cleanup', log, checkpoint)
+      checkpoint.clear()
       log.info('Updating admin via email.')
       email_to_admin_for_order_success(json_data, log)
       log.info(f'Processing Engine ran for about {now() - start}.')
@@ -282,6 +633,24 @@ def spin(json_obj: str,
     log.critical('Something went wrong while video processing was running.')
 
 
+def update_milestone(db_pk: int,
+                     stone_id: int,
+                     title: str,
+                     log: logging.Logger,
+                     checkpoint: Optional[Checkpoint] = None) -> None:
+  """Save the milestone unless the order had saved it before resuming."""
+  if checkpoint is not None and checkpoint.reached(stone_id):
+    log.info(f'Event Milestone {title}: ALREADY UPDATED')
+    return
+
+  log.info(f'Updating Event Milestone {title}...')
+  save_milestone(db_pk, stone_id)
+  log.info(f'Event Milestone {title}: UPDATED')
+
+  if checkpoint is not None:
+    checkpoint.reach(stone_id)
+
+
 def save_milestone(db_pk, stone_id) -> bool:
   try:
     milestone_db = models.MilestoneStatus(work_status_id=db_pk,
@@ -0,0 +1,443 @@
+"""A subservice for running all the frame analyzers in a single pass."""
+
+import logging
+import os
+import shutil
+from collections import deque
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from processing.core.motion import (cached_objects, motion_contours,
+                                    object_classes, object_counts,
+                                    object_store)
+from processing.core.redact import (MTCNN_CONFIDENCE, PLATE_CONFIDENCE,
+                                    RES10_SSD_CONFIDENCE, crop_tiles,
+                                    detect_faces, detect_license_plates)
+from processing.utils.buffers import FramePool
+from processing.utils.counters import DetectionCounter, report_file
+from processing.utils.effects import redact_regions
+from processing.utils.gating import MotionGate
+from processing.utils.paths import tf_caffemodel, tf_prototxt
+from processing.utils.pipes import FFmpegWriter
+from processing.utils.proxy import SourceFrames, proxy_stream
+from processing.utils.roi import RegionOfInterest
+from processing.utils.sidecar import (as_boxes, as_detections, cached,
+                                      detection_store, frame_offset)
+
+
+class FrameViews:
+  """Derived views of the decoded frame shared by the analyzers.
+
+  Every view is computed on it's first use and cached, so the views
+  needed by several analyzers are computed only once per frame. The
+  frame itself is the resized view if the analysis is resized. Views of
+  the matching frame of the analysis proxy, if any, are kept along and
+  the frame itself can then be decoded on it's first use.
+  """
+
+  def __init__(self,
+               frame: Union[np.ndarray, Callable[[], Optional[np.ndarray]]],
+               roi: Optional[RegionOfInterest] = None,
+               proxy: Optional[np.ndarray] = None) -> None:
+    self._frame = frame
+    self.roi = roi
+    self.proxy = None if proxy is None else FrameViews(proxy, roi)
+    self._views: Dict[str, np.ndarray] = {}
+
+  @property
+  def frame(self) -> Optional[np.ndarray]:
+    """Frame, decoded on it's first use if it's decoded lazily."""
+    if callable(self._frame):
+      self._frame = self._frame()
+    return self._frame
+
+  @property
+  def decoded(self) -> bool:
+    """Check if the frame was decoded."""
+    return not callable(self._frame)
+
+  @property
+  def analyzed(self) -> 'FrameViews':
+    """Views the detectors run on, of the proxy frame if there is one."""
+    return self if self.proxy is None else self.proxy
+
+  @property
+  def gray(self) -> np.ndarray:
+    """Grayscale view of the frame."""
+    if 'gray' not in self._views:
+      self._views['gray'] = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+    return self._views['gray']
+
+  @property
+  def rgb(self) -> np.ndarray:
+    """RGB view of the frame."""
+    if 'rgb' not in self._views:
+      self._views['rgb'] = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
+    return self._views['rgb']
+
+  @property
+  def blurred(self) -> np.ndarray:
+    """Blurred grayscale view cropped to the region for motion analysis."""
+    if 'blurred' not in self._views:
+      gray = self.gray if self.roi is None else self.roi.crop(self.gray)[0]
+      self._views['blurred'] = cv2.GaussianBlur(gray, (21, 21), 0)
+    return self._views['blurred']
+
+
+def redact_boxes(frame: np.ndarray,
+                 boxes: List[Tuple[Tuple[int, int, int, int],
+                                   Tuple[int, int]]],
+                 smooth_blur: bool = True) -> np.ndarray:
+  """Blur or pixelate every box along with it's kernel size in place."""
+  for ksize in set(ksize for _, ksize in boxes):
+    redact_regions(frame, [box for box, size in boxes if size == ksize],
+                   smooth_blur, ksize)
+  return frame
+
+
+def analyze_clip(file: str,
+                 log: logging.Logger,
+                 track_what: Union[list, str] = None,
+                 count_obj: bool = False,
+                 analyze_face: bool = False,
+                 analyze_license_plate: bool = False,
+                 use_ml_model: bool = True,
+                 face_engine: str = 'mtcnn',
+                 face_scale: float = 1.0,
+                 smooth_blur: bool = True,
+                 precision: int = 1500,
+                 resize: bool = False,
+                 resize_width: int = 640,
+                 tiles: Optional[Tuple[int, int]] = None,
+                 analysis_fps: Optional[float] = None,
+                 roi: Optional[RegionOfInterest] = None,
+                 padding: int = 32,
+                 source_hash: Optional[str] = None,
+                 offset: float = 0.0,
+                 motion_crops: bool = False,
+                 sweep_every: int = 30,
+                 preset: str = 'medium',
+                 bitrate: Optional[int] = None,
+                 proxy: Optional[str] = None) -> str:
+  """Count objects & redact faces and license plates in a single pass.
+
+  Equivalent of running `track_motion()`, `redact_faces()` and
+  `redact_license_plates()` one after the other, but the video is
+  decoded once and encoded once. If objects are counted, the video is
+  reduced to it's motion segments like `track_motion()` and only the
+  frames which are kept are redacted. All the redactions are applied to
+  the same frame before it is encoded. If objects are counted & the low
+  resolution `proxy` of the source is provided, the whole analysis runs
+  on the proxy frames and only the frames which are kept are decoded at
+  the full resolution.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    track_what: Object class(es) (default: None) to be counted.
+    count_obj: Boolean (default: False) value to count the objects and
+               keep only the motion segments.
+    analyze_face: Boolean (default: False) value to redact the faces.
+    analyze_license_plate: Boolean (default: False) value to redact the
+                           license plates.
+    use_ml_model: Boolean (default: True) value to use ML model instead
+                  of Haar cascade for detecting the faces.
+    face_engine: ML model (default: mtcnn) for detecting the faces,
+                 either `mtcnn` or `ssd`.
+    face_scale: Scale (default: 1.0) of the frames on which MTCNN or
+                Haar cascade detects the faces.
+    smooth_blur: Boolean (default: True) value to blur instead of
+                 pixelating the redacted regions.
+    precision: Minimum moving area (default: 1500) in pixels.
+    resize: Boolean (default: False) value to resize the video.
+    resize_width: Width (default: 640) to be resized to.
+    tiles: Number (default: None) of columns & rows of tiles for the
+           SSD detectors.
+    analysis_fps: Frame rate (default: None -> every frame) at which the
+                  motion & objects are analyzed.
+    roi: Region of interest (default: None) of the camera.
+    padding: Number of frames (default: 32) kept around every frame
+             with motion.
+    source_hash: Content hash (default: None) of the source video for
+                 reusing the saved detections.
+    offset: Secs (default: 0.0) into the source video where the video
+            starts.
+    motion_crops: Boolean (default: False) value to detect the faces &
+                  license plates only in the moving regions.
+    sweep_every: Number of detections (default: 30) after which the
+                 full frame is analyzed while detecting in the moving
+                 regions.
+    preset: x264 preset (default: medium) used for encoding the video.
+    bitrate: Bitrate (default: None -> x264 default) of the video.
+    proxy: Path (default: None) of the low resolution proxy of the
+           source video on which the motion, objects, faces & license
+           plates are detected, used only if the objects are counted.
+
+  Returns:
+    Path of the analyzed video.
+  """
+  log.info(f'Analyzing "{os.path.basename(file)}" in a single pass...')
+  temp_file = os.path.join(os.path.dirname(file), f'{Path(file).stem}_xa.mp4')
+  stream, save, analysis = None, None, None
+
+  try:
+    stream = cv2.VideoCapture(file)
+    fps = stream.get(cv2.CAP_PROP_FPS)
+    seconds = stream.get(cv2.CAP_PROP_FRAME_COUNT) / (fps or 1) + 1
+    motion_count = DetectionCounter(seconds, 'motion')
+    temp_obj_count = DetectionCounter(seconds,
+                                      object_classes(track_what) or 'objects')
+    face_count = DetectionCounter(seconds, 'faces')
+    net = None
+    model = face_engine if use_ml_model else 'haar'
+    base = frame_offset(offset, fps)
+    # Every frame is kept if the objects are not counted, so the proxy
+    # would only add a decode.
+    analysis = proxy_stream(proxy, base) if count_obj else None
+    proxy_width = analysis.size[0] if analysis else None
+    face_store = detection_store(
+        source_hash, model, roi,
+        resize_width=resize_width if resize else None,
+        confidence=(RES10_SSD_CONFIDENCE if model == 'ssd'
+                    else MTCNN_CONFIDENCE),
+        scale=None if model == 'ssd' else face_scale,
+        sweep_every=sweep_every if motion_crops else None,
+        proxy_width=proxy_width)
+    plate_store = detection_store(
+        source_hash, 'mssd512', roi, tiles=tiles,
+        resize_width=resize_width if resize else None,
+        confidence=PLATE_CONFIDENCE,
+        sweep_every=sweep_every if motion_crops else None,
+        proxy_width=proxy_width)
+    obj_store = object_store(source_hash, resize, resize_width, tiles, roi,
+                             proxy_width=proxy_width)
+    face_gate, plate_gate = None, None
+
+    if motion_crops:
+      face_gate = MotionGate(lambda images: [
+          detect_faces(image, use_ml_model, engine=face_engine, scores=True,
+                       scale=face_scale) for image in images], sweep_every, roi)
+      plate_gate = MotionGate(lambda images: [
+          detect_license_plates(image, crop_tiles(image, tiles), scores=True)
+          for image in images], sweep_every, roi)
+
+    def to_frame(views: FrameViews, boxes: List[Tuple]) -> List[Tuple]:
+      if views.proxy is None:
+        return boxes
+      # Boxes found on the proxy are mapped back to the frame.
+      return analysis.to_source(boxes, views.frame.shape[1],
+                                views.frame.shape[0])
+
+    def faces_of(views: FrameViews) -> List[Tuple]:
+      target = views.analyzed
+
+      if face_gate is not None:
+        return to_frame(views, face_gate.detect(target.frame))
+      return to_frame(views, detect_faces(
+          target.frame, use_ml_model, roi,
+          target.rgb if use_ml_model else target.gray, face_engine,
+          scores=True, scale=face_scale))
+
+    def plates_of(views: FrameViews) -> List[Tuple]:
+      target = views.analyzed
+
+      if plate_gate is not None:
+        return to_frame(views, plate_gate.detect(target.frame))
+      return to_frame(views, detect_license_plates(target.frame, tiles, roi,
+                                                   scores=True))
+
+    if count_obj and track_what is not None:
+      net = cv2.dnn.readNetFromCaffe(tf_prototxt, tf_caffemodel)
+
+    step = 1
+
+    if analysis_fps and fps:
+      step = max(int(round(fps / analysis_fps)), 1)
+      padding += step - 1
+
+    buffer = deque(maxlen=padding)
+    pool = FramePool()
+    first_frame, mask, last_motion, source = None, None, None, None
+    written, idx = 0, -1
+    frames = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    if analysis is not None:
+      source = SourceFrames(stream, pool)
+      width = resize_width if resize else stream.get(cv2.CAP_PROP_FRAME_WIDTH)
+      # Moving area is measured on the proxy, so it's scaled down as well.
+      precision *= (analysis.size[0] / float(width)) ** 2
+
+    def full_frame(index: int) -> Optional[np.ndarray]:
+      frame = source.read(index)
+
+      if frame is not None and resize:
+        frame = pool.rescale(frame, resize_width)
+      return frame
+
+    def emit(views: FrameViews, second: int, index: int) -> None:
+      nonlocal save, written
+      boxes = []
+
+      if views.frame is None:
+        # Video ended before the proxy did.
+        return
+
+      if analyze_face:
+        faces = as_boxes(cached(face_store, [index], lambda _: [
+            as_detections(faces_of(views))])[0])
+        face_count.update(second, len(faces))
+        ksize = (49, 49) if use_ml_model else (21, 21)
+        boxes.extend((face, ksize) for face in faces)
+
+      if analyze_license_plate:
+        plates = as_boxes(cached(plate_store, [index], lambda _: [
+            as_detections(plates_of(views))])[0])
+        boxes.extend((plate, (49, 49)) for plate in plates)
+
+      if save is None:
+        save = FFmpegWriter(temp_file, fps,
+                            (views.frame.shape[1], views.frame.shape[0]),
+                            preset, bitrate)
+
+      save.write(redact_boxes(views.frame, boxes, smooth_blur))
+      pool.release(views.frame)
+      written += 1
+
+    while True:
+      if analysis is not None:
+        # Proxy of the whole source goes on after the end of the video.
+        view = analysis.read() if idx + 1 < frames or frames <= 0 else None
+
+        if view is None:
+          break
+
+        idx += 1
+        second = int(idx / (fps or 1))
+        views = FrameViews(partial(full_frame, idx), roi, view)
+      else:
+        valid_frame, frame = pool.read(stream)
+
+        if not valid_frame:
+          break
+
+        if frame is None:
+          break
+
+        if resize:
+          frame = pool.rescale(frame, resize_width)
+
+        idx += 1
+        second = int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+        views = FrameViews(frame, roi)
+
+      if not count_obj:
+        emit(views, second, base + idx)
+        continue
+
+      if first_frame is None:
+        first_frame = views.analyzed.blurred
+
+        if roi is not None:
+          mask = roi.cropped_mask(views.analyzed.frame.shape[1],
+                                  views.analyzed.frame.shape[0])
+
+        if views.decoded:
+          pool.release(views.frame)
+        continue
+
+      if (idx - 1) % step == 0:
+        if net is not None:
+          # Objects are only counted, so their boxes are not mapped back.
+          objects = cached_objects(net, views.analyzed.frame, track_what,
+                                   tiles, roi, obj_store, base + idx)
+          temp_obj_count.update(second, object_counts(objects, track_what))
+
+        contours = motion_contours(first_frame, views.analyzed.blurred,
+                                   precision, mask, pool)
+        motion_count.update(second, len(contours))
+
+        if contours:
+          # Frames buffered before the motion are written first.
+          while buffer:
+            emit(*buffer.popleft())
+          last_motion = idx
+
+      if last_motion is not None and idx - last_motion < padding:
+        emit(views, second, base + idx)
+      else:
+        if (buffer and len(buffer) == buffer.maxlen and
+                buffer[0][0].decoded):
+          # Frame dropped from the buffer is never written.
+          pool.release(buffer[0][0].frame)
+
+        buffer.append((views, second, base + idx))
+
+    stream.release()
+
+    if analysis is not None:
+      analysis.release()
+
+    if save is not None:
+      save.release()
+
+    for store in (face_store, plate_store, obj_store):
+      if store is not None:
+        store.save()
+
+    log.info('Logging detections into a CSV file.')
+
+    if count_obj:
+      motion_count.save(report_file(file, 'motion'))
+
+      if temp_obj_count.seconds().size:
+        temp_obj_count.save(report_file(file, 'object'))
+
+    if analyze_face:
+      face_count.save(report_file(file, 'faces'))
+
+    if written == 0:
+      if os.path.isfile(temp_file):
+        os.remove(temp_file)
+
+      if count_obj and (analyze_face or analyze_license_plate):
+        # Without any motion the complete video is kept & redacted.
+        log.info('No motion detected, redacting the complete video...')
+        return analyze_clip(file, log, analyze_face=analyze_face,
+                            analyze_license_plate=analyze_license_plate,
+                            use_ml_model=use_ml_model,
+                            face_engine=face_engine, face_scale=face_scale,
+                            smooth_blur=smooth_blur, resize=resize,
+                            resize_width=resize_width, tiles=tiles, roi=roi,
+                            source_hash=source_hash, offset=offset,
+                            motion_crops=motion_crops,
+                            sweep_every=sweep_every, preset=preset,
+                            bitrate=bitrate, proxy=proxy)
+      return file
+
+    if source is not None:
+      log.info(f'Decoded {source.decoded} of {idx + 1} frame(s) at the full '
+               'resolution.')
+
+    log.info(f'Wrote {written} frame(s) after analyzing {idx + 1} frame(s).')
+    shutil.move(temp_file, file)
+    return file
+  except Exception as error:
+    log.critical(f'Something went wrong because of {error}')
+
+    if save is not None:
+      save.release()
+
+    if os.path.isfile(temp_file):
+      # Partly encoded video of the failed run is never used.
+      os.remove(temp_file)
+    raise error
+  finally:
+    # Releasing again is harmless, so the decoder & the encoder of a run
+    # which failed midway are not left behind.
+    for source in (stream, save, analysis):
+      if source is not None:
+        source.release()
@@ -1,40 +1,60 @@
-import csv
 import logging
 import os
 import shutil
+import subprocess
 import time
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from itertools import repeat
 from pathlib import Path
 from queue import Queue
 from threading import Thread
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
 import cv2
 import imutils
 import numpy as np
 
 from processing.core.concate import concate_videos
-from processing.utils.common import seconds_to_datetime as s2d
+from processing.utils.background import BackgroundModel
+from processing.utils.buffers import FramePool
+from processing.utils.counters import DetectionCounter, report_file
+from processing.utils.inference import detect
 from processing.utils.local import filename
-from processing.utils.opencvapi import (disconnect, draw_bounding_box, green,
+from processing.utils.opencvapi import (disconnect, draw_bounding_boxes, green,
                                         rescale, temp_list)
 from processing.utils.paths import tf_caffemodel, tf_prototxt
+from processing.utils.pipes import FFmpegWriter, open_stream
+from processing.utils.roi import RegionOfInterest
+from processing.utils.sidecar import (DetectionStore, cached, detection_store,
+                                      frame_offset)
 
 CLASSES = ['background', 'aeroplane', 'bicycle', 'bird', 'boat',
            'bottle', 'bus', 'car', 'cat', 'chair', 'cow', 'diningtable',
            'dog', 'horse', 'motorbike', 'person', 'pottedplant', 'sheep',
            'sofa', 'train', 'tvmonitor']
 
+# Native input size of the MobileNet SSD used for detecting the objects.
+MOBILENET_SSD_SIZE = 300
+
+# Minimum confidence of the detected objects.
+OBJECT_CONFIDENCE = 0.3
+
 new_color = list(repeat((np.random.random(size=3) * 256), len(CLASSES)))
 
 
 class KeyClipWriter:
-  def __init__(self, bufSize=64, timeout=1.0):
+  def __init__(self, bufSize=64, timeout=1.0, preset='medium', bitrate=None,
+               pool=None):
     # store the maximum buffer size of frames to be kept
-    # in memory along with the sleep timeout during threading
+    # in memory along with the sleep timeout during threading,
+    # the x264 settings of the clips and the pool the frames
+    # are handed back to once they are written or dropped
     self.bufSize = bufSize
     self.timeout = timeout
+    self.preset = preset
+    self.bitrate = bitrate
+    self.pool = pool
 
     # initialize the buffer of frames, queue of frames that
     # need to be written to file, video writer, writer thread,
@@ -45,27 +65,39 @@ class KeyClipWriter:
     self.thread = None
     self.recording = False
 
+  def _retain(self, frame):
+    return frame if self.pool is None else self.pool.retain(frame)
+
+  def _release(self, frame):
+    if self.pool is not None:
+      self.pool.release(frame)
+
   def update(self, frame):
-    # update the frames buffer
-    self.frames.appendleft(frame)
+    # update the frames buffer, the oldest frame is dropped
+    # once the buffer is full
+    if len(self.frames) == self.bufSize:
+      self._release(self.frames[-1])
+
+    self.frames.appendleft(self._retain(frame))
 
     # if we are recording, update the queue as well
     if self.recording:
-      self.Q.put(frame)
+      self.Q.put(self._retain(frame))
 
-  def start(self, outputPath, fourcc, fps):
-    # indicate that we are recording, start the video writer,
+  def start(self, outputPath, fps):
+    # indicate that we are recording, start the H264 video writer,
     # and initialize the queue of frames that need to be written
     # to the video file
     self.recording = True
-    self.writer = cv2.VideoWriter(outputPath, fourcc, fps,
-                                  (self.frames[0].shape[1],
-                                   self.frames[0].shape[0]), True)
+    self.writer = FFmpegWriter(outputPath, fps,
+                               (self.frames[0].shape[1],
+                                self.frames[0].shape[0]),
+                               self.preset, self.bitrate)
     self.Q = Queue()
     # loop over the frames in the deque structure and add them
     # to the queue
     for i in range(len(self.frames), 0, -1):
-      self.Q.put(self.frames[i - 1])
+      self.Q.put(self._retain(self.frames[i - 1]))
 
     # start a thread write frames to the video file
     self.thread = Thread(target=self.write, args=())
@@ -85,6 +117,7 @@ class KeyClipWriter:
         # to the video file
         frame = self.Q.get()
         self.writer.write(frame)
+        self._release(frame)
 
       # otherwise, the queue is empty, so sleep for a bit
       # so we don't waste CPU cycles
@@ -96,6 +129,7 @@ class KeyClipWriter:
     while not self.Q.empty():
       frame = self.Q.get()
       self.writer.write(frame)
+      self._release(frame)
 
   def finish(self):
     # indicate that we are done recording, join the thread,
@@ -107,6 +141,227 @@ class KeyClipWriter:
     self.writer.release()
 
 
+def _prepare(frame: np.ndarray,
+             resize: bool = False,
+             resize_width: int = 640,
+             roi: Optional[RegionOfInterest] = None,
+             pool: Optional[FramePool] = None
+             ) -> Tuple[np.ndarray, np.ndarray]:
+  """Return the (optionally rescaled) frame with it's blurred grayscale.
+
+  If the region of interest is provided, the grayscale frame is cropped
+  to it's bounding box. If the pool is provided, the frame is resized
+  into it's free buffer and the grayscale frames are written into it's
+  scratch buffers, which are overwritten by the next frame.
+  """
+  if resize:
+    frame = (rescale(frame, resize_width) if pool is None
+             else pool.rescale(frame, resize_width))
+
+  gray_frame = frame if roi is None else roi.crop(frame)[0]
+  gray, blurred = None, None
+
+  if pool is not None:
+    shape = gray_frame.shape[:2]
+    gray, blurred = pool.scratch('gray', shape), pool.scratch('blurred', shape)
+
+  gray_frame = cv2.cvtColor(gray_frame, cv2.COLOR_BGR2GRAY, dst=gray)
+  gray_frame = cv2.GaussianBlur(gray_frame, (21, 21), 0, dst=blurred)
+  return frame, gray_frame
+
+
+def detect_objects(net: cv2.dnn_Net,
+                   frame: np.ndarray,
+                   track_what: Union[list, str] = None,
+                   tiles: Optional[Tuple[int, int]] = None,
+                   roi: Optional[RegionOfInterest] = None,
+                   scores: bool = False) -> List[Tuple]:
+  """Return class index and box of the tracked objects in the frame.
+
+  If tiles are not provided, the network runs on the full size frame.
+  Otherwise the frame (or it's tiles) is resized to the native input
+  size of the network. If the region of interest is provided, only the
+  frame cropped to it's bounding box is analyzed. If scores are
+  requested, confidence is added after the box.
+  """
+  objects = []
+
+  if track_what is None:
+    return objects
+
+  full_height, full_width = frame.shape[:2]
+
+  if roi is not None:
+    frame = roi.crop(frame)[0]
+
+  height, width = frame.shape[:2]
+
+  if tiles is None:
+    blob = cv2.dnn.blobFromImage(frame, 0.007843, (width, height), 127.5)
+    net.setInput(blob)
+    detected_objs = net.forward()
+    detected_objs = detected_objs[0, 0, detected_objs[0, 0, :, 2] >
+                                  OBJECT_CONFIDENCE]
+    detected_objs = [(*(coords * np.array([width, height, width, height])),
+                      score, label)
+                     for _, label, score, *coords in detected_objs]
+  else:
+    detected_objs = detect(net, frame, MOBILENET_SSD_SIZE, 0.007843, 127.5,
+                           confidence=OBJECT_CONFIDENCE, tiles=tiles)
+
+  for *coords, score, label in detected_objs:
+    obj_idx = int(label)
+
+    if isinstance(track_what, str) and CLASSES[obj_idx] != track_what:
+      continue
+
+    if isinstance(track_what, list) and CLASSES[obj_idx] not in track_what:
+      continue
+
+    box = tuple(np.array(coords).astype('int'))
+
+    if roi is not None:
+      box = next(iter(roi.restore([box], full_width, full_height)), None)
+
+      if box is None:
+        continue
+
+    objects.append((obj_idx, box, float(score)) if scores else (obj_idx, box))
+
+  return objects
+
+
+def object_store(source_hash: Optional[str],
+                 resize: bool = False,
+                 resize_width: int = 640,
+                 tiles: Optional[Tuple[int, int]] = None,
+                 roi: Optional[RegionOfInterest] = None,
+                 reader: str = 'opencv',
+                 proxy_width: Optional[int] = None
+                 ) -> Optional[DetectionStore]:
+  """Return store of the detected objects if the source hash is known."""
+  return detection_store(source_hash, 'mobilenet_ssd', roi, tiles=tiles,
+                         resize_width=resize_width if resize else None,
+                         scaler=reader if resize and reader == 'ffmpeg'
+                         else None,
+                         confidence=OBJECT_CONFIDENCE,
+                         proxy_width=proxy_width)
+
+
+def cached_objects(net: cv2.dnn_Net,
+                   frame: np.ndarray,
+                   track_what: Union[list, str] = None,
+                   tiles: Optional[Tuple[int, int]] = None,
+                   roi: Optional[RegionOfInterest] = None,
+                   store: Optional[DetectionStore] = None,
+                   index: int = 0) -> List[Tuple]:
+  """Return tracked objects of the frame, reusing the saved detections.
+
+  Objects of every class are saved so that the detections can be reused
+  while tracking different objects.
+  """
+  if store is None or track_what is None:
+    return detect_objects(net, frame, track_what, tiles, roi)
+
+  classes = object_classes(track_what)
+  detections = cached(store, [index], lambda _: [
+      [(obj_idx, score, box) for obj_idx, box, score in
+       detect_objects(net, frame, CLASSES[1:], tiles, roi, scores=True)]])[0]
+  return [(obj_idx, box) for obj_idx, _, box in detections
+          if CLASSES[obj_idx] in classes]
+
+
+def object_classes(track_what: Union[list, str] = None) -> List[str]:
+  """Return list of the classes to be counted."""
+  if track_what is None:
+    return []
+  return [track_what] if isinstance(track_what, str) else list(track_what)
+
+
+def object_counts(objects: List[Tuple],
+                  track_what: Union[list, str] = None) -> np.ndarray:
+  """Return number of detected objects per tracked class."""
+  classes = object_classes(track_what)
+  counts = np.zeros(len(classes), dtype=np.uint16)
+
+  for obj_idx, _ in objects:
+    counts[classes.index(CLASSES[obj_idx])] += 1
+  return counts
+
+
+def _counters(stream: cv2.VideoCapture,
+              track_what: Union[list, str] = None) -> Tuple[DetectionCounter,
+                                                            DetectionCounter]:
+  """Return preallocated motion & object counters for the stream."""
+  fps = stream.get(cv2.CAP_PROP_FPS) or 1
+  seconds = stream.get(cv2.CAP_PROP_FRAME_COUNT) / fps + 1
+  return (DetectionCounter(seconds, 'motion'),
+          DetectionCounter(seconds, object_classes(track_what) or 'objects'))
+
+
+def _save_reports(file: str,
+                  motion_count: DetectionCounter,
+                  temp_obj_count: DetectionCounter,
+                  log: logging.Logger) -> None:
+  """Save motion & object counters as report of the video."""
+  log.info('Logging detections into a CSV file.')
+  motion_count.save(report_file(file, 'motion'))
+
+  if temp_obj_count.seconds().size:
+    log.info('Logging objects into a CSV file.')
+    temp_obj_count.save(report_file(file, 'object'))
+
+
+def _reference(gray_frame: np.ndarray,
+               background: Optional[BackgroundModel] = None,
+               log: Optional[logging.Logger] = None) -> np.ndarray:
+  """Return reference frame for the motion analysis.
+
+  Saved background model of the camera is used if it is usable,
+  otherwise the first frame of the video is used.
+  """
+  if background is not None:
+    warm_frame = background.load(gray_frame.shape)
+
+    if warm_frame is not None:
+      if log:
+        log.info('Warm started motion analysis with saved background model.')
+      return warm_frame
+
+  return gray_frame
+
+
+def motion_contours(first_frame: np.ndarray,
+                    gray_frame: np.ndarray,
+                    precision: int = 1500,
+                    mask: Optional[np.ndarray] = None,
+                    pool: Optional[FramePool] = None) -> List:
+  """Return contours of the moving regions bigger than the precision.
+
+  If the pool is provided, the delta & mask are written into it's
+  scratch buffers instead of allocating them for every frame.
+  """
+  frame_delta, threshold = None, None
+
+  if pool is not None:
+    shape = gray_frame.shape[:2]
+    frame_delta = pool.scratch('delta', shape)
+    threshold = pool.scratch('mask', shape)
+
+  frame_delta = cv2.absdiff(first_frame, gray_frame, dst=frame_delta)
+  cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY, dst=frame_delta)
+  threshold = cv2.dilate(frame_delta, None, dst=threshold, iterations=2)
+
+  if mask is not None:
+    cv2.bitwise_and(threshold, mask, dst=threshold)
+  # Contours are found without modifying the mask, so it needs no copy.
+  contours = cv2.findContours(threshold, cv2.RETR_EXTERNAL,
+                              cv2.CHAIN_APPROX_SIMPLE)
+  contours = imutils.grab_contours(contours)
+  return [contour for contour in contours
+          if cv2.contourArea(contour) >= precision]
+
+
 def track_motion(file: str,
                  log: logging.Logger,
                  track_what: Union[list, str] = None,
@@ -114,15 +369,40 @@ def track_motion(file: str,
                  resize: bool = False,
                  resize_width: int = 640,
                  debug_motion: bool = False,
-                 debug_object: bool = False) -> str:
-  """Track motion in the video using Background Subtraction method."""
-  kcw = KeyClipWriter(bufSize=32)
-  consec_frames, x0, y0, x1, y1, count = 0, 0, 0, 0, 0, 0
-
-  temp_obj_count = {}
-  motion_count = {}
-
-  boxes, temp_csv_entries, obj_csv_entries = [], [], []
+                 debug_object: bool = False,
+                 tiles: Optional[Tuple[int, int]] = None,
+                 analysis_fps: Optional[float] = None,
+                 roi: Optional[RegionOfInterest] = None,
+                 background: Optional[BackgroundModel] = None,
+                 source_hash: Optional[str] = None,
+                 offset: float = 0.0,
+                 preset: str = 'medium',
+                 bitrate: Optional[int] = None,
+                 reader: str = 'opencv') -> str:
+  """Track motion in the video using Background Subtraction method.
+
+  Clips with motion are encoded once as H264 using the x264 preset &
+  bitrate and concatenated without re-encoding. If the `reader` is
+  `ffmpeg`, the frames are decoded & resized by ffmpeg instead of
+  OpenCV. Subsampled frames are always decoded by OpenCV as they are
+  reached by seeking, and can not be shown in the debug mode.
+  """
+  if analysis_fps:
+    if debug_motion or debug_object:
+      log.warning('Debug mode is not available while subsampling frames.')
+
+    return track_motion_in_chunks(file, log, track_what, precision, resize,
+                                  resize_width, processes=1, tiles=tiles,
+                                  analysis_fps=analysis_fps, roi=roi,
+                                  background=background,
+                                  source_hash=source_hash, offset=offset,
+                                  preset=preset, bitrate=bitrate,
+                                  reader=reader)
+
+  pool = FramePool()
+  kcw = KeyClipWriter(bufSize=32, preset=preset, bitrate=bitrate, pool=pool)
+  consec_frames, x0, y0, x1, y1, rx, ry = 0, 0, 0, 0, 0, 0, 0
+  mask = None
   directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}_motion')
   net = cv2.dnn.readNetFromCaffe(tf_prototxt, tf_caffemodel)
 
@@ -135,15 +415,22 @@ def track_motion(file: str,
   if debug_motion or debug_object:
     log.info('Debug mode - Enabled.')
   log.info(f'Analyzing motion for "{os.path.basename(file)}"...')
-  log.warning('Extracting CSV report is disabled for now...')
 
   try:
-    stream = cv2.VideoCapture(file)
+    stream = open_stream(file, reader, resize_width if resize else None)
     fps = stream.get(cv2.CAP_PROP_FPS)
+    motion_count, temp_obj_count = _counters(stream, track_what)
+    # Footage ends where the video ends, which dates the background.
+    duration = offset + stream.get(cv2.CAP_PROP_FRAME_COUNT) / (fps or 1)
+    base = frame_offset(offset, fps)
+    store = object_store(source_hash, resize, resize_width, tiles, roi,
+                         reader)
     first_frame = None
+    # Frames of the ffmpeg reader are already at the analysis width.
+    rescaled = resize and reader != 'ffmpeg'
 
     while True:
-      valid_frame, frame = stream.read()
+      valid_frame, frame = pool.read(stream)
 
       if not valid_frame:
         break
@@ -151,99 +438,61 @@ def track_motion(file: str,
       if frame is None:
         break
 
-      if resize:
-        frame = rescale(frame, resize_width)
-
+      frame, gray_frame = _prepare(frame, rescaled, resize_width, roi, pool)
       update_frame = True
-      gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-      gray_frame = cv2.GaussianBlur(gray_frame, (21, 21), 0)
-      height, width, _ = frame.shape
 
       if first_frame is None:
-        first_frame = gray_frame
-        continue
-
-      blob = cv2.dnn.blobFromImage(frame, 0.007843, (width, height), 127.5)
-      net.setInput(blob)
-      detected_objs = net.forward()
-      count = 1
+        # Grayscale frame is a scratch buffer overwritten by the next frame.
+        first_frame = _reference(gray_frame.copy(), background, log)
 
-      if track_what is not None:
-        for idx in range(0, detected_objs.shape[2]):
-          if detected_objs[0, 0, idx, 2] > 0.3:
-            coords = detected_objs[0, 0, idx, 3:7] * np.array([width, height,
-                                                               width, height])
-            x0, y0, x1, y1 = coords.astype('int')
-            obj_idx = int(detected_objs[0, 0, idx, 1])
-
-            if isinstance(track_what, str):
-              if CLASSES[obj_idx] == track_what:
-                if debug_object:
-                  draw_bounding_box(frame, (x0, y0), (x1, y1), green)
-
-                count += 1
-
-                obj_occurence = s2d(
-                    int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
-
-                if obj_occurence not in temp_obj_count.keys():
-                  temp_obj_count[obj_occurence] = []
+        if roi is not None:
+          mask = roi.cropped_mask(frame.shape[1], frame.shape[0])
+          rx, ry = roi.bbox(frame.shape[1], frame.shape[0])[:2]
 
-                temp_obj_count[obj_occurence].append(count)
-
-            elif isinstance(track_what, list):
-              if CLASSES[obj_idx] in track_what:
-                _idx = 0 if obj_idx > 8 else obj_idx
-
-                if obj_idx > 8:
-                  _idx -= 8
-                else:
-                  _idx = obj_idx
+        pool.release(frame)
+        continue
 
-                if debug_object:
-                  draw_bounding_box(frame, (x0, y0), (x1, y1), temp_list[_idx])
+      second = int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+      index = base + int(stream.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+      objects = cached_objects(net, frame, track_what, tiles, roi, store,
+                               index)
 
-                count += 1
+      debug_boxes, debug_colors, debug_labels = [], [], []
 
-                obj_occurence = s2d(
-                    int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
+      if debug_object:
+        for obj_idx, box in objects:
+          debug_boxes.append(box)
+          debug_colors.append(green if isinstance(track_what, str) else
+                              temp_list[obj_idx if obj_idx <= 8 else -8])
+          debug_labels.append(CLASSES[obj_idx])
 
-                if obj_occurence not in temp_obj_count.keys():
-                  temp_obj_count[obj_occurence] = []
+      if track_what is not None:
+        temp_obj_count.update(second, object_counts(objects, track_what))
 
-                temp_obj_count[obj_occurence].append(count)
+      contours = motion_contours(first_frame, gray_frame, precision, mask,
+                                 pool)
+      motion_count.update(second, len(contours))
 
-      frame_delta = cv2.absdiff(first_frame, gray_frame)
-      threshold = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-      threshold = cv2.dilate(threshold, None, iterations=2)
-      contours = cv2.findContours(threshold.copy(), cv2.RETR_EXTERNAL,
-                                  cv2.CHAIN_APPROX_SIMPLE)
-      contours = imutils.grab_contours(contours)
+      if background is not None:
+        background.update(gray_frame)
 
       for contour in contours:
-        if cv2.contourArea(contour) < precision:
-          continue
-
         if debug_motion:
           (x0, y0, x1, y1) = cv2.boundingRect(contour)
-          draw_bounding_box(frame, (x0, y0), (x0 + x1, y0 + y1))
+          x0, y0 = x0 + rx, y0 + ry
+          debug_boxes.append((x0, y0, x0 + x1, y0 + y1))
+          debug_colors.append(green)
+          debug_labels.append(None)
 
         consec_frames = 0
 
         if not kcw.recording:
-          kcw.start(filename(temp_file, file_idx),
-                    cv2.VideoWriter_fourcc(*'mp4v'), fps)
+          kcw.start(filename(temp_file, file_idx), fps)
           file_idx += 1
 
-        boxes.append([x1, y1])
-        motion_occurence = s2d(int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
-
-        if motion_occurence not in motion_count.keys():
-          motion_count[motion_occurence] = []
-
-        motion_count[motion_occurence].append(len(boxes))
-
-      boxes = []
+      if debug_boxes:
+        # All the boxes of the frame are blended onto it at once.
+        draw_bounding_boxes(frame, debug_boxes, debug_colors, debug_labels)
 
       if update_frame:
         consec_frames += 1
@@ -257,41 +506,33 @@ def track_motion(file: str,
       if debug_motion or debug_object:
         cv2.imshow('Video Processing Engine - Motion Detection', frame)
 
+      # Key clip writer holds on to the frame until it is written.
+      pool.release(frame)
+
       if cv2.waitKey(1) & 0xFF == int(27):
         disconnect(stream)
 
     if kcw.recording:
       kcw.finish()
 
+    if store is not None:
+      log.info(f'Reused saved objects of {store.hits} frame(s).')
+      store.save()
+
+    _save_reports(file, motion_count, temp_obj_count, log)
+
+    if background is not None and background.save(duration):
+      log.info('Saved background model for the next run.')
+
     if len(os.listdir(directory)) < 1:
       return file
 
     concate_temp = concate_videos(directory, delete_old_files=False)
-    # with open(os.path.join(directory, f'{Path(file).stem}_motion.csv'), 'a',
-    #           encoding="utf-8") as csv_file:
-    #   log.info('Logging detections into a CSV file.')
-    #   _file = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
-    #   _file.writerow(['Max no. of detections per second', 'Time frame'])
-    #   temp_csv_entries = [(max(v), k) for k, v in motion_count.items()]
-    #   _file.writerows(temp_csv_entries)
-
-    # if track_what:
-    #   with open(os.path.join(directory, f'{Path(file).stem}_object.csv'), 'a',
-    #             encoding="utf-8") as obj_csv_file:
-    #     log.info('Logging objects into a CSV file.')
-    #     _file = csv.writer(obj_csv_file, quoting=csv.QUOTE_MINIMAL)
-    #     _file.writerow(['Max no. of detections per second', 'Time frame'])
-    #     obj_csv_entries = [(max(ov), ok) for ok, ov in temp_obj_count.items()]
-    #     _file.writerows(obj_csv_entries)
-
-    if concate_temp:
-      if os.path.isfile(concate_temp):
-        log.info('Applying H264 encoding for bypassing browser issues...')
-        os.system(f'ffmpeg -loglevel error -y -i {concate_temp} -vcodec '
-                  f'libx264 {temp_file}')
-        log.info('Cleaning up archived files...')
-
-    shutil.move(temp_file, file)
+
+    if concate_temp and os.path.isfile(concate_temp):
+      shutil.move(concate_temp, file)
+
+    log.info('Cleaning up archived files...')
 
     if len(os.listdir(directory)) > 0:
       shutil.rmtree(directory)
@@ -302,3 +543,393 @@ def track_motion(file: str,
   except Exception as error:
     log.critical(f'Something went wrong because of {error}')
     raise error
+
+
+def _analyze_chunk(file: str,
+                   start: int,
+                   end: int,
+                   track_what: Union[list, str] = None,
+                   precision: int = 1500,
+                   resize: bool = False,
+                   resize_width: int = 640,
+                   tiles: Optional[Tuple[int, int]] = None,
+                   step: int = 1,
+                   roi: Optional[RegionOfInterest] = None,
+                   background: Optional[BackgroundModel] = None,
+                   source_hash: Optional[str] = None,
+                   offset: float = 0.0,
+                   overlap: int = 0
+                   ) -> Tuple[List[int], DetectionCounter, DetectionCounter,
+                              Optional[BackgroundModel]]:
+  """Analyze a chunk of frames for motion and objects.
+
+  Analyzes the frames between start & end index of the video. The first
+  frame of the video is used as reference for every chunk, just like the
+  sequential run of `track_motion()`, so that the decisions made for the
+  frames remain identical.
+
+  Frames in between the subsampled frames are not analyzed and are
+  skipped with `grab()` so they are never retrieved or converted. If
+  the background model is learned, `overlap` frames ahead of the chunk
+  warm it up to the scene at the start of the chunk but are not
+  reported.
+
+  Args:
+    file: Path of the video file.
+    start: Index of the first frame of the chunk.
+    end: Index of the frame where the chunk ends (excluded).
+    track_what: Object(s) (default: None) to be counted in the frames.
+    precision: Minimum area (default: 1500) of the moving region.
+    resize: Boolean (default: False) value to resize the frames.
+    resize_width: Width (default: 640) to be resized to.
+    tiles: Number (default: None) of columns & rows of tiles for
+           detecting objects at the native input size.
+    step: Analyze (default: 1) every nth frame of the video.
+    roi: Region of interest (default: None) of the camera.
+    background: Background model (default: None) of the camera used as
+                reference if it is usable.
+    source_hash: Content hash (default: None) of the source video for
+                 reusing the saved object detections.
+    offset: Secs (default: 0.0) into the source video where the video
+            starts.
+    overlap: Number of frames (default: 0) ahead of the chunk which only
+             update the background model.
+
+  Returns:
+    Tuple of indices of frames with motion, motion & object counts and
+    the background model learned from the chunk.
+  """
+  motion_frames, net = [], None
+
+  if track_what is not None:
+    net = cv2.dnn.readNetFromCaffe(tf_prototxt, tf_caffemodel)
+
+  stream = cv2.VideoCapture(file)
+  fps = stream.get(cv2.CAP_PROP_FPS)
+  motion_count, temp_obj_count = _counters(stream, track_what)
+  store = object_store(source_hash, resize, resize_width, tiles, roi)
+  base = frame_offset(offset, fps)
+
+  pool = FramePool()
+
+  try:
+    valid_frame, frame = pool.read(stream)
+
+    if not valid_frame or frame is None:
+      return motion_frames, motion_count, temp_obj_count, background
+
+    frame, first_frame = _prepare(frame, resize, resize_width, roi, pool)
+    # Grayscale frame is a scratch buffer overwritten by the next frame.
+    first_frame = _reference(first_frame.copy(), background)
+    mask = None
+
+    if roi is not None:
+      mask = roi.cropped_mask(frame.shape[1], frame.shape[0])
+
+    pool.release(frame)
+    idx = max(start - (overlap if background is not None else 0), 1)
+    stream.set(cv2.CAP_PROP_POS_FRAMES, idx)
+
+    while idx < end:
+      if (idx - 1) % step:
+        if not stream.grab():
+          break
+
+        idx += 1
+        continue
+
+      valid_frame, frame = pool.read(stream)
+
+      if not valid_frame or frame is None:
+        break
+
+      frame, gray_frame = _prepare(frame, resize, resize_width, roi, pool)
+
+      if idx < start:
+        background.update(gray_frame)
+        pool.release(frame)
+        idx += 1
+        continue
+
+      second = int(idx / fps)
+      objects = cached_objects(net, frame, track_what, tiles, roi, store,
+                               base + idx)
+
+      if track_what is not None:
+        temp_obj_count.update(second, object_counts(objects, track_what))
+
+      contours = motion_contours(first_frame, gray_frame, precision, mask,
+                                 pool)
+      motion_count.update(second, len(contours))
+
+      if background is not None:
+        background.update(gray_frame)
+
+      if contours:
+        motion_frames.append(idx)
+
+      pool.release(frame)
+      idx += 1
+  finally:
+    stream.release()
+
+    if store is not None:
+      store.save()
+
+  return motion_frames, motion_count, temp_obj_count, background
+
+
+def motion_frames(file: str,
+                  precision: int = 1500,
+                  resize: bool = False,
+                  resize_width: int = 640,
+                  analysis_fps: Optional[float] = None) -> List[int]:
+  """Return indices of the frames with motion without editing the video."""
+  stream = cv2.VideoCapture(file)
+  fps = stream.get(cv2.CAP_PROP_FPS)
+  total_frames = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+  stream.release()
+  step = max(int(round(fps / analysis_fps)), 1) if analysis_fps else 1
+  return _analyze_chunk(file, 1, total_frames, precision=precision,
+                        resize=resize, resize_width=resize_width,
+                        step=step)[0]
+
+
+def _motion_segments(motion_frames: List[int],
+                     padding: int,
+                     total_frames: int) -> List[Tuple[int, int]]:
+  """Merge frames with motion into padded segments.
+
+  Every frame with motion is padded with the frames which the
+  `KeyClipWriter` would have buffered before & after it. Overlapping
+  segments are merged together.
+
+  Args:
+    motion_frames: Sorted indices of the frames with motion.
+    padding: Number of frames to be padded on either side.
+    total_frames: Total number of frames in the video.
+
+  Returns:
+    List of first & last (included) frame index of every segment.
+  """
+  segments = []
+
+  for idx in motion_frames:
+    start, end = max(idx - padding, 1), min(idx + padding - 1,
+                                            total_frames - 1)
+
+    if segments and start <= segments[-1][1] + 1:
+      segments[-1] = (segments[-1][0], max(end, segments[-1][1]))
+    else:
+      segments.append((start, end))
+
+  return segments
+
+
+def _extract_segments(file: str,
+                      segments: List[Tuple[int, int]],
+                      fps: float,
+                      directory: str,
+                      resize: bool = False,
+                      resize_width: int = 640,
+                      preset: str = 'medium',
+                      bitrate: Optional[int] = None) -> List[str]:
+  """Cut the segments out of the video with H264 encoding."""
+  clips = []
+  options = ['-vf', f'scale={resize_width}:-2'] if resize else []
+  options += ['-vcodec', 'libx264', '-preset', preset]
+
+  if bitrate:
+    options += ['-b:v', str(bitrate)]
+
+  for idx, (start, end) in enumerate(segments, start=1):
+    clip = os.path.join(directory, f'{Path(file).stem}_{idx:05d}.mp4')
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y',
+                    '-ss', f'{start / fps:.3f}', '-i', file,
+                    '-frames:v', str(end - start + 1), '-an',
+                    *options, clip], check=True)
+    clips.append(clip)
+
+  return clips
+
+
+def keep_motion_segments(file: str,
+                         motion_frames: List[int],
+                         fps: float,
+                         total_frames: int,
+                         log: logging.Logger,
+                         padding: int = 32,
+                         resize: bool = False,
+                         resize_width: int = 640,
+                         preset: str = 'medium',
+                         bitrate: Optional[int] = None) -> str:
+  """Replace the video with only it's segments with detected motion.
+
+  Args:
+    file: Path of the video file.
+    motion_frames: Sorted indices of the frames with motion.
+    fps: FPS of the video.
+    total_frames: Total number of frames in the video.
+    log: Logger object for logging the status.
+    padding: Number of frames (default: 32) kept around every frame
+             with motion.
+    resize: Boolean (default: False) value to resize the segments.
+    resize_width: Width (default: 640) to be resized to.
+    preset: x264 preset (default: medium) of the segments.
+    bitrate: Bitrate (default: None -> x264 default) of the segments.
+
+  Returns:
+    Path of the video with only the motion segments.
+  """
+  directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}_motion')
+  segments = _motion_segments(motion_frames, padding, total_frames)
+
+  if not segments:
+    return file
+
+  if not os.path.isdir(directory):
+    os.mkdir(directory)
+
+  log.info(f'Extracting {len(segments)} portion(s) of video with detected '
+           'motion...')
+
+  try:
+    _extract_segments(file, segments, fps, directory, resize, resize_width,
+                      preset, bitrate)
+    concate_temp = concate_videos(directory, delete_old_files=False)
+
+    if concate_temp and os.path.isfile(concate_temp):
+      shutil.move(concate_temp, file)
+  finally:
+    log.info('Cleaning up archived files...')
+    shutil.rmtree(directory, ignore_errors=True)
+  return file
+
+
+def track_motion_in_chunks(file: str,
+                           log: logging.Logger,
+                           track_what: Union[list, str] = None,
+                           precision: int = 1500,
+                           resize: bool = False,
+                           resize_width: int = 640,
+                           chunk_length: int = 300,
+                           overlap: Union[float, int] = 2,
+                           processes: Optional[int] = None,
+                           tiles: Optional[Tuple[int, int]] = None,
+                           analysis_fps: Optional[float] = None,
+                           roi: Optional[RegionOfInterest] = None,
+                           background: Optional[BackgroundModel] = None,
+                           source_hash: Optional[str] = None,
+                           offset: float = 0.0,
+                           preset: str = 'medium',
+                           bitrate: Optional[int] = None,
+                           reader: str = 'opencv') -> str:
+  """Track motion in the video by analyzing time chunks in parallel.
+
+  Splits the video into chunks of `chunk_length` secs and analyzes each
+  of them in a separate process. The motion segments & counts from all
+  the chunks are merged so that the result matches the sequential run
+  of `track_motion()`.
+
+  If `analysis_fps` is provided, only those many frames per sec are
+  analyzed. The motion decision of every analyzed frame is carried over
+  to the frames skipped around it, while the extracted segments still
+  include every frame of the video.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    track_what: Object(s) (default: None) to be counted in the video.
+    precision: Minimum area (default: 1500) of the moving region.
+    resize: Boolean (default: False) value to resize the frames.
+    resize_width: Width (default: 640) to be resized to.
+    chunk_length: Length (default: 300) of each chunk in secs.
+    overlap: Secs (default: 2) ahead of every chunk which warm up it's
+             background model.
+    processes: Number of processes (default: None -> no. of CPUs) to be
+               used for the analysis.
+    tiles: Number (default: None) of columns & rows of tiles for
+           detecting objects at the native input size.
+    analysis_fps: Number of frames (default: None -> all) to be analyzed
+                  per sec.
+    roi: Region of interest (default: None) of the camera.
+    background: Background model (default: None) of the camera which is
+                used as reference & updated at the end of the run.
+    source_hash: Content hash (default: None) of the source video for
+                 reusing the saved object detections.
+    offset: Secs (default: 0.0) into the source video where the video
+            starts.
+    preset: x264 preset (default: medium) of the motion segments.
+    bitrate: Bitrate (default: None -> x264 default) of the motion
+             segments.
+    reader: Frame source (default: opencv) of the video if it's analyzed
+            sequentially, the chunks are always read by OpenCV as they
+            are reached by seeking.
+
+  Returns:
+    Path of the video with only the motion segments.
+  """
+  motion_frames = []
+  stream = cv2.VideoCapture(file)
+  fps = stream.get(cv2.CAP_PROP_FPS)
+  total_frames = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+  motion_count, temp_obj_count = _counters(stream, track_what)
+  stream.release()
+
+  if fps <= 0 or total_frames <= 0:
+    log.warning('Unable to read frame count, analyzing motion sequentially.')
+    return track_motion(file, log, track_what, precision, resize,
+                        resize_width, tiles=tiles, roi=roi,
+                        background=background, source_hash=source_hash,
+                        offset=offset, preset=preset, bitrate=bitrate,
+                        reader=reader)
+
+  step = max(int(round(fps / analysis_fps)), 1) if analysis_fps else 1
+  chunk_frames = max(int(chunk_length * fps), 1)
+  chunks = [(start, min(start + chunk_frames, total_frames))
+            for start in range(1, total_frames, chunk_frames)]
+
+  log.info(f'Analyzing motion for "{os.path.basename(file)}" in '
+           f'{len(chunks)} chunk(s)...')
+
+  try:
+    start_time = time.time()
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+      futures = [executor.submit(_analyze_chunk, file, start, end,
+                                 track_what, precision, resize,
+                                 resize_width, tiles, step, roi, background,
+                                 source_hash, offset, int(overlap * fps))
+                 for start, end in chunks]
+
+      for future in futures:
+        frames, motions, objects, learned = future.result()
+        motion_frames.extend(frames)
+        motion_count.merge(motions)
+        temp_obj_count.merge(objects)
+
+        # Model learned from the last chunk, warmed up by the overlap
+        # ahead of it, is the most recent state of the background.
+        if learned is not None and learned.model is not None:
+          background = learned
+
+    elapsed = max(time.time() - start_time, 1e-3)
+    log.info(f'Analyzed {int(motion_count.frames.sum())}/{total_frames} '
+             f'frame(s) in {elapsed:.1f} secs, {total_frames / elapsed:.1f} '
+             'fps per stream.')
+    log.info(f'Detected motion in {motion_count.seconds().size} sec(s) of '
+             'the video.')
+    _save_reports(file, motion_count, temp_obj_count, log)
+
+    if (background is not None and
+            background.save(offset + total_frames / fps)):
+      log.info('Saved background model for the next run.')
+
+    # Padding every analyzed frame by the skipped frames around it carries
+    # over it's motion decision to the full frame timeline.
+    return keep_motion_segments(file, motion_frames, fps, total_frames, log,
+                                32 + step - 1, resize, resize_width, preset,
+                                bitrate)
+  except Exception as error:
+    log.critical(f'Something went wrong because of {error}')
+    raise error
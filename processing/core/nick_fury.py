@@ -1,11 +1,13 @@
 import json
 from typing import List
 
-from processing.core.bugsbunny import spin
+from processing.core.bugsbunny import source_size, spin
+from processing.core.scheduler import OrderScheduler
 from processing.utils.common import now
 from processing.utils.logs import log
 # pyright: reportMissingImports=false
 from app import models
+from django.db import connections
 
 deployed = False
 
@@ -33,8 +35,18 @@ def sheep(json_obj: dict, db_pk: int) -> None:
     _log.exception(_error)
 
 
-def hill(orders: List):
-  """Some threading related stuff."""
+def graze(json_obj: dict) -> None:
+  """Run sheep for the order in a worker process."""
+  sheep(json_obj, int(json_obj['db_pk']))
+
+
+def hill(orders: List) -> None:
+  """Run the orders concurrently within the CPU & memory budgets."""
+  scheduler = OrderScheduler(graze, _log)
+
   for idx in orders:
-    db_pk = int(idx['db_pk'])
-    sheep(idx, db_pk)
+    scheduler.submit(idx, source_size(idx, _log))
+
+  # Forked workers must open their own database connections.
+  connections.close_all()
+  scheduler.run()
@@ -0,0 +1,173 @@
+"""A subservice for moving every clip through the stages on it's own."""
+
+import logging
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Number of clips processed at once by the stages of an order, unless the
+# order asks for others.
+STAGE_WORKERS = {'compress': 2, 'analysis': 1, 'upload': 4}
+
+
+class StageFailure(Exception):
+  """Failure of a stage which still has an output for the clip.
+
+  Stages with a fallback pass the output of such clips on, instead of
+  their input, while still counting them as failed.
+  """
+
+  def __init__(self, message: str, output: Any) -> None:
+    # Both are kept as the arguments, so that the error can be pickled
+    # back from the worker processes.
+    super().__init__(message, output)
+    self.output = output
+
+  def __str__(self) -> str:
+    return str(self.args[0])
+
+
+class Stage:
+  """Step of the pipeline which every clip goes through.
+
+  Args:
+    name: Name of the stage used in the logs.
+    function: Callable which takes the output of the previous stage for
+              the clip and returns the output of this stage. It must be
+              picklable, i.e. defined at the module level (optionally
+              wrapped in `functools.partial`), if the stage runs on
+              processes.
+    workers: Number of clips (default: 1) processed at once.
+    processes: Boolean (default: True) value to run the stage on
+               processes, for CPU bound work, instead of threads.
+    fallback: Boolean (default: False) value to pass the input of a clip
+              which fails the stage (or the output of the raised
+              `StageFailure`) on as it's output instead of failing the
+              pipeline. Indices of such clips are kept in `failed`.
+    on_complete: Callable (default: None) called once every clip has
+                 passed the stage, like writing the milestone.
+    on_result: Callable (default: None) called with the index & output
+               of every clip once it passes the stage without failing.
+    done: Outputs (default: None) of the clips, by their index, which
+          already passed the stage in an earlier run and are not run
+          again.
+  """
+
+  def __init__(self,
+               name: str,
+               function: Callable[[Any], Any],
+               workers: int = 1,
+               processes: bool = True,
+               fallback: bool = False,
+               on_complete: Optional[Callable[[], Any]] = None,
+               on_result: Optional[Callable[[int, Any], Any]] = None,
+               done: Optional[Dict[int, Any]] = None) -> None:
+    self.name = name
+    self.function = function
+    self.workers = max(int(workers), 1)
+    self.processes = processes
+    self.fallback = fallback
+    self.on_complete = on_complete
+    self.on_result = on_result
+    self.done = done or {}
+    self.failed: List[int] = []
+
+  def executor(self) -> Any:
+    """Return pool of workers of the stage."""
+    if self.processes:
+      return ProcessPoolExecutor(max_workers=self.workers)
+    return ThreadPoolExecutor(max_workers=self.workers)
+
+
+def run_pipeline(clips: List[Any],
+                 stages: List[Stage],
+                 log: logging.Logger) -> List[List[Any]]:
+  """Move every clip through the stages on it's own.
+
+  A clip enters the next stage as soon as it leaves the previous one, so
+  the stages overlap, e.g. the first clip is uploaded while the later
+  ones are still compressed. Every stage has it's own pool of workers,
+  which bounds the number of clips it processes at once. Since a clip
+  passes the stages in order, every stage completes after the ones
+  before it and their `on_complete` callbacks run in order, in the
+  calling process.
+
+  Args:
+    clips: Inputs of the first stage, usually the paths of the clips.
+    stages: Stages every clip goes through in the order.
+    log: Logger object for logging the status.
+
+  Returns:
+    Outputs of every stage for every clip, in the order of the clips.
+  """
+  outputs = [[None] * len(clips) for _ in stages]
+  remaining = [len(clips)] * len(stages)
+  executors = [stage.executor() for stage in stages]
+  pending: Dict[Future, Tuple[int, int, Any]] = {}
+
+  def finish(stage_idx: int, clip_idx: int, result: Any) -> None:
+    stage = stages[stage_idx]
+    outputs[stage_idx][clip_idx] = result
+    remaining[stage_idx] -= 1
+
+    if remaining[stage_idx] == 0 and stage.on_complete is not None:
+      stage.on_complete()
+
+    submit(stage_idx + 1, clip_idx, result)
+
+  def submit(stage_idx: int, clip_idx: int, value: Any) -> None:
+    if stage_idx == len(stages):
+      return
+
+    if clip_idx in stages[stage_idx].done:
+      finish(stage_idx, clip_idx, stages[stage_idx].done[clip_idx])
+      return
+
+    future = executors[stage_idx].submit(stages[stage_idx].function, value)
+    pending[future] = (stage_idx, clip_idx, value)
+
+  try:
+    if not clips:
+      for stage in stages:
+        if stage.on_complete is not None:
+          stage.on_complete()
+
+    for clip_idx, clip in enumerate(clips):
+      submit(0, clip_idx, clip)
+
+    while pending:
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+      for future in done:
+        stage_idx, clip_idx, value = pending.pop(future)
+        stage = stages[stage_idx]
+
+        try:
+          result = future.result()
+        except Exception as error:
+          if not stage.fallback:
+            raise error
+
+          log.warning(f'{stage.name.capitalize()} failed for clip '
+                      f'{clip_idx + 1}/{len(clips)} because of {error}, '
+                      'passing it on as it is.')
+          result = (error.output if isinstance(error, StageFailure)
+                    else value)
+          stage.failed.append(clip_idx)
+
+        log.info(f'{stage.name.capitalize()} finished for clip '
+                 f'{clip_idx + 1}/{len(clips)}.')
+
+        # Failed clips are not recorded, so that they are retried.
+        if stage.on_result is not None and clip_idx not in stage.failed:
+          stage.on_result(clip_idx, result)
+
+        finish(stage_idx, clip_idx, result)
+  finally:
+    for future in pending:
+      future.cancel()
+
+    for executor in executors:
+      executor.shutdown(wait=True)
+
+  return outputs
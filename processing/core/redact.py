@@ -1,50 +1,281 @@
 """A subservice for redaction."""
 
-import csv
 import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
 from mtcnn import MTCNN
 
-from processing.utils.common import seconds_to_datetime as s2d
-from processing.utils.local import filename
-from processing.utils.opencvapi import draw_bounding_box, red, rescale
-from processing.utils.paths import frontal_haar, lp_caffemodel, lp_prototxt
-
-face_detector = MTCNN(min_face_size=20)
+from processing.utils.buffers import FramePool
+from processing.utils.counters import DetectionCounter, report_file
+from processing.utils.effects import redact_regions
+from processing.utils.gating import MotionGate
+from processing.utils.inference import detect, detect_frames
+from processing.utils.opencvapi import draw_bounding_boxes, red, rescale
+from processing.utils.paths import (caffemodel, frontal_haar, lp_caffemodel,
+                                    lp_prototxt, prototxt)
+from processing.utils.pipes import FFmpegWriter, open_stream
+from processing.utils.roi import RegionOfInterest
+from processing.utils.sidecar import (Detection, as_boxes, as_detections,
+                                      cached, detection_store, frame_offset)
+from processing.utils.tracking import DetectionTracker
+
+face_detectors = {}
 pixel_means = [0.406, 0.456, 0.485]
 pixel_stds = [0.225, 0.224, 0.229]
 pixel_scale = 255.0
+# Per channel (RGB) scale & offset equivalent to the above normalization.
+plate_scale = (1.0 / (pixel_scale * np.array(pixel_stds[::-1]))).astype(
+    np.float32).reshape(1, 3, 1, 1)
+plate_offset = (-np.array(pixel_means[::-1]) / np.array(
+    pixel_stds[::-1])).astype(np.float32).reshape(1, 3, 1, 1)
+# Flat float32 buffer holding the tensors of every input shape, grown to
+# the largest one so that differently sized crops do not pile up buffers.
+plate_buffer = np.empty(0, dtype=np.float32)
+
+# Native input size of the MobileNet SSD used for detecting the plates.
+MSSD512_SIZE = 512
+# Native input size & mean of the ResNet-10 SSD used for detecting faces.
+RES10_SSD_SIZE = 300
+RES10_SSD_MEAN = (104.0, 177.0, 123.0)
+
+# Minimum face size of MTCNN at the full resolution and the size of it's
+# P-Net window, below which MTCNN upscales the image instead.
+MTCNN_MIN_FACE_SIZE = 20
+MTCNN_MIN_WINDOW = 12
+
+# Minimum confidence of the detections.
+MTCNN_CONFIDENCE = 0.75
+RES10_SSD_CONFIDENCE = 0.5
+PLATE_CONFIDENCE = 0.6
 
 convnet = cv2.dnn.readNetFromCaffe(lp_prototxt, lp_caffemodel)
+face_net = None
+
+
+def _plate_tensor(images: List[np.ndarray]) -> np.ndarray:
+  """Return normalized tensor of the images for license plate detection.
+
+  The images are normalized in a single vectorized step into the front
+  of a float32 buffer which is reused for every batch. The buffer only
+  grows when a batch is bigger than any before it.
+  """
+  global plate_buffer
+  height, width = images[0].shape[:2]
+  shape = (len(images), 3, height, width)
+  size = len(images) * 3 * height * width
+
+  if plate_buffer.size < size:
+    plate_buffer = np.empty(size, dtype=np.float32)
+
+  tensor = plate_buffer[:size].reshape(shape)
+
+  for idx, image in enumerate(images):
+    # Frames are in BGR order while the network expects RGB planes.
+    np.multiply(image.transpose(2, 0, 1)[::-1], plate_scale[0],
+                out=tensor[idx])
+
+  tensor += plate_offset
+  return tensor
+
+
+def _mtcnn(min_face_size: int = MTCNN_MIN_FACE_SIZE) -> MTCNN:
+  """Return MTCNN detector for the minimum face size."""
+  if min_face_size not in face_detectors:
+    face_detectors[min_face_size] = MTCNN(min_face_size=min_face_size)
+  return face_detectors[min_face_size]
+
+
+def detect_faces_ssd(frames: List[np.ndarray],
+                     roi: Optional[RegionOfInterest] = None,
+                     confidence: float = RES10_SSD_CONFIDENCE,
+                     scores: bool = False) -> List[List[Tuple]]:
+  """Return boxes of the faces detected in every frame using SSD.
+
+  All the frames are resized to the fixed 300 x 300 input of the
+  ResNet-10 SSD and run as a single batch. If the region of interest is
+  provided, only the frames cropped to it's bounding box are analyzed.
+  If scores are requested, confidence is added after the coordinates.
+  """
+  global face_net
 
+  if face_net is None:
+    face_net = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
 
-def pixelate(roi) -> np.ndarray:
-  """Pixelate ROIs like in ..."""
-  # You can find the reference code here:
-  # https://www.pyimagesearch.com/2020/04/06/blur-and-anonymize-faces-with-opencv-and-python/
-  height, width, _ = roi.shape
-  x_steps = np.linspace(0, width, 8, dtype='int')
-  y_steps = np.linspace(0, height, 8, dtype='int')
+  images = [frame if roi is None else roi.crop(frame)[0] for frame in frames]
+  detections = detect_frames(face_net, images, RES10_SSD_SIZE, 1.0,
+                             RES10_SSD_MEAN, confidence=confidence)
+  faces = []
 
-  # Looping over blocks in both X & Y direction.
-  for y_idx in range(1, len(y_steps)):
-    for x_idx in range(1, len(x_steps)):
-      x0 = x_steps[x_idx - 1]
-      y0 = y_steps[y_idx - 1]
-      x1 = x_steps[x_idx]
-      y1 = y_steps[y_idx]
-      _roi = roi[y0:y1, x0:x1]
-      B, G, R = [int(idx) for idx in cv2.mean(_roi)[:3]]
-      cv2.rectangle(roi, (x0, y0), (x1, y1), (B, G, R), -1)
+  for frame, detected_faces in zip(frames, detections):
+    boxes = [(*map(int, box[:4]), float(box[4])) for box in detected_faces]
 
-  # Pixelated blurred roi
-  return roi
+    if roi is not None:
+      boxes = roi.restore(boxes, frame.shape[1], frame.shape[0])
+
+    faces.append(boxes if scores else [box[:4] for box in boxes])
+
+  return faces
+
+
+def detect_faces(frame: np.ndarray,
+                 use_ml_model: bool = True,
+                 roi: Optional[RegionOfInterest] = None,
+                 view: Optional[np.ndarray] = None,
+                 engine: str = 'mtcnn',
+                 scores: bool = False,
+                 scale: float = 1.0) -> List[Tuple]:
+  """Return boxes of the faces detected in the frame.
+
+  Uses MTCNN (or SSD if the engine is `ssd`) or Haar cascade for
+  detecting the faces. If the region of interest is provided, only the
+  frame cropped to it's bounding box is analyzed. Already converted RGB
+  (MTCNN) or grayscale (Haar cascade) view of the frame can be passed to
+  avoid converting it again. If scores are requested, confidence (1 for
+  Haar cascade) is added after the coordinates.
+
+  If the scale is less than 1, the faces are detected on a downscaled
+  copy of the frame and the boxes are mapped back to the frame. MTCNN's
+  minimum face size is scaled along, down to it's 12 px window, so the
+  smallest face found at the full resolution grows to 12 px / scale.
+  """
+  if use_ml_model and engine == 'ssd':
+    return detect_faces_ssd([frame], roi, scores=scores)[0]
+
+  boxes = []
+
+  if view is None:
+    image = frame if roi is None else roi.crop(frame)[0]
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB if use_ml_model
+                         else cv2.COLOR_BGR2GRAY)
+  else:
+    image = view if roi is None else roi.crop(view)[0]
+
+  height, width = image.shape[:2]
+  min_face_size = MTCNN_MIN_FACE_SIZE
+
+  if 0 < scale < 1:
+    image = cv2.resize(image, (max(int(width * scale), 1),
+                               max(int(height * scale), 1)),
+                       interpolation=cv2.INTER_AREA)
+    min_face_size = max(int(round(min_face_size * scale)), MTCNN_MIN_WINDOW)
+
+  if use_ml_model:
+    for face_idx in _mtcnn(min_face_size).detect_faces(image):
+      # Considering detections which have confidence score higher than the
+      # set threshold.
+      if face_idx['confidence'] > MTCNN_CONFIDENCE:
+        x0, y0, x1, y1 = face_idx['box']
+        x0, y0 = abs(x0), abs(y0)
+        boxes.append((x0, y0, x0 + x1, y0 + y1, face_idx['confidence']))
+  else:
+    face_cascade = cv2.CascadeClassifier(frontal_haar)
+
+    for (x0, y0, x1, y1) in face_cascade.detectMultiScale(image, 1.3, 5):
+      boxes.append((x0, y0, x0 + x1, y0 + y1, 1.0))
+
+  if image.shape[:2] != (height, width):
+    sx, sy = width / image.shape[1], height / image.shape[0]
+    boxes = [(int(x0 * sx), int(y0 * sy), int(np.ceil(x1 * sx)),
+              int(np.ceil(y1 * sy)), score)
+             for x0, y0, x1, y1, score in boxes]
+
+  if roi is not None:
+    boxes = roi.restore(boxes, frame.shape[1], frame.shape[0])
+
+  return boxes if scores else [box[:4] for box in boxes]
+
+
+def detect_license_plates(frame: np.ndarray,
+                          tiles: Optional[Tuple[int, int]] = None,
+                          roi: Optional[RegionOfInterest] = None,
+                          scores: bool = False,
+                          confidence: float = PLATE_CONFIDENCE
+                          ) -> List[Tuple]:
+  """Return boxes of the license plates detected in the frame.
+
+  If tiles are not provided, the network runs on the full size frame.
+  Otherwise the frame (or it's tiles) is resized to the native input
+  size of the network. The boxes are expanded by 10% of their width. If
+  the region of interest is provided, only the frame cropped to it's
+  bounding box is analyzed. If scores are requested, confidence is added
+  after the coordinates.
+  """
+  full_frame = frame
+
+  if roi is not None:
+    frame = roi.crop(frame)[0]
+
+  height, width = frame.shape[:2]
+
+  if tiles is None:
+    convnet.setInput(_plate_tensor([frame]))
+    detected_license_plate = convnet.forward()
+    detected_license_plate = detected_license_plate[
+        0, 0, detected_license_plate[0, 0, :, 2] > confidence][
+            :, [3, 4, 5, 6, 2]]
+    detected_license_plate[:, :4] *= np.array([width, height, width, height])
+  else:
+    detected_license_plate = detect(
+        convnet, frame, MSSD512_SIZE,
+        blob=_plate_tensor,
+        confidence=confidence, tiles=tiles)[:, :5]
+
+  boxes = []
+
+  for x0, y0, x1, y1, score in detected_license_plate:
+    x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+    adj = int(x1 - x0) * 0.1
+    boxes.append((*map(int, (x0 - adj, y0 - adj, x1 + adj, y1 + adj)),
+                  float(score)))
+
+  if roi is not None:
+    boxes = roi.restore(boxes, full_frame.shape[1], full_frame.shape[0])
+
+  return boxes if scores else [box[:4] for box in boxes]
+
+
+def crop_tiles(image: np.ndarray,
+                tiles: Optional[Tuple[int, int]] = None
+                ) -> Optional[Tuple[int, int]]:
+  """Return tiles for the crop, small crops run at their own size."""
+  if tiles is None or max(image.shape[:2]) <= MSSD512_SIZE:
+    return None
+  return tiles
+
+
+def _read_frames(stream: cv2.VideoCapture,
+                 count: int = 1,
+                 resize: bool = False,
+                 resize_width: int = 640,
+                 pool: Optional[FramePool] = None
+                 ) -> List[Tuple[np.ndarray, Tuple[int, int]]]:
+  """Return upto count frames from the stream with their second & index.
+
+  If the pool is provided, the frames are decoded & resized into it's
+  free buffers.
+  """
+  frames = []
+
+  while len(frames) < count:
+    valid_frame, frame = (stream.read() if pool is None
+                          else pool.read(stream))
+
+    if not valid_frame or frame is None:
+      break
+
+    if resize:
+      frame = (rescale(frame, resize_width) if pool is None
+               else pool.rescale(frame, resize_width))
+
+    frames.append((frame, (int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000),
+                           int(stream.get(cv2.CAP_PROP_POS_FRAMES)) - 1)))
+
+  return frames
 
 
 def redact_faces(file: str,
@@ -53,11 +284,36 @@ def redact_faces(file: str,
                  smooth_blur: bool = True,
                  resize: bool = False,
                  resize_width: int = 640,
-                 debug_mode: bool = False) -> Optional[str]:
-  """Apply face redaction in video using MTCNN."""
+                 debug_mode: bool = False,
+                 roi: Optional[RegionOfInterest] = None,
+                 engine: str = 'mtcnn',
+                 batch_size: int = 8,
+                 detect_every: int = 1,
+                 source_hash: Optional[str] = None,
+                 offset: float = 0.0,
+                 detection_scale: float = 1.0,
+                 motion_crops: bool = False,
+                 sweep_every: int = 30,
+                 preset: str = 'medium',
+                 bitrate: Optional[int] = None,
+                 reader: str = 'opencv') -> Optional[str]:
+  """Apply face redaction in video using MTCNN or SSD.
+
+  The `ssd` engine detects the faces in batches of frames using the
+  ResNet-10 SSD at it's fixed 300 x 300 input, which is a lot faster
+  than MTCNN on CPU. If `detect_every` is more than 1, the faces are
+  detected every N frames and tracked in between. If the content hash
+  of the source video is provided, detections saved by the earlier runs
+  are reused, the video starting `offset` secs into the source. If the
+  `detection_scale` is less than 1, MTCNN & Haar cascade detect the
+  faces on downscaled frames while the redaction is still applied at the
+  full resolution. If `motion_crops` is enabled, the faces are detected
+  only in the moving regions of the frame, with the full frame analyzed
+  every `sweep_every` detections. The redacted frames are encoded once
+  as H264 using the x264 preset & bitrate. If the `reader` is `ffmpeg`,
+  the frames are decoded & resized by ffmpeg instead of OpenCV.
+  """
   x0, y0, x1, y1 = 0, 0, 0, 0
-  boxes, temp_csv_entries = [], []
-  face_count = {}
 
   directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}_faces')
 
@@ -71,116 +327,126 @@ def redact_faces(file: str,
 
   log.info(f'Redacting faces from "{os.path.basename(file)}"...')
 
+  stream, save = None, None
+
   try:
-    stream = cv2.VideoCapture(file)
+    stream = open_stream(file, reader, resize_width if resize else None)
     fps = stream.get(cv2.CAP_PROP_FPS)
     width, height = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
                      int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-
-    if resize:
+    face_count = DetectionCounter(
+        stream.get(cv2.CAP_PROP_FRAME_COUNT) / (fps or 1) + 1, 'faces')
+    tracker = None
+    stopped = False
+    pool = FramePool()
+    batched = use_ml_model and engine == 'ssd'
+    base = frame_offset(offset, fps)
+    store = detection_store(source_hash, engine if use_ml_model else 'haar',
+                            roi, resize_width=resize_width if resize else None,
+                            scaler=reader if resize and reader == 'ffmpeg'
+                            else None,
+                            confidence=(RES10_SSD_CONFIDENCE if batched
+                                        else MTCNN_CONFIDENCE),
+                            scale=None if batched else detection_scale,
+                            sweep_every=sweep_every if motion_crops else None)
+    gate = None
+
+    def detect_crops(images: List[np.ndarray]) -> List[List[Tuple]]:
+      if batched:
+        return detect_faces_ssd(images, scores=True)
+      return [detect_faces(image, use_ml_model, engine=engine, scores=True,
+                           scale=detection_scale) for image in images]
+
+    if motion_crops:
+      gate = MotionGate(detect_crops, sweep_every, roi)
+
+    def faces_of(frames: List[np.ndarray],
+                 payloads: List[Tuple[int, int]]) -> List[List[Tuple]]:
+      def detect_missing(positions: List[int]) -> List[List[Detection]]:
+        missing = [frames[pos] for pos in positions]
+
+        if gate is not None:
+          found = [gate.detect(frame) for frame in missing]
+        elif batched:
+          found = detect_faces_ssd(missing, roi, scores=True)
+        else:
+          found = [detect_faces(frame, use_ml_model, roi, engine=engine,
+                                scores=True, scale=detection_scale)
+                   for frame in missing]
+        return [as_detections(boxes) for boxes in found]
+
+      return [as_boxes(found) for found in
+              cached(store, [base + index for _, index in payloads],
+                     detect_missing)]
+
+    if detect_every > 1:
+      tracker = DetectionTracker(
+          lambda frame, payload: faces_of([frame], [payload])[0],
+          detect_every)
+      batch_size = 1
+    elif not batched:
+      batch_size = 1
+
+    # Frames of the ffmpeg reader are already at the analysis width.
+    rescaled = resize and reader != 'ffmpeg'
+
+    if rescaled:
       width, height = resize_width, int(height * (resize_width / float(width)))
 
-    save = cv2.VideoWriter(filename(temp_file, 1),
-                           cv2.VideoWriter_fourcc(*'mp4v'), fps,
-                           (width, height))
-
-    while True:
-      valid_frame, frame = stream.read()
+    save = FFmpegWriter(temp_file, fps, (width, height), preset, bitrate)
 
-      if not valid_frame:
-        break
+    while not stopped:
+      batch = _read_frames(stream, batch_size, rescaled, resize_width, pool)
 
-      if frame is None:
-        break
+      if tracker is not None:
+        detections = ([item for frame, payload in batch
+                       for item in tracker.update(frame, payload)]
+                      if batch else tracker.flush())
+      else:
+        faces = faces_of([frame for frame, _ in batch],
+                         [payload for _, payload in batch])
+        detections = [(frame, payload, boxes)
+                      for (frame, payload), boxes in zip(batch, faces)]
 
-      if resize:
-        frame = rescale(frame, resize_width)
+      ksize = (49, 49) if use_ml_model else (21, 21)
 
-      height, width = frame.shape[:2]
+      for frame, (second, _), faces in detections:
+        if debug_mode:
+          draw_bounding_boxes(frame, faces, red, ['face'] * len(faces))
 
-      if use_ml_model:
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        faces = face_detector.detect_faces(rgb)
+        redact_regions(frame, faces, smooth_blur, ksize)
+        face_count.update(second, len(faces))
+        save.write(frame)
+        pool.release(frame)
 
-        for face_idx in faces:
-            # Considering detections which have confidence score higher than the
-            # set threshold.
-          if face_idx['confidence'] > 0.75:
-            x0, y0, x1, y1 = face_idx['box']
-            x0, y0 = abs(x0), abs(y0)
-            x1, y1 = x0 + x1, y0 + y1
+        if debug_mode:
+          cv2.imshow('Video Processing Engine - Redaction', frame)
 
-            face = frame[y0:y1, x0:x1]
+        if cv2.waitKey(1) & 0xFF == int(27):
+          stopped = True
+          break
 
-            if debug_mode:
-              draw_bounding_box(frame, (x0, y0), (x1, y1), red)
-            try:
-              if smooth_blur:
-                frame[y0:y1, x0:x1] = cv2.GaussianBlur(frame[y0:y1, x0:x1],
-                                                       (49, 49), 0)
-              else:
-                frame[y0:y1, x0:x1] = pixelate(face)
-            except Exception:
-              pass
+      if not batch:
+        break
 
-          boxes.append([x1, y1])
-          face_occurence = s2d(int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
+    if tracker is not None:
+      log.info(f'Ran face detector on {tracker.detections} frame(s).')
 
-          if face_occurence not in face_count.keys():
-            face_count[face_occurence] = []
+    if gate is not None:
+      log.info(f'Detected faces in crops of {gate.cropped} frame(s), full '
+               f'{gate.sweeps} frame(s) & skipped {gate.skipped} still '
+               'frame(s).')
 
-          face_count[face_occurence].append(len(boxes))
-      else:
-        face_cascade = cv2.CascadeClassifier(frontal_haar)
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray_frame, 1.3, 5)
-
-        for (x0, y0, x1, y1) in faces:
-          if debug_mode:
-            draw_bounding_box(frame, (x0, y0), (x0 + x1, y0 + y1), red)
-          try:
-            if smooth_blur:
-              frame[y0:(y0 + y1),
-                    x0:(x0 + x1)] = cv2.GaussianBlur(frame[y0:(y0 + y1),
-                                                           x0:(x0 + x1)],
-                                                     (21, 21), 0)
-            else:
-              frame[y0:(y0 + y1),
-                    x0:(x0 + x1)] = pixelate(frame[y0:(y0 + y1), x0:(x0 + x1)])
-          except Exception:
-            pass
-          boxes.append([x1, y1])
-          face_occurence = s2d(int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
-
-          if face_occurence not in face_count.keys():
-            face_count[face_occurence] = []
-
-          face_count[face_occurence].append(len(boxes))
-
-      boxes = []
-      save.write(frame)
-
-      if debug_mode:
-        cv2.imshow('Video Processing Engine - Redaction', frame)
-
-      if cv2.waitKey(1) & 0xFF == int(27):
-        break
+    if store is not None:
+      log.info(f'Reused saved faces of {store.hits} frame(s).')
+      store.save()
 
     stream.release()
     save.release()
     cv2.destroyAllWindows()
 
-    # log.info('Logging detections into a CSV file...')
-    # with open(os.path.join(directory, f'{Path(file).stem}.csv'), 'a',
-    #           encoding="utf-8") as csv_file:
-    #   _file = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
-    #   _file.writerow(['Max no. of detections per second', 'Time frame'])
-    #   temp_csv_entries = [(max(v), k) for k, v in face_count.items()]
-    #   _file.writerows(temp_csv_entries)
-
-    log.info('Applying H264 encoding for bypassing browser issues...')
-    os.system(f'ffmpeg -loglevel error -y -i {filename(temp_file, 1)} -vcodec '
-              f'libx264 {temp_file}')
+    log.info('Logging detections into a CSV file...')
+    face_count.save(report_file(file, 'faces'))
 
     shutil.move(temp_file, file)
 
@@ -192,6 +458,12 @@ def redact_faces(file: str,
     return file
   except Exception as error:
     log.exception(error)
+  finally:
+    # Releasing again is harmless, so the decoder & the encoder of a run
+    # which failed midway are not left behind.
+    for source in (stream, save):
+      if source is not None:
+        source.release()
 
 
 def redact_license_plates(file: str,
@@ -199,8 +471,29 @@ def redact_license_plates(file: str,
                           smooth_blur: bool = True,
                           resize: bool = False,
                           resize_width: int = 640,
-                          debug_mode: bool = False) -> Optional[str]:
-  """Redact license plates in video using CaffeModel."""
+                          debug_mode: bool = False,
+                          tiles: Optional[Tuple[int, int]] = None,
+                          roi: Optional[RegionOfInterest] = None,
+                          detect_every: int = 1,
+                          source_hash: Optional[str] = None,
+                          offset: float = 0.0,
+                          motion_crops: bool = False,
+                          sweep_every: int = 30,
+                          preset: str = 'medium',
+                          bitrate: Optional[int] = None,
+                          reader: str = 'opencv') -> Optional[str]:
+  """Redact license plates in video using CaffeModel.
+
+  If `detect_every` is more than 1, the license plates are detected
+  every N frames and tracked in between. If the content hash of the
+  source video is provided, detections saved by the earlier runs are
+  reused, the video starting `offset` secs into the source. If
+  `motion_crops` is enabled, the license plates are detected only in the
+  moving regions of the frame, with the full frame analyzed every
+  `sweep_every` detections. The redacted frames are encoded once as H264
+  using the x264 preset & bitrate. If the `reader` is `ffmpeg`, the
+  frames are decoded & resized by ffmpeg instead of OpenCV.
+  """
   x0, y0, x1, y1 = 0, 0, 0, 0
   directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}_license')
 
@@ -214,89 +507,94 @@ def redact_license_plates(file: str,
 
   log.info(f'Redacting license plates from "{os.path.basename(file)}"...')
 
+  stream, save = None, None
+
   try:
-    stream = cv2.VideoCapture(file)
+    stream = open_stream(file, reader, resize_width if resize else None)
     fps = stream.get(cv2.CAP_PROP_FPS)
     width, height = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
                      int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
 
-    if resize:
+    # Frames of the ffmpeg reader are already at the analysis width.
+    rescaled = resize and reader != 'ffmpeg'
+
+    if rescaled:
       width, height = resize_width, int(height * (resize_width / float(width)))
 
-    save = cv2.VideoWriter(filename(temp_file, 1),
-                           cv2.VideoWriter_fourcc(*'mp4v'), fps,
-                           (width, height))
+    save = FFmpegWriter(temp_file, fps, (width, height), preset, bitrate)
+
+    tracker = None
+    stopped = False
+    pool = FramePool()
+    base = frame_offset(offset, fps)
+    store = detection_store(source_hash, 'mssd512', roi, tiles=tiles,
+                            resize_width=resize_width if resize else None,
+                            scaler=reader if resize and reader == 'ffmpeg'
+                            else None,
+                            confidence=PLATE_CONFIDENCE,
+                            sweep_every=sweep_every if motion_crops else None)
+    gate = None
+
+    if motion_crops:
+      gate = MotionGate(lambda images: [
+          detect_license_plates(image, crop_tiles(image, tiles), scores=True)
+          for image in images], sweep_every, roi)
+
+    def plates_of(frame: np.ndarray, payload: Tuple[int, int]) -> List[Tuple]:
+      return as_boxes(cached(
+          store, [base + payload[1]],
+          lambda _: [as_detections(
+              gate.detect(frame) if gate is not None else
+              detect_license_plates(frame, tiles, roi, scores=True))])[0])
+
+    if detect_every > 1:
+      tracker = DetectionTracker(plates_of, detect_every)
+
+    while not stopped:
+      batch = _read_frames(stream, 1, rescaled, resize_width, pool)
+
+      if tracker is not None:
+        detections = ([item for frame, payload in batch
+                       for item in tracker.update(frame, payload)]
+                      if batch else tracker.flush())
+      else:
+        detections = [(frame, payload, plates_of(frame, payload))
+                      for frame, payload in batch]
 
-    while True:
-      valid_frame, frame = stream.read()
+      for frame, _, plates in detections:
+        if debug_mode:
+          draw_bounding_boxes(frame, plates, red, ['plate'] * len(plates))
 
-      if not valid_frame:
-        break
+        redact_regions(frame, plates, smooth_blur, (49, 49))
+        save.write(frame)
+        pool.release(frame)
 
-      if frame is None:
-        break
+        if debug_mode:
+          cv2.imshow('Video Processing Engine - Redaction', frame)
+
+        if cv2.waitKey(1) & 0xFF == int(27):
+          stopped = True
+          break
 
-      if resize:
-        frame = rescale(frame, resize_width)
-
-      height, width = frame.shape[:2]
-
-      bkp_frame = frame.copy()
-
-      tensor = np.zeros((1, 3, bkp_frame.shape[0], bkp_frame.shape[1]))
-      tmp_frame = bkp_frame.astype(np.float32)
-      for t_i in range(3):
-        tensor[0, t_i, :, :] = ((tmp_frame[:, :, 2 - t_i] /
-                                 pixel_scale - pixel_means[2 - t_i]) /
-                                pixel_stds[2 - t_i])
-      convnet.setInput(tensor)
-      detected_license_plate = convnet.forward()
-
-      for idx in range(0, detected_license_plate.shape[2]):
-        if detected_license_plate[0, 0, idx, 2] > 0.6:
-          coords = detected_license_plate[0, 0, idx, 3:7] * np.array([width,
-                                                                      height,
-                                                                      width,
-                                                                      height])
-          x0, y0, x1, y1 = coords.astype('int')
-          adj = int(x1 - x0) * 0.1
-
-          x0 = x0 - adj
-          y0 = y0 - adj
-          x1 = x1 + adj
-          y1 = y1 + adj
-
-          x0, y0, x1, y1 = tuple(map(int, (x0, y0, x1, y1)))
-
-          face = bkp_frame[y0:y1, x0:x1]
-
-          if debug_mode:
-            draw_bounding_box(frame, (x0, y0), (x1, y1), red)
-          try:
-            if smooth_blur:
-              frame[y0:y1, x0:x1] = cv2.GaussianBlur(frame[y0:y1, x0:x1],
-                                                     (49, 49), 0)
-            else:
-              frame[y0:y1, x0:x1] = pixelate(face)
-          except Exception:
-            pass
-
-      save.write(frame)
-
-      if debug_mode:
-        cv2.imshow('Video Processing Engine - Redaction', frame)
-
-      if cv2.waitKey(1) & 0xFF == int(27):
+      if not batch:
         break
 
+    if tracker is not None:
+      log.info(f'Ran license plate detector on {tracker.detections} frame(s).')
+
+    if gate is not None:
+      log.info(f'Detected license plates in crops of {gate.cropped} '
+               f'frame(s), full {gate.sweeps} frame(s) & skipped '
+               f'{gate.skipped} still frame(s).')
+
+    if store is not None:
+      log.info(f'Reused saved license plates of {store.hits} frame(s).')
+      store.save()
+
     stream.release()
     save.release()
     cv2.destroyAllWindows()
 
-    log.info('Applying H264 encoding for bypassing browser issues...')
-    os.system(f'ffmpeg -loglevel error -y -i {filename(temp_file, 1)} -vcodec '
-              f'libx264 {temp_file}')
-
     shutil.move(temp_file, file)
 
     if len(os.listdir(directory)) > 0:
@@ -307,3 +605,9 @@ def redact_license_plates(file: str,
     return file
   except Exception as error:
     log.exception(error)
+  finally:
+    # Releasing again is harmless, so the decoder & the encoder of a run
+    # which failed midway are not left behind.
+    for source in (stream, save):
+      if source is not None:
+        source.release()
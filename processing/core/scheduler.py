@@ -0,0 +1,194 @@
+"""A subservice for running the orders concurrently within the budgets."""
+
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                wait)
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from processing.core.pipeline import STAGE_WORKERS
+
+# Estimated CPU (cores) & memory (MB) used by every order, by every
+# process of it's motion analysis and by every worker of it's stages, at
+# a source size of upto 1 GB.
+BASE_COST = (1.0, 512.0)
+MOTION_COST = (1.0, 512.0)
+COMPRESSION_COST = (1.0, 256.0)
+UPLOAD_COST = (0.25, 64.0)
+# Cost of the analysis worker for every feature it runs on the clips.
+FEATURE_COSTS = {
+    'count_obj': (1.0, 768.0),
+    'analyze_face': (2.0, 1536.0),
+    'analyze_license_plate': (1.0, 1024.0),
+}
+
+
+def memory_budget(fraction: float = 0.8) -> float:
+  """Return fraction of the physical memory (in MB) of the machine."""
+  try:
+    total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+  except (AttributeError, ValueError, OSError):
+    total = 8 * 1024 ** 3
+  return total * fraction / 1024 ** 2
+
+
+def order_cost(order: Dict[str, Any],
+               size: Optional[int] = None) -> Tuple[float, float, float]:
+  """Return estimated CPU, memory & work of the order.
+
+  The motion analysis of the whole video runs before the clips go
+  through the stages, so the order needs the larger of the two on top
+  of it's base cost. Motion analysis in parallel uses as many processes
+  as the order asks for (every CPU by default), while the stages use as
+  many workers as the order asks for. Memory and work
+  grow with the size of the source file. Work, in core-GB, is used for
+  sharing the machine fairly between the customers.
+
+  Args:
+    order: Order as sent to the processing engine.
+    size: Size (default: None -> `file_size` of the order) of the source
+          file in bytes.
+
+  Returns:
+    Tuple of CPU (in cores), memory (in MB) & work of the order.
+  """
+  workers = {**STAGE_WORKERS, **order.get('stage_workers', {})}
+  motion = 0
+
+  if order.get('analyze_motion', False):
+    parallel = order.get('parallel_motion', False)
+    motion = ((order.get('motion_processes') or os.cpu_count() or 1)
+              if parallel else 1)
+
+  analysis = [FEATURE_COSTS[feature] for feature in FEATURE_COSTS
+              if order.get(feature, False)]
+  stages = [(workers['upload'], UPLOAD_COST),
+            (workers['analysis'], (sum(cpu for cpu, _ in analysis),
+                                   sum(memory for _, memory in analysis)))]
+
+  if order.get('perform_compression', True):
+    stages.append((workers['compress'], COMPRESSION_COST))
+
+  cpu = BASE_COST[0] + max(motion * MOTION_COST[0],
+                           sum(count * cost[0] for count, cost in stages))
+  memory = BASE_COST[1] + max(motion * MOTION_COST[1],
+                              sum(count * cost[1] for count, cost in stages))
+
+  size = order.get('file_size', 0) if size is None else size
+  size = max(float(size or 0) / 1024 ** 3, 1.0)
+  # Decoded frames held by the analysis grow with the resolution, which
+  # is roughly followed by the size of the file.
+  memory *= 1.0 + (min(size, 8.0) - 1.0) * 0.25
+  return cpu, memory, cpu * size
+
+
+class OrderScheduler:
+  """Run the orders on a process pool within the CPU & memory budgets.
+
+  Orders are admitted by their priority (higher first) and, for the same
+  priority, the customer who has used the least work so far goes first,
+  so that a single customer does not hold the machine. If the next order
+  does not fit in the free budget, smaller orders behind it are admitted
+  instead, but only `max_skips` times, after which the budget is kept
+  for it. Orders bigger than the whole budget run once the machine is
+  idle. Motion analysis of the orders in parallel is held within the CPU
+  budget, since it would otherwise use every CPU of the machine.
+  """
+
+  def __init__(self,
+               runner: Callable[[Dict[str, Any]], Any],
+               log: logging.Logger,
+               cpu_budget: Optional[float] = None,
+               memory: Optional[float] = None,
+               max_skips: int = 4) -> None:
+    self.runner = runner
+    self.log = log
+    self.cpu_budget = float(cpu_budget or os.cpu_count() or 1)
+    self.memory = float(memory or memory_budget())
+    self.max_skips = max_skips
+    self.usage: Dict[Any, float] = defaultdict(float)
+    self._queue: List[Dict[str, Any]] = []
+    self._sequence = count()
+
+  def submit(self,
+             order: Dict[str, Any],
+             size: Optional[int] = None) -> None:
+    """Add the order to the queue, with the size of it's source file."""
+    if order.get('parallel_motion', False):
+      processes = max(int(self.cpu_budget - BASE_COST[0]), 1)
+      order = {**order, 'motion_processes': min(
+          order.get('motion_processes') or processes, processes)}
+
+    cpu, memory, work = order_cost(order, size)
+    self._queue.append({'order': order, 'cpu': cpu, 'memory': memory,
+                        'work': work, 'skips': 0,
+                        'priority': int(order.get('priority', 0) or 0),
+                        'customer': order.get('customer_id', 0),
+                        'sequence': next(self._sequence)})
+
+  def _next(self,
+            free_cpu: float,
+            free_memory: float,
+            idle: bool) -> Optional[Dict[str, Any]]:
+    """Return the next order which can be admitted, if any."""
+    if not self._queue:
+      return None
+
+    self._queue.sort(key=lambda entry: (-entry['priority'],
+                                        self.usage[entry['customer']],
+                                        entry['sequence']))
+    head = self._queue[0]
+
+    def fits(entry: Dict[str, Any]) -> bool:
+      return entry['cpu'] <= free_cpu and entry['memory'] <= free_memory
+
+    if idle or fits(head):
+      return self._queue.pop(0)
+
+    if head['skips'] >= self.max_skips:
+      return None
+
+    for idx, entry in enumerate(self._queue[1:], start=1):
+      if fits(entry):
+        head['skips'] += 1
+        return self._queue.pop(idx)
+
+    return None
+
+  def run(self) -> None:
+    """Run all the queued orders and wait for them to finish."""
+    free_cpu, free_memory = self.cpu_budget, self.memory
+    running: Dict[Future, Dict[str, Any]] = {}
+    self.log.info(f'Scheduling {len(self._queue)} order(s) within '
+                  f'{self.cpu_budget:.0f} core(s) & {self.memory:.0f} MB.')
+
+    with ProcessPoolExecutor(max_workers=max(int(self.cpu_budget),
+                                             1)) as executor:
+      while self._queue or running:
+        while True:
+          entry = self._next(free_cpu, free_memory, not running)
+
+          if entry is None:
+            break
+
+          free_cpu -= entry['cpu']
+          free_memory -= entry['memory']
+          self.usage[entry['customer']] += entry['work']
+          running[executor.submit(self.runner, entry['order'])] = entry
+          self.log.info(f'Admitted order #{entry["order"].get("db_pk")} of '
+                        f'customer {entry["customer"]} needing '
+                        f'{entry["cpu"]:.0f} core(s) & '
+                        f'{entry["memory"]:.0f} MB.')
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+        for future in done:
+          entry = running.pop(future)
+          free_cpu += entry['cpu']
+          free_memory += entry['memory']
+
+          if future.exception() is not None:
+            self.log.error(f'Order #{entry["order"].get("db_pk")} failed.',
+                           exc_info=future.exception())
@@ -0,0 +1,118 @@
+"""A subservice for skipping redaction of clips with nothing to redact."""
+
+import logging
+import os
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from processing.core.redact import detect_faces_ssd, detect_license_plates
+from processing.utils.roi import RegionOfInterest
+
+# Confidence of the triage detectors, kept low so that any candidate
+# sends the clip through the redaction.
+TRIAGE_FACE_CONFIDENCE = 0.2
+TRIAGE_PLATE_CONFIDENCE = 0.3
+
+
+def sample_frames(file: str, samples: int = 8) -> List[np.ndarray]:
+  """Return frames spread evenly over the video."""
+  stream = cv2.VideoCapture(file)
+  total = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+  frames = []
+
+  for position in np.unique(np.linspace(0, max(total - 1, 0), samples,
+                                        dtype=int)):
+    stream.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+    valid_frame, frame = stream.read()
+
+    if valid_frame and frame is not None:
+      frames.append(frame)
+
+  stream.release()
+  return frames
+
+
+def scene_change(frames: List[np.ndarray],
+                 roi: Optional[RegionOfInterest] = None,
+                 threshold: int = 25,
+                 width: int = 160) -> float:
+  """Return highest fraction of pixels changed between the frames."""
+  previous, change = None, 0.0
+
+  for frame in frames:
+    if roi is not None:
+      frame = roi.crop(frame)[0]
+
+    height = max(int(frame.shape[0] * width / float(frame.shape[1])), 1)
+    thumbnail = cv2.GaussianBlur(
+        cv2.cvtColor(cv2.resize(frame, (width, height),
+                                interpolation=cv2.INTER_AREA),
+                     cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    if previous is not None:
+      change = max(change, float(np.mean(cv2.absdiff(previous, thumbnail) >
+                                         threshold)))
+    previous = thumbnail
+
+  return change
+
+
+def needs_redaction(file: str,
+                    log: logging.Logger,
+                    analyze_face: bool = True,
+                    analyze_license_plate: bool = True,
+                    roi: Optional[RegionOfInterest] = None,
+                    samples: int = 8,
+                    max_change: float = 0.01) -> bool:
+  """Check if the clip may have anything to redact.
+
+  A few frames spread over the clip are run through the SSD face
+  detector and the license plate detector (at their native input size)
+  with low confidence thresholds. The clip is considered empty only if
+  none of the sampled frames has a candidate and the scene stays still
+  between them, so that nothing could have passed by unsampled.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    analyze_face: Boolean (default: True) value to look for faces.
+    analyze_license_plate: Boolean (default: True) value to look for
+                           license plates.
+    roi: Region of interest (default: None) of the camera.
+    samples: Number of frames (default: 8) to be sampled.
+    max_change: Highest fraction (default: 0.01) of the pixels which may
+                change between the samples of an empty clip.
+
+  Returns:
+    False if the clip can be passed through without redaction, True
+    otherwise.
+  """
+  start_time = time.time()
+  name = os.path.basename(file)
+  frames = sample_frames(file, samples)
+
+  if not frames:
+    log.warning(f'Triage could not sample "{name}", redacting it anyway.')
+    return True
+
+  faces, plates = 0, 0
+  change = scene_change(frames, roi)
+
+  if analyze_face:
+    faces = sum(map(len, detect_faces_ssd(frames, roi,
+                                          TRIAGE_FACE_CONFIDENCE)))
+
+  if analyze_license_plate:
+    plates = sum(len(detect_license_plates(frame, (1, 1), roi,
+                                           confidence=TRIAGE_PLATE_CONFIDENCE))
+                 for frame in frames)
+
+  needed = bool(faces or plates or change > max_change)
+  log.info(f'Triage of "{name}": {faces} face(s), {plates} license '
+           f'plate(s) & {change:.1%} change in {len(frames)} sampled '
+           f'frame(s), {"redacting" if needed else "passing it through"} '
+           f'(took {time.time() - start_time:.2f} secs).')
+  return needed
@@ -5,7 +5,7 @@ import random
 import time
 from datetime import datetime
 from math import ceil, floor, modf
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 from moviepy.editor import VideoFileClip as vfc
 
@@ -255,7 +255,9 @@ def trim_by_points(file: str,
 def trim_num_parts(file: str,
                    num_parts: int,
                    clip_length: Union[float, int, str] = 30,
-                   random_sequence: bool = True) -> Optional[List]:
+                   random_sequence: bool = True,
+                   offsets: Optional[Dict[str, float]] = None
+                   ) -> Optional[List]:
   """Trim video in number of equal parts.
 
   Trims the video as per the number of clips required.
@@ -273,6 +275,8 @@ def trim_num_parts(file: str,
     verbose: Boolean (default: False) value to display the status.
     return_list: Boolean (default: True) value to return list of all the
                  trimmed files.
+    offsets: Dictionary (default: None) to record the start (in secs) of
+             every trimmed file in the video.
   """
   num_parts = int(num_parts)
   clip_length = int(clip_length)
@@ -287,6 +291,9 @@ def trim_num_parts(file: str,
       end = start + clip_length
       trim_video(file, filename(file, idx), start, end)
       video_list.append(filename(file, idx))
+
+      if offsets is not None:
+        offsets[filename(file, idx)] = start
     range_start += split_part
 
   if random_sequence:
@@ -297,7 +304,8 @@ def trim_num_parts(file: str,
 
 def trim_uniformly(file: str,
                    sampling_rate: Union[float, int, str] = 30,
-                   clip_length: Union[float, int, str] = 30) -> List:
+                   clip_length: Union[float, int, str] = 30,
+                   offsets: Optional[Dict[str, float]] = None) -> List:
   """Trims video uniformly with cumulative sampling rate."""
   video_list = []
   total_length = duration(file)
@@ -310,7 +318,7 @@ def trim_uniformly(file: str,
   parts = ceil(parts) if modf(parts)[0] > 0.75 else floor(parts)
   parts = 1 if parts == 0 else parts
 
-  video_list.append(trim_num_parts(file, parts, clip_length, False))
+  video_list.append(trim_num_parts(file, parts, clip_length, False, offsets))
 
   if len(video_list) > 1:
     if duration(video_list[-1]) < (0.75 * clip_length):
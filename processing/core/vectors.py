@@ -0,0 +1,127 @@
+"""A subservice for detecting motion from the codec motion vectors."""
+
+import logging
+import os
+import time
+from typing import Tuple
+
+import av
+import numpy as np
+
+from processing.core.motion import keep_motion_segments
+from processing.utils.counters import DetectionCounter, report_file
+
+
+def motion_scores(file: str,
+                  min_magnitude: float = 1.0) -> Tuple[np.ndarray, float]:
+  """Return moving area of every frame using codec motion vectors.
+
+  Decodes the video with ffmpeg exporting the motion vectors as frame
+  side data. The frames are never converted to NumPy arrays & the
+  deblocking filter is skipped, so the cost is a fraction of the pixel
+  based analysis. Frames without motion vectors (intra coded frames)
+  carry over the score of the previous frame.
+
+  The macroblock types are not exported along with the vectors, so the
+  moving blocks are told apart by their vectors alone. Intra coded
+  blocks of the predicted frames have no vector and are not counted,
+  while the skipped blocks have the predicted vector of their neighbours
+  and are counted only if it moves them.
+
+  Args:
+    file: Path of the video file.
+    min_magnitude: Minimum displacement (default: 1.0) in pixels for a
+                   block to be considered as moving.
+
+  Returns:
+    Tuple of moving area (in pixels) of every frame and FPS of video.
+  """
+  scores, score = [], 0
+
+  with av.open(file) as container:
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO'
+    stream.codec_context.options = {'flags2': '+export_mvs',
+                                    'skip_loop_filter': 'all'}
+    fps = float(stream.average_rate or stream.guessed_rate or 0)
+
+    for frame in container.decode(stream):
+      vectors = frame.side_data.get('MOTION_VECTORS')
+
+      if vectors is not None:
+        vectors = vectors.to_ndarray()
+        scale = np.maximum(vectors['motion_scale'], 1)
+        magnitude = np.hypot(vectors['motion_x'] / scale,
+                             vectors['motion_y'] / scale)
+        moving = vectors[magnitude >= min_magnitude]
+        # Blocks of bi-predicted frames have a vector for each reference,
+        # so they are counted only once.
+        _, unique = np.unique(np.column_stack((moving['dst_x'],
+                                               moving['dst_y'])),
+                              axis=0, return_index=True)
+        moving = moving[unique]
+        score = int(np.sum(moving['w'].astype(np.int64) * moving['h']))
+      elif not frame.key_frame:
+        score = 0
+
+      scores.append(score)
+
+  return np.array(scores, dtype=np.int64), fps
+
+
+def track_motion_vectors(file: str,
+                         log: logging.Logger,
+                         min_blocks: float = 6.0,
+                         min_magnitude: float = 1.0,
+                         resize: bool = False,
+                         resize_width: int = 640) -> str:
+  """Track motion in the video using codec motion vectors.
+
+  Alternative to `track_motion()` for bulk screening of the archived
+  footage. Frames whose moving area is at least `min_blocks` 16 x 16
+  macroblocks are considered to have motion and the video is reduced to
+  the same motion segments as the pixel based analysis. The area of the
+  moving blocks is not the area of the moving contours of the pixel
+  based analysis, so the threshold is not shared with it's `precision`.
+
+  Args:
+    file: Path of the video file.
+    log: Logger object for logging the status.
+    min_blocks: Minimum moving area (default: 6.0) in the units of 16 x 16
+                macroblocks.
+    min_magnitude: Minimum displacement (default: 1.0) in pixels for a
+                   block to be considered as moving.
+    resize: Boolean (default: False) value to resize the segments.
+    resize_width: Width (default: 640) to be resized to.
+
+  Returns:
+    Path of the video with only the motion segments.
+  """
+  log.info(f'Analyzing motion vectors for "{os.path.basename(file)}"...')
+
+  try:
+    start_time = time.time()
+    scores, fps = motion_scores(file, min_magnitude)
+    elapsed = max(time.time() - start_time, 1e-3)
+    log.info(f'Analyzed {len(scores)} frame(s) in {elapsed:.1f} secs, '
+             f'{len(scores) / elapsed:.1f} fps per stream.')
+
+    if fps <= 0 or len(scores) == 0:
+      log.warning('Unable to read motion vectors, skipping motion analysis.')
+      return file
+
+    motion_count = DetectionCounter(len(scores) / fps + 1, 'macroblocks')
+
+    # Moving area is reported in the units of 16 x 16 macroblocks.
+    for idx, score in enumerate(scores // 256):
+      motion_count.update(int(idx / fps), min(score, np.iinfo(np.uint16).max))
+
+    log.info('Logging detections into a CSV file.')
+    motion_count.save(report_file(file, 'motion'))
+    motion_frames = np.flatnonzero(scores >= min_blocks * 256)
+    motion_frames = motion_frames[motion_frames > 0].tolist()
+    return keep_motion_segments(file, motion_frames, fps, len(scores), log,
+                                resize=resize, resize_width=resize_width)
+  except Exception as error:
+    log.critical(f'Something went wrong because of {error}')
+    raise error
@@ -0,0 +1,159 @@
+"""Utility for persisting background model of the cameras."""
+
+import os
+import time
+import zipfile
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import uuid4
+
+import cv2
+import numpy as np
+
+from processing.utils.paths import backgrounds
+
+
+class BackgroundModel:
+  """Low resolution running average background of the camera.
+
+  The model is learned from the grayscale frames used for the motion
+  analysis, saved at the end of a run and loaded at the start of the
+  next run of the same camera. A saved model is used only if it was
+  learned from recent footage, recorded around the same time of the day
+  as the footage to be analyzed, so that the lighting of the scene
+  matches. Times are taken from when the footage was recorded, not from
+  when it's processed.
+  """
+
+  def __init__(self,
+               key: str,
+               directory: str = backgrounds,
+               width: int = 160,
+               alpha: float = 0.02,
+               max_age: float = 7 * 24 * 3600,
+               time_window: float = 2 * 3600,
+               recorded_at: Optional[float] = None) -> None:
+    self.file = os.path.join(directory, f'{key}.npz')
+    self.recorded_at = recorded_at
+    self.width = width
+    self.alpha = alpha
+    self.max_age = max_age
+    self.time_window = time_window
+    self.model: Optional[np.ndarray] = None
+    self.shape: Optional[Tuple[int, int]] = None
+
+  def _low_res(self, gray_frame: np.ndarray) -> np.ndarray:
+    """Return low resolution float copy of the grayscale frame."""
+    height, width = gray_frame.shape[:2]
+    size = (self.width, max(int(height * self.width / float(width)), 1))
+    small = cv2.resize(gray_frame, size, interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32)
+
+  def _is_fresh(self, saved_at: float, when: float) -> bool:
+    """Check if the model saved at the time is usable at the other time."""
+    if not 0 <= when - saved_at <= self.max_age:
+      return False
+
+    def _seconds(epoch: float) -> int:
+      moment = datetime.fromtimestamp(epoch)
+      return moment.hour * 3600 + moment.minute * 60 + moment.second
+
+    delta = abs(_seconds(when) - _seconds(saved_at))
+    return min(delta, 24 * 3600 - delta) <= self.time_window
+
+  def load(self,
+           shape: Tuple[int, int],
+           when: Optional[float] = None) -> Optional[np.ndarray]:
+    """Return background of the shape if a usable model is saved.
+
+    Args:
+      shape: Shape of the grayscale frames used for motion analysis.
+      when: Epoch (default: None -> `recorded_at` or now) when the
+            frames to be analyzed were recorded.
+
+    Returns:
+      Background frame of the same shape or None if there is no usable
+      saved model.
+    """
+    if not os.path.isfile(self.file):
+      return None
+
+    when = self.recorded_at if when is None else when
+    when = time.time() if when is None else when
+
+    try:
+      with np.load(self.file) as saved:
+        if tuple(saved['shape']) != tuple(shape[:2]):
+          return None
+
+        if not self._is_fresh(float(saved['saved_at']), when):
+          return None
+
+        model = saved['model'].astype(np.float32)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+      # Model is unreadable, the first frame is used as reference then.
+      return None
+
+    self.model = model
+
+    self.shape = tuple(shape[:2])
+    background = cv2.resize(self.model, (shape[1], shape[0]),
+                            interpolation=cv2.INTER_LINEAR)
+    return cv2.convertScaleAbs(background)
+
+  def usable(self, when: Optional[float] = None) -> bool:
+    """Check if a saved model is fresh enough to be loaded.
+
+    Args:
+      when: Epoch (default: None -> `recorded_at` or now) when the
+            frames to be analyzed were recorded.
+    """
+    if not os.path.isfile(self.file):
+      return False
+
+    when = self.recorded_at if when is None else when
+    when = time.time() if when is None else when
+
+    try:
+      with np.load(self.file) as saved:
+        return self._is_fresh(float(saved['saved_at']), when)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+      return False
+
+  def update(self, gray_frame: np.ndarray) -> None:
+    """Learn the background from the grayscale frame."""
+    small = self._low_res(gray_frame)
+
+    if self.model is None or self.model.shape != small.shape:
+      self.model = small
+      self.shape = gray_frame.shape[:2]
+    else:
+      cv2.accumulateWeighted(small, self.model, self.alpha)
+
+  def save(self, duration: float = 0.0) -> Optional[str]:
+    """Save the learned model for the next run.
+
+    The model is written to a temporary file and moved in place, so that
+    the orders of the same camera running at the same time never read a
+    half written model. It's dated by the end of the footage it was
+    learned from, as that is the scene it has learned last.
+
+    Args:
+      duration: Secs (default: 0.0) from the start of the recorded
+                footage until the end of the analyzed video.
+    """
+    if self.model is None:
+      return None
+
+    os.makedirs(os.path.dirname(self.file), exist_ok=True)
+    temp = f'{self.file}.{uuid4().hex}.tmp'
+    saved_at = (time.time() if self.recorded_at is None
+                else self.recorded_at + duration)
+
+    with open(temp, 'wb') as model:
+      np.savez_compressed(model, model=self.model,
+                          shape=np.array(self.shape),
+                          saved_at=np.array(saved_at))
+
+    os.replace(temp, self.file)
+    return self.file
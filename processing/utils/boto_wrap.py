@@ -173,6 +173,37 @@ def check_file(access_key: str,
             s3_file]
 
 
+def object_size(access_key: str,
+                secret_key: str,
+                s3_url: str,
+                log: logging.Logger,
+                bucket_name: str = None) -> Optional[int]:
+  """Return size of the file on S3 bucket in bytes.
+
+  Args:
+    access_key: AWS access key.
+    secret_key: AWS secret key.
+    s3_url: Public url for the file.
+    log: Logger object for logging the status.
+    bucket_name: Bucket (default: None) where the file is stored.
+
+  Returns:
+    Size of the file, None if it could not be found.
+  """
+  try:
+    s3 = boto3.client('s3',
+                      aws_access_key_id=access_key,
+                      aws_secret_access_key=secret_key)
+    if bucket_name is None:
+      bucket_name = s3_url.split('//')[1].split('.')[0]
+    s3_file = s3_url.split('.amazonaws.com/')[1]
+    return int(s3.head_object(Bucket=bucket_name,
+                              Key=s3_file)['ContentLength'])
+  except (ClientError, NoCredentialsError, AttributeError, IndexError):
+    log.warning('Could not read size of the file on Amazon S3 storage.')
+    return None
+
+
 def access_file(access_key: str,
                 secret_key: str,
                 s3_url: str,
@@ -0,0 +1,123 @@
+"""Utility for recycling the frame buffers of the OpenCV loops."""
+
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Shape = Tuple[int, ...]
+
+
+class FramePool:
+  """Pool of preallocated frames recycled once they are no longer used.
+
+  Frames are decoded into the free buffers using `read(image=buffer)`
+  and handed back to the pool with `release()` once the consumer, like
+  the video writer, is done with them. Consumers which keep the frame
+  around for a while (buffers & queues of the writers) `retain()` it and
+  release it when they drop it, so the frame is reused only after all of
+  them are done. Scratch buffers hold the per-frame intermediate steps
+  (grayscale, blurred, delta & mask) which are overwritten every frame.
+  """
+
+  def __init__(self, limit: int = 64) -> None:
+    self.limit = limit
+    self.allocated = 0
+    self._free: Dict[Tuple[Shape, str], List[np.ndarray]] = defaultdict(list)
+    self._users: Dict[int, int] = {}
+    self._scratch: Dict[str, np.ndarray] = {}
+    self._lock = Lock()
+
+  def acquire(self, shape: Shape, dtype: str = 'uint8') -> np.ndarray:
+    """Return a free buffer of the shape, allocating it if required."""
+    with self._lock:
+      free = self._free[(tuple(shape), np.dtype(dtype).str)]
+      buffer = free.pop() if free else None
+
+      if buffer is None:
+        buffer = np.empty(shape, dtype=dtype)
+        self.allocated += 1
+
+      self._users[id(buffer)] = 1
+      return buffer
+
+  def retain(self, frame: np.ndarray) -> np.ndarray:
+    """Mark the frame as used by one more consumer."""
+    with self._lock:
+      if id(frame) in self._users:
+        self._users[id(frame)] += 1
+    return frame
+
+  def release(self, frame: Optional[np.ndarray]) -> None:
+    """Hand the frame back to the pool once it's last consumer is done."""
+    if frame is None:
+      return
+
+    with self._lock:
+      users = self._users.get(id(frame))
+
+      if users is None:
+        return
+
+      if users > 1:
+        self._users[id(frame)] = users - 1
+        return
+
+      del self._users[id(frame)]
+      free = self._free[(frame.shape, frame.dtype.str)]
+
+      if len(free) < self.limit:
+        free.append(frame)
+
+  def read(self,
+           stream: cv2.VideoCapture) -> Tuple[bool, Optional[np.ndarray]]:
+    """Decode the next frame of the stream into a free buffer.
+
+    Streams with a `shape` attribute, like `FFmpegReader`, decode frames
+    of that shape (grayscale or BGR) and others decode BGR frames.
+    """
+    width = int(stream.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    if width <= 0 or height <= 0:
+      return stream.read()
+
+    buffer = self.acquire(getattr(stream, 'shape', (height, width, 3)))
+    valid_frame, frame = stream.read(image=buffer)
+
+    if not valid_frame or frame is None:
+      self.release(buffer)
+      return False, None
+
+    if frame is not buffer:
+      # Frame of a different size was decoded into a new array.
+      self.release(buffer)
+    return True, frame
+
+  def rescale(self, frame: np.ndarray, width: int) -> np.ndarray:
+    """Return frame resized to the width in a free buffer.
+
+    The source frame is handed back to the pool.
+    """
+    height = int(frame.shape[0] * (width / float(frame.shape[1])))
+    resized = self.acquire((height, width) + frame.shape[2:], frame.dtype)
+    cv2.resize(frame, (width, height), dst=resized,
+               interpolation=cv2.INTER_AREA)
+    self.release(frame)
+    return resized
+
+  def scratch(self,
+              name: str,
+              shape: Shape,
+              dtype: str = 'uint8') -> np.ndarray:
+    """Return the named buffer which is overwritten every frame."""
+    buffer = self._scratch.get(name)
+
+    if (buffer is None or buffer.shape != tuple(shape) or
+            buffer.dtype != np.dtype(dtype)):
+      buffer = np.empty(shape, dtype=dtype)
+      self._scratch[name] = buffer
+      self.allocated += 1
+    return buffer
@@ -0,0 +1,170 @@
+"""Utility for reusing the results of the videos processed before."""
+
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from processing.utils.local import content_hash
+from processing.utils.paths import (caffemodel, frontal_haar, frontal_haar_2,
+                                    lp_caffemodel, lp_prototxt, profile_haar,
+                                    prototxt, results, tf_caffemodel,
+                                    tf_prototxt)
+from processing.utils.sidecar import fingerprint
+
+try:
+  from importlib.metadata import PackageNotFoundError, version
+except ImportError:
+  # Python 3.6 & 3.7 only have the backport.
+  from importlib_metadata import PackageNotFoundError, version
+
+# Disk space (in bytes) the cached results may take up.
+RESULTS_BUDGET = 50 * 1024 ** 3
+MANIFEST = 'entry.json'
+
+
+# Weights & configs of the models which change the results.
+MODEL_FILES = (caffemodel, prototxt, tf_caffemodel, tf_prototxt,
+               lp_caffemodel, lp_prototxt, frontal_haar, frontal_haar_2,
+               profile_haar)
+MODEL_PACKAGES = ('mtcnn',)
+
+
+def model_versions() -> Dict[str, Optional[str]]:
+  """Return content hashes of the model files & versions of the packages.
+
+  Only the files of the models are hashed, so that the other files kept
+  along with them, like the regions of interest, do not invalidate the
+  cached results.
+  """
+  versions = {}
+
+  for file in MODEL_FILES:
+    versions[os.path.basename(file)] = (content_hash(file)
+                                        if os.path.isfile(file) else None)
+
+  for package in MODEL_PACKAGES:
+    try:
+      versions[package] = version(package)
+    except PackageNotFoundError:
+      versions[package] = None
+  return versions
+
+
+class ResultCache:
+  """Results of the stages keyed by the content of the source video.
+
+  Every entry is a directory holding the files produced by a stage for a
+  source video & the parameters which change them, along with a
+  manifest of their order. Entries are written under a temporary name
+  and moved in place once complete, so that the concurrent orders never
+  see a half written entry. Once the entries outgrow the budget, the
+  least recently used ones are evicted.
+  """
+
+  def __init__(self,
+               directory: str = results,
+               budget: float = RESULTS_BUDGET) -> None:
+    self.directory = directory
+    self.budget = budget
+
+  @staticmethod
+  def key(stage: str, source_hash: str, params: Dict[str, Any]) -> str:
+    """Return key of the stage result for the source & parameters."""
+    return f'{stage}_{fingerprint(stage, {"source": source_hash, **params})}'
+
+  def _entry(self, key: str) -> str:
+    """Return directory of the entry."""
+    return os.path.join(self.directory, key)
+
+  def restore(self,
+              key: str,
+              target: Callable[[int], str]) -> Optional[List[str]]:
+    """Copy the cached files to their targets.
+
+    Args:
+      key: Key of the entry.
+      target: Callable returning the path where the cached file of the
+              index is copied to.
+
+    Returns:
+      Paths of the copied files, None if the entry is not cached.
+    """
+    manifest = os.path.join(self._entry(key), MANIFEST)
+
+    try:
+      with open(manifest) as entry:
+        names = json.load(entry)['files']
+
+      restored = [shutil.copy(os.path.join(self._entry(key), name),
+                              target(idx))
+                  for idx, name in enumerate(names)]
+      # Marks the entry as recently used.
+      os.utime(manifest)
+    except (OSError, ValueError, KeyError):
+      # Entry is missing or was evicted by another order meanwhile.
+      return None
+    return restored
+
+  def put(self, key: str, files: List[str]) -> None:
+    """Cache the files produced by the stage and evict the stale ones."""
+    entry = self._entry(key)
+
+    if os.path.isdir(entry):
+      return
+
+    temp = f'{entry}.{uuid4().hex}.tmp'
+    names = []
+
+    try:
+      os.makedirs(temp)
+
+      for idx, file in enumerate(files):
+        name = f'{idx:04d}{os.path.splitext(file)[1]}'
+        # Outputs are only ever replaced by moving new files in place, so
+        # the cached file can share it's content with the output.
+        try:
+          os.link(file, os.path.join(temp, name))
+        except OSError:
+          shutil.copy(file, os.path.join(temp, name))
+        names.append(name)
+
+      with open(os.path.join(temp, MANIFEST), 'w') as manifest:
+        json.dump({'files': names}, manifest)
+
+      os.rename(temp, entry)
+    except OSError:
+      # Another order has cached the same result meanwhile or the disk is
+      # full, the result is simply not cached then.
+      shutil.rmtree(temp, ignore_errors=True)
+      return
+
+    self.evict()
+
+  def evict(self) -> None:
+    """Remove the least recently used entries outgrowing the budget."""
+    entries = []
+
+    for key in os.listdir(self.directory):
+      manifest = os.path.join(self._entry(key), MANIFEST)
+
+      if key.endswith('.tmp') or not os.path.isfile(manifest):
+        continue
+
+      try:
+        size = sum(os.path.getsize(os.path.join(self._entry(key), name))
+                   for name in os.listdir(self._entry(key)))
+        entries.append((os.path.getmtime(manifest), size, key))
+      except OSError:
+        # Entry was evicted by another order meanwhile.
+        continue
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, key in sorted(entries):
+      if total <= self.budget:
+        break
+
+      shutil.rmtree(self._entry(key), ignore_errors=True)
+      total -= size
@@ -0,0 +1,89 @@
+"""Utility for resuming the orders from their last finished stage."""
+
+import json
+import os
+from typing import Any, Dict
+
+from processing.utils.paths import checkpoints
+
+
+class Checkpoint:
+  """Manifest of the stages finished by an order.
+
+  The outputs of every stage stay in the workspace of the order while
+  the manifest records them, so a retried order picks up where it had
+  failed. The manifest is keyed by the primary key of the order, since
+  the workspace of a retry would otherwise get a new name. It is
+  rewritten atomically after every update, so a crash never leaves a
+  half written manifest behind.
+  """
+
+  def __init__(self,
+               key: Any,
+               directory: str = checkpoints) -> None:
+    self.path = os.path.join(directory, f'{key}.json')
+    self.state: Dict[str, Any] = {}
+
+    if os.path.isfile(self.path):
+      with open(self.path) as manifest:
+        self.state = json.load(manifest)
+
+  def _write(self) -> None:
+    """Save the manifest."""
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    temp = f'{self.path}.tmp'
+
+    with open(temp, 'w') as manifest:
+      json.dump(self.state, manifest, indent=2)
+
+    os.replace(temp, self.path)
+
+  def get(self, name: str, default: Any = None) -> Any:
+    """Return the saved value."""
+    return self.state.get(name, default)
+
+  def save(self, **values) -> None:
+    """Save the values produced by a finished stage."""
+    self.state.update(values)
+    self._write()
+
+  def reached(self, milestone: int) -> bool:
+    """Check if the milestone was already saved."""
+    return milestone in self.state.get('milestones', [])
+
+  def reach(self, milestone: int) -> None:
+    """Record the milestone as saved."""
+    if not self.reached(milestone):
+      self.state.setdefault('milestones', []).append(milestone)
+      self._write()
+
+  def clips(self, stage: str) -> Dict[int, Any]:
+    """Return outputs of the clips which finished the stage."""
+    return {int(idx): output
+            for idx, output in self.state.get('clips', {}).get(stage,
+                                                               {}).items()}
+
+  def record(self, stage: str, clip: int, output: Any) -> None:
+    """Save output of the clip which finished the stage."""
+    self.state.setdefault('clips', {}).setdefault(stage, {})[str(clip)] = (
+        output)
+    self._write()
+
+  def clear(self) -> None:
+    """Remove the manifest once the order is done."""
+    self.state = {}
+
+    if os.path.isfile(self.path):
+      os.remove(self.path)
+
+
+def existing(outputs: Dict[int, str]) -> Dict[int, str]:
+  """Return outputs of the clips whose files are still present."""
+  return {idx: output for idx, output in outputs.items()
+          if output and os.path.isfile(output)}
+
+
+def succeeded(outputs: Dict[int, Any]) -> Dict[int, Any]:
+  """Return outputs of the clips which did not fail, i.e. are not None."""
+  return {idx: output for idx, output in outputs.items()
+          if output is not None}
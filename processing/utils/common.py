@@ -89,6 +89,31 @@ def calculate_duration(start_time: str,
   return float((_end_time - _start_time).seconds)
 
 
+def footage_epoch(start_date: Optional[str],
+                  start_time: Optional[str],
+                  timestamp_format: str = '%Y-%m-%d %H:%M:%S'
+                  ) -> Optional[float]:
+  """Return epoch when the footage was recorded.
+
+  The local date & time of the camera are read as local time, so that
+  the time of the day of the epoch matches the one of the camera.
+
+  Args:
+    start_date: Date when the footage starts.
+    start_time: Time when the footage starts.
+    timestamp_format: Timestamp format (default: %Y-%m-%d %H:%M:%S) of
+                      the date & time joined together.
+
+  Returns:
+    Epoch of the start of the footage, None if it's not known.
+  """
+  try:
+    return datetime.strptime(f'{start_date} {start_time}',
+                             timestamp_format).timestamp()
+  except (TypeError, ValueError):
+    return None
+
+
 def seconds_to_datetime(second: int) -> str:
   """Convert seconds to datetime string."""
   mins, secs = divmod(second, 60)
@@ -0,0 +1,115 @@
+"""Utility for counting detections per second of the video."""
+
+import csv
+import os
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+from processing.utils.common import seconds_to_datetime as s2d
+from processing.utils.paths import reports
+
+
+class DetectionCounter:
+  """Per second counters of the detections.
+
+  Keeps maximum & sum of the detections for every second & class along
+  with the number of frames analyzed in that second. The counters are
+  preallocated NumPy arrays indexed by integer second, so recording a
+  frame is constant time and no time strings are formatted until the
+  report is written.
+  """
+
+  def __init__(self,
+               seconds: Union[float, int] = 60,
+               classes: Union[List[str], str] = 'detections') -> None:
+    self.classes = [classes] if isinstance(classes, str) else list(classes)
+    size = (max(int(np.ceil(seconds)), 1), len(self.classes))
+    self.max = np.zeros(size, dtype=np.uint16)
+    self.sum = np.zeros(size, dtype=np.uint32)
+    self.frames = np.zeros(size[0], dtype=np.uint32)
+
+  def _fit(self, second: int) -> None:
+    """Grow the counters if the second is out of range."""
+    if second < len(self.frames):
+      return
+
+    used, size = len(self.frames), max(second + 1, 2 * len(self.frames))
+    self.max = np.resize(self.max, (size, len(self.classes)))
+    self.sum = np.resize(self.sum, (size, len(self.classes)))
+    self.frames = np.resize(self.frames, size)
+    self.max[used:] = 0
+    self.sum[used:] = 0
+    self.frames[used:] = 0
+
+  def update(self,
+             second: int,
+             counts: Union[List[int], np.ndarray, int] = 0) -> None:
+    """Record detections of a frame.
+
+    Args:
+      second: Second of the video the frame belongs to.
+      counts: Number of detections in the frame, either as a single
+              value or as one value per class.
+    """
+    second = int(second)
+    self._fit(second)
+    np.maximum(self.max[second], counts, out=self.max[second],
+               casting='unsafe')
+    self.sum[second] += np.asarray(counts, dtype=np.uint32)
+    self.frames[second] += 1
+
+  def merge(self, other: 'DetectionCounter') -> 'DetectionCounter':
+    """Merge counters of another (disjoint) portion of the same video."""
+    self._fit(len(other.frames) - 1)
+    size = len(other.frames)
+    np.maximum(self.max[:size], other.max, out=self.max[:size])
+    self.sum[:size] += other.sum
+    self.frames[:size] += other.frames
+    return self
+
+  def seconds(self) -> np.ndarray:
+    """Return seconds which have at least one detection."""
+    return np.flatnonzero(self.max.any(axis=1))
+
+  def to_npz(self, file: str) -> str:
+    """Save the counters as compressed columnar NumPy file."""
+    np.savez_compressed(file, classes=np.array(self.classes),
+                        max=self.max, sum=self.sum, frames=self.frames)
+    return file if file.endswith('.npz') else f'{file}.npz'
+
+  def to_csv(self, file: str) -> str:
+    """Save the seconds with detections as CSV report."""
+    seconds = self.seconds()
+    header = ['Time frame', 'Frames']
+    header += [f'Max no. of {idx} per second' for idx in self.classes]
+    header += [f'Total no. of {idx} per second' for idx in self.classes]
+    columns = np.column_stack((self.frames[seconds], self.max[seconds],
+                               self.sum[seconds]))
+
+    with open(file, 'w', newline='', encoding='utf-8') as csv_file:
+      _file = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
+      _file.writerow(header)
+      _file.writerows([s2d(second), *row]
+                      for second, row in zip(seconds, columns.tolist()))
+    return file
+
+  def save(self, file: str) -> List[str]:
+    """Save the counters as NumPy & CSV report next to each other."""
+    stem = os.path.splitext(file)[0]
+    return [self.to_npz(f'{stem}.npz'), self.to_csv(f'{stem}.csv')]
+
+
+def report_file(file: str, kind: str) -> str:
+  """Return path (without extension) of the report of the video.
+
+  Videos are analyzed in the workspace of their order which is removed
+  once the order is done, so their reports are kept under `reports` in
+  a directory named after the directory of the video.
+  """
+  directory = os.path.join(reports,
+                           os.path.basename(os.path.dirname(
+                               os.path.abspath(file))))
+  os.makedirs(directory, exist_ok=True)
+  return os.path.join(directory, f'{Path(file).stem}_{kind}')
@@ -0,0 +1,135 @@
+"""Utility for applying redaction effects to the frames."""
+
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from processing.utils.gating import merge_regions
+
+Box = Tuple[int, int, int, int]
+
+
+def _odd(value: float) -> int:
+  """Return nearest odd integer (at least 1) for the kernel size."""
+  return max(int(value) // 2 * 2 + 1, 1)
+
+
+def _pixelated(roi: np.ndarray, block_size: float) -> np.ndarray:
+  """Return pixelated copy of the ROI with blocks of the size."""
+  height, width = roi.shape[:2]
+  size = (max(int(round(width / block_size)), 1),
+          max(int(round(height / block_size)), 1))
+  small = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+  return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def _blurred(roi: np.ndarray, ksize: Tuple[int, int]) -> np.ndarray:
+  """Return blurred copy of the ROI.
+
+  Large kernels are applied on a downscaled copy of the ROI and scaled
+  back up, which looks the same as blurring at the full resolution but
+  costs a fraction of it.
+  """
+  height, width = roi.shape[:2]
+  factor = min(max(min(ksize) // 12, 1), max(min(width, height) // 4, 1))
+
+  if factor == 1:
+    return cv2.GaussianBlur(roi, ksize, 0)
+
+  small = cv2.resize(roi, (max(width // factor, 1), max(height // factor, 1)),
+                     interpolation=cv2.INTER_LINEAR)
+  small = cv2.GaussianBlur(small, (_odd(ksize[0] / factor),
+                                   _odd(ksize[1] / factor)), 0)
+  return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def pixelate(roi: np.ndarray, blocks: int = 8) -> np.ndarray:
+  """Pixelate the ROI in place by resizing it down & back up.
+
+  Args:
+    roi: Numpy array of the region to be pixelated.
+    blocks: Number (default: 8) of blocks along the longer side.
+
+  Returns:
+    Pixelated ROI.
+  """
+  height, width = roi.shape[:2]
+
+  if height and width:
+    roi[:] = _pixelated(roi, max(width, height) / float(blocks))
+  return roi
+
+
+def blur(roi: np.ndarray, ksize: Tuple[int, int] = (49, 49)) -> np.ndarray:
+  """Blur the ROI in place using downscale-blur-upscale for big kernels.
+
+  Args:
+    roi: Numpy array of the region to be blurred.
+    ksize: Kernel size (default: 49 x 49) of the Gaussian blur at the
+           full resolution.
+
+  Returns:
+    Blurred ROI.
+  """
+  height, width = roi.shape[:2]
+
+  if height and width:
+    roi[:] = _blurred(roi, ksize)
+  return roi
+
+
+def redact_regions(frame: np.ndarray,
+                   boxes: List[Box],
+                   smooth_blur: bool = True,
+                   ksize: Tuple[int, int] = (49, 49),
+                   blocks: int = 8) -> np.ndarray:
+  """Blur or pixelate all the boxes of the frame.
+
+  Overlapping boxes are merged into clusters and the effect is applied
+  once to the region spanning each cluster, then copied back into the
+  frame through a mask of it's boxes. So the cost depends on the area
+  of the boxes and not on the area between them.
+
+  Args:
+    frame: Numpy array of the image frame.
+    boxes: List of boxes (x0, y0, x1, y1) to be redacted.
+    smooth_blur: Boolean (default: True) value to blur instead of
+                 pixelating the boxes.
+    ksize: Kernel size (default: 49 x 49) of the blur.
+    blocks: Number (default: 8) of blocks along the longer side of the
+            biggest box of the cluster while pixelating.
+
+  Returns:
+    Redacted frame.
+  """
+  height, width = frame.shape[:2]
+  boxes = np.array(boxes, dtype=np.int64).reshape(-1, 4)
+  np.clip(boxes[:, 0:4:2], 0, width, out=boxes[:, 0:4:2])
+  np.clip(boxes[:, 1:4:2], 0, height, out=boxes[:, 1:4:2])
+  boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+
+  for x0, y0, x1, y1 in merge_regions(boxes.tolist(), len(boxes)):
+    cluster = boxes[(boxes[:, 0] >= x0) & (boxes[:, 1] >= y0) &
+                    (boxes[:, 2] <= x1) & (boxes[:, 3] <= y1)]
+    region = frame[y0:y1, x0:x1]
+
+    if smooth_blur:
+      effect = _blurred(region, ksize)
+    else:
+      sides = np.maximum(cluster[:, 2] - cluster[:, 0],
+                         cluster[:, 3] - cluster[:, 1])
+      effect = _pixelated(region, max(sides.max() / float(blocks), 1.0))
+
+    if len(cluster) == 1:
+      region[:] = effect
+      continue
+
+    mask = np.zeros(region.shape[:2], dtype=np.uint8)
+
+    for bx0, by0, bx1, by1 in cluster - [x0, y0, x0, y0]:
+      mask[by0:by1, bx0:bx1] = 255
+
+    # Copies into the view of the frame in place.
+    cv2.copyTo(effect, mask, region)
+  return frame
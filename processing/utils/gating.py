@@ -0,0 +1,168 @@
+"""Utility for limiting the detectors to the moving regions of the frame."""
+
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing.utils.roi import RegionOfInterest
+
+Box = Tuple[int, int, int, int]
+
+
+def _pad(box: Box, width: int, height: int, padding: float = 0.5) -> Box:
+  """Return box grown by the fraction of it's size (at least 16 px)."""
+  x0, y0, x1, y1 = box
+  dx = max(int((x1 - x0) * padding), 16)
+  dy = max(int((y1 - y0) * padding), 16)
+  return (max(x0 - dx, 0), max(y0 - dy, 0),
+          min(x1 + dx, width), min(y1 + dy, height))
+
+
+def merge_regions(boxes: List[Box], max_crops: int = 4) -> List[Box]:
+  """Merge overlapping boxes until they are disjoint.
+
+  If more than `max_crops` boxes are left, they are merged into a single
+  box spanning all of them.
+  """
+  merged = [tuple(map(int, box)) for box in boxes]
+  changed = True
+
+  while changed and len(merged) > 1:
+    changed = False
+
+    for idx in range(len(merged)):
+      for jdx in range(idx + 1, len(merged)):
+        ax0, ay0, ax1, ay1 = merged[idx]
+        bx0, by0, bx1, by1 = merged[jdx]
+
+        if ax0 < bx1 and bx0 < ax1 and ay0 < by1 and by0 < ay1:
+          merged[idx] = (min(ax0, bx0), min(ay0, by0),
+                         max(ax1, bx1), max(ay1, by1))
+          del merged[jdx]
+          changed = True
+          break
+
+      if changed:
+        break
+
+  if len(merged) > max_crops:
+    merged = np.array(merged)
+    merged = [tuple(merged[:, :2].min(axis=0).tolist() +
+                    merged[:, 2:].max(axis=0).tolist())]
+
+  return merged
+
+
+class MotionGate:
+  """Run the detector only on the moving regions of the frame.
+
+  Moving regions are found by differencing low resolution grayscale
+  copies of the consecutive frames. The regions, along with the boxes
+  detected in the previous frame, are padded and merged into a few crops
+  and only the crops are passed to the detector. So the cost of the
+  detector follows the activity of the scene. Every `sweep_every`
+  detections (and whenever the crops cover most of the frame) the whole
+  frame is analyzed instead, so that nothing static is missed for long.
+  """
+
+  def __init__(self,
+               detector: Callable[[List[np.ndarray]], List[List[Tuple]]],
+               sweep_every: int = 30,
+               roi: Optional[RegionOfInterest] = None,
+               max_crops: int = 4,
+               max_coverage: float = 0.6,
+               threshold: int = 25,
+               width: int = 160) -> None:
+    self.detector = detector
+    self.sweep_every = max(int(sweep_every), 1)
+    self.roi = roi
+    self.max_crops = max_crops
+    self.max_coverage = max_coverage
+    self.threshold = threshold
+    self.width = width
+    self.sweeps = 0
+    self.cropped = 0
+    self.skipped = 0
+    self._thumbnail: Optional[np.ndarray] = None
+    self._boxes: List[Box] = []
+    self._since = 0
+
+  def _moving(self, frame: np.ndarray) -> List[Box]:
+    """Return boxes of the regions which moved since the last frame."""
+    height, width = frame.shape[:2]
+    size = (self.width, max(int(height * self.width / float(width)), 1))
+    thumbnail = cv2.cvtColor(cv2.resize(frame, size,
+                                        interpolation=cv2.INTER_AREA),
+                             cv2.COLOR_BGR2GRAY)
+    previous, self._thumbnail = self._thumbnail, thumbnail
+
+    if previous is None:
+      return []
+
+    delta = cv2.absdiff(previous, thumbnail)
+    mask = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+    mask = cv2.dilate(mask, None, iterations=2)
+
+    if self.roi is not None:
+      cv2.bitwise_and(mask, self.roi.mask(*size), dst=mask)
+
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
+    sx, sy = width / float(size[0]), height / float(size[1])
+    boxes = []
+
+    for contour in contours:
+      x0, y0, w, h = cv2.boundingRect(contour)
+      boxes.append((int(x0 * sx), int(y0 * sy), int((x0 + w) * sx) + 1,
+                    int((y0 + h) * sy) + 1))
+    return boxes
+
+  def _region(self, width: int, height: int) -> Box:
+    """Return the region analyzed by the full frame sweep."""
+    if self.roi is None:
+      return (0, 0, width, height)
+    return self.roi.bbox(width, height)
+
+  def detect(self, frame: np.ndarray) -> List[Tuple]:
+    """Return boxes detected in the moving regions of the frame.
+
+    Args:
+      frame: Numpy array of the image frame.
+
+    Returns:
+      Boxes (x0, y0, x1, y1, *extra) in the frame coordinates, with the
+      values returned by the detector after the coordinates kept as
+      they are.
+    """
+    height, width = frame.shape[:2]
+    first = self._thumbnail is None
+    regions = self._moving(frame) + self._boxes
+    crops = merge_regions([_pad(box, width, height) for box in regions],
+                          self.max_crops)
+    covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in crops)
+    self._since += 1
+
+    if (first or self._since >= self.sweep_every or
+            covered > self.max_coverage * width * height):
+      crops = [self._region(width, height)]
+      self._since = 0
+      self.sweeps += 1
+    elif crops:
+      self.cropped += 1
+    else:
+      self.skipped += 1
+      self._boxes = []
+      return []
+
+    detections = self.detector([frame[y0:y1, x0:x1]
+                                for x0, y0, x1, y1 in crops])
+    boxes = [(x0 + bx0, y0 + by0, x0 + bx1, y0 + by1, *extra)
+             for (x0, y0, _, _), found in zip(crops, detections)
+             for bx0, by0, bx1, by1, *extra in found]
+
+    if self.roi is not None:
+      boxes = self.roi.inside(boxes, width, height)
+
+    self._boxes = [tuple(map(int, box[:4])) for box in boxes]
+    return boxes
@@ -0,0 +1,186 @@
+"""Utility for running SSD detectors at their native input size."""
+
+from typing import Callable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+def tile_grid(width: int,
+              height: int,
+              tiles: Tuple[int, int] = (1, 1),
+              overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+  """Return overlapping tiles covering the frame.
+
+  Args:
+    width: Width of the frame.
+    height: Height of the frame.
+    tiles: Number (default: 1 x 1) of columns & rows of tiles.
+    overlap: Fraction (default: 0.2) of the tile shared with it's
+             neighbouring tile.
+
+  Returns:
+    List of top left & bottom right coordinates of the tiles.
+  """
+  cols, rows = tiles
+  tile_width = width / (cols - (cols - 1) * overlap)
+  tile_height = height / (rows - (rows - 1) * overlap)
+  regions = []
+
+  for row in range(rows):
+    for col in range(cols):
+      x0 = int(round(col * tile_width * (1 - overlap)))
+      y0 = int(round(row * tile_height * (1 - overlap)))
+      regions.append((x0, y0, min(int(round(x0 + tile_width)), width),
+                      min(int(round(y0 + tile_height)), height)))
+
+  return regions
+
+
+def non_max_suppression(detections: np.ndarray,
+                        threshold: float = 0.45) -> np.ndarray:
+  """Merge overlapping detections of the same class.
+
+  Args:
+    detections: Array of detections with x0, y0, x1, y1, score & class
+                in every row.
+    threshold: IoU (default: 0.45) above which the detections are
+               considered duplicates.
+
+  Returns:
+    Array of the detections which are kept.
+  """
+  if len(detections) < 2:
+    return detections
+
+  keep = []
+
+  for label in np.unique(detections[:, 5]):
+    idxs = np.flatnonzero(detections[:, 5] == label)
+    boxes = detections[idxs, :4]
+    rects = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2]))
+    picked = cv2.dnn.NMSBoxes(rects.tolist(), detections[idxs, 4].tolist(),
+                              0.0, threshold)
+    keep.extend(idxs[np.array(picked, dtype=int).flatten()])
+
+  return detections[np.sort(keep)]
+
+
+def iou_matrix(boxes: np.ndarray, others: np.ndarray) -> np.ndarray:
+  """Return IoU of every box (x0, y0, x1, y1) against every other box."""
+  boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+  others = np.asarray(others, dtype=np.float32).reshape(-1, 4)
+  x0 = np.maximum(boxes[:, None, 0], others[None, :, 0])
+  y0 = np.maximum(boxes[:, None, 1], others[None, :, 1])
+  x1 = np.minimum(boxes[:, None, 2], others[None, :, 2])
+  y1 = np.minimum(boxes[:, None, 3], others[None, :, 3])
+  overlap = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+  area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+  other_area = np.prod(others[:, 2:] - others[:, :2], axis=1)
+  union = area[:, None] + other_area[None, :] - overlap
+  return np.divide(overlap, union, out=np.zeros_like(overlap),
+                   where=union > 0)
+
+
+def detect_frames(net: cv2.dnn_Net,
+                  frames: List[np.ndarray],
+                  input_size: Union[int, Tuple[int, int]],
+                  scalefactor: float = 1.0,
+                  mean: Union[float, Tuple] = 0.0,
+                  blob: Optional[Callable[[List[np.ndarray]],
+                                          np.ndarray]] = None,
+                  confidence: float = 0.5,
+                  tiles: Tuple[int, int] = (1, 1),
+                  overlap: float = 0.2,
+                  nms_threshold: float = 0.45) -> List[np.ndarray]:
+  """Run SSD detector on the frames as a single batch.
+
+  Same as `detect()` but the tiles of all the frames are stacked into
+  one batch, so the network runs once for the whole list of frames.
+
+  Returns:
+    List of detections of every frame.
+  """
+  if isinstance(input_size, int):
+    input_size = (input_size, input_size)
+
+  regions, crops = [], []
+
+  for frame_idx, frame in enumerate(frames):
+    height, width = frame.shape[:2]
+
+    for x0, y0, x1, y1 in tile_grid(width, height, tiles, overlap):
+      regions.append((frame_idx, x0, y0, x1, y1))
+      crops.append(cv2.resize(frame[y0:y1, x0:x1], input_size,
+                              interpolation=cv2.INTER_AREA))
+
+  if not crops:
+    return []
+
+  if blob is None:
+    net.setInput(cv2.dnn.blobFromImages(crops, scalefactor, input_size, mean))
+  else:
+    net.setInput(blob(crops))
+
+  outputs = net.forward().reshape(-1, 7)
+  outputs = outputs[outputs[:, 2] > confidence]
+  detections = [[] for _ in frames]
+
+  for image, label, score, *coords in outputs:
+    frame_idx, x0, y0, x1, y1 = regions[int(image)]
+    scale = np.array([x1 - x0, y1 - y0, x1 - x0, y1 - y0])
+    detections[frame_idx].append([*(np.array(coords) * scale +
+                                    [x0, y0, x0, y0]), score, label])
+
+  for frame_idx, frame in enumerate(frames):
+    height, width = frame.shape[:2]
+    boxes = np.array(detections[frame_idx], dtype=np.float32).reshape(-1, 6)
+    np.clip(boxes[:, 0:4:2], 0, width, out=boxes[:, 0:4:2])
+    np.clip(boxes[:, 1:4:2], 0, height, out=boxes[:, 1:4:2])
+
+    if tiles[0] * tiles[1] > 1:
+      boxes = non_max_suppression(boxes, nms_threshold)
+
+    detections[frame_idx] = boxes
+
+  return detections
+
+
+def detect(net: cv2.dnn_Net,
+           frame: np.ndarray,
+           input_size: Union[int, Tuple[int, int]],
+           scalefactor: float = 1.0,
+           mean: Union[float, Tuple] = 0.0,
+           blob: Optional[Callable[[List[np.ndarray]], np.ndarray]] = None,
+           confidence: float = 0.5,
+           tiles: Tuple[int, int] = (1, 1),
+           overlap: float = 0.2,
+           nms_threshold: float = 0.45) -> np.ndarray:
+  """Run SSD detector on the frame at the native input size.
+
+  Resizes the frame (or every tile of the frame) to the native input
+  size of the network and runs all of them as a single batch. The cost
+  of the inference is therefore set by the number of tiles and not by
+  the resolution of the camera.
+
+  Args:
+    net: OpenCV DNN network with `DetectionOutput` layer.
+    frame: Numpy array of the image frame.
+    input_size: Native input size of the network.
+    scalefactor: Multiplier (default: 1.0) for the pixel values.
+    mean: Mean (default: 0.0) to be subtracted from the pixel values.
+    blob: Callable (default: None) which converts the list of resized
+          tiles into the network input if the network needs custom
+          preprocessing.
+    confidence: Minimum confidence (default: 0.5) of the detections.
+    tiles: Number (default: 1 x 1) of columns & rows of tiles.
+    overlap: Fraction (default: 0.2) of the overlap between tiles.
+    nms_threshold: IoU (default: 0.45) for merging the detections from
+                   neighbouring tiles.
+
+  Returns:
+    Array of detections with x0, y0, x1, y1, score & class in every row
+    in the frame coordinates.
+  """
+  return detect_frames(net, [frame], input_size, scalefactor, mean, blob,
+                       confidence, tiles, overlap, nms_threshold)[0]
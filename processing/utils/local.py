@@ -1,5 +1,6 @@
 """Utility for simplifying file operations."""
 
+import hashlib
 import os
 import shutil
 from pathlib import Path
@@ -86,3 +87,13 @@ def quick_rename(file: str, force: bool = True) -> Tuple[str, str]:
   if force:
     os.rename(file, _temp)
   return file, _temp
+
+
+def content_hash(file: str, chunk_size: int = 1 << 20) -> str:
+  """Returns hash of the file content, independent of it's name."""
+  digest = hashlib.blake2b(digest_size=16)
+
+  with open(file, 'rb') as source:
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
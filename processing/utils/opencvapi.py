@@ -1,10 +1,12 @@
 """Utility for making convenient use of OpenCV."""
 
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
 
+from processing.utils.gating import merge_regions
+
 red = [48, 59, 255]
 blue = [255, 122, 0]
 green = [100, 217, 76]
@@ -89,7 +91,92 @@ def draw_bounding_box(frame: np.ndarray,
         (x0, y0), (x1, y1) = x0_y0, x1_y1
         cv2.rectangle(frame, (x0, y1), (x1, y1 + 20), color, -1)
   """
-  overlay = frame.copy()
-  cv2.rectangle(overlay, x0_y0, x1_y1, color, -1)
+  height, width = frame.shape[:2]
+  x0, y0 = max(int(x0_y0[0]), 0), max(int(x0_y0[1]), 0)
+  x1, y1 = min(int(x1_y1[0]), width), min(int(x1_y1[1]), height)
+  # Only the box is blended with the color instead of the copy of the
+  # complete frame.
+  region = frame[y0:y1, x0:x1]
+
+  if region.size:
+    cv2.addWeighted(region, 1 - alpha, region, 0, 0, region)
+    cv2.add(region, tuple(channel * alpha for channel in color) + (0,),
+            region)
+
   cv2.rectangle(frame, x0_y0, x1_y1, color, thickness)
-  cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+
+
+def draw_bounding_boxes(frame: np.ndarray,
+                        boxes: Sequence[Sequence[int]],
+                        colors: Union[List, Sequence[List]] = green,
+                        labels: Optional[Sequence[Optional[str]]] = None,
+                        alpha: Union[float, int] = 0.3,
+                        thickness: int = 2,
+                        font_scale: float = 0.4) -> np.ndarray:
+  """Draw all the bounding boxes of the frame in one go.
+
+  Fills of the overlapping boxes are drawn on a single overlay which is
+  blended only over the region spanning those boxes, so the cost grows
+  with the area of the boxes and not with the size of the frame.
+
+  Args:
+    frame: Numpy array of the image frame.
+    boxes: List of boxes (x0, y0, x1, y1) to be drawn.
+    colors: Color (default: green) of all the boxes or list of colors
+            for every box.
+    labels: Labels (default: None) to be written above every box.
+    alpha: Opacity (default: 0.3) of the fill of the boxes.
+    thickness: Thickness (default: 2) of the bounding boxes.
+    font_scale: Scale (default: 0.4) of the font of the labels.
+
+  Returns:
+    Frame with the bounding boxes drawn in place.
+  """
+  if len(boxes) == 0:
+    return frame
+
+  height, width = frame.shape[:2]
+  boxes = [tuple(map(int, box[:4])) for box in boxes]
+
+  if len(colors) and not isinstance(colors[0], (list, tuple)):
+    colors = [colors] * len(boxes)
+
+  # Fills include the bottom right corner, clipped to the frame.
+  fills = [((max(bx0, 0), max(by0, 0), min(bx1 + 1, width),
+             min(by1 + 1, height)), color)
+           for (bx0, by0, bx1, by1), color in zip(boxes, colors)]
+  fills = [(box, color) for box, color in fills
+           if box[2] > box[0] and box[3] > box[1]]
+
+  # Overlapping fills are blended together, so they look the same as if
+  # they were blended over the complete frame at once.
+  for x0, y0, x1, y1 in merge_regions([box for box, _ in fills],
+                                      len(fills)):
+    region = frame[y0:y1, x0:x1]
+    overlay = region.copy()
+
+    for (bx0, by0, bx1, by1), color in fills:
+      if bx0 >= x0 and by0 >= y0 and bx1 <= x1 and by1 <= y1:
+        cv2.rectangle(overlay, (bx0 - x0, by0 - y0),
+                      (bx1 - x0 - 1, by1 - y0 - 1), color, -1)
+
+    cv2.addWeighted(overlay, alpha, region, 1 - alpha, 0, region)
+
+  for idx, ((bx0, by0, bx1, by1), color) in enumerate(zip(boxes, colors)):
+    cv2.rectangle(frame, (bx0, by0), (bx1, by1), color, thickness)
+
+    if labels is None or not labels[idx]:
+      continue
+
+    (text_width, text_height), baseline = cv2.getTextSize(
+        labels[idx], cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+    # Labels of the boxes at the top of the frame are written inside.
+    top = by0 - text_height - baseline - 4
+    top = top if top >= 0 else by0
+    cv2.rectangle(frame, (bx0, top),
+                  (bx0 + text_width + 4, top + text_height + baseline + 4),
+                  color, -1)
+    cv2.putText(frame, labels[idx], (bx0 + 2, top + text_height + 2),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, white, 1, cv2.LINE_AA)
+
+  return frame
@@ -18,6 +18,9 @@ TF_CAFFEMODEL = 'tf_ssd_deploy.caffemodel'
 LP_PROTOTXT = 'mssd512_voc.prototxt'
 LP_CAFFEMODEL = 'mssd512_voc.caffemodel'
 
+# Regions of interest of the cameras
+ROI_POLYGONS = 'rois.json'
+
 # Reference video
 REFERENCE_VIDEO = 'reference.mkv'
 
@@ -30,6 +33,21 @@ videos = os.path.join(parent_path, 'videos')
 # Other paths
 logs = os.path.join(parent_path, 'logs')
 
+# Path where the background models of the cameras are stored.
+backgrounds = os.path.join(parent_path, 'backgrounds')
+
+# Path where the detections of the analyzed videos are stored.
+sidecars = os.path.join(parent_path, 'sidecars')
+
+# Path where the manifests of the stages finished by the orders are kept.
+checkpoints = os.path.join(parent_path, 'checkpoints')
+
+# Path where the results of the processed videos are cached.
+results = os.path.join(parent_path, 'results')
+
+# Path where the detection reports of the analyzed videos are kept.
+reports = os.path.join(parent_path, 'reports')
+
 caffemodel = os.path.join(models, FACE_CAFFEMODEL)
 prototxt = os.path.join(models, FACE_PROTOTXT)
 tf_caffemodel = os.path.join(models, TF_CAFFEMODEL)
@@ -40,3 +58,4 @@ frontal_haar = os.path.join(models, FRONTAL_HAAR)
 frontal_haar_2 = os.path.join(models, FRONTAL_HAAR_2)
 profile_haar = os.path.join(models, PROFILE_HAAR)
 reference_video = os.path.join(models, REFERENCE_VIDEO)
+rois = os.path.join(models, ROI_POLYGONS)
@@ -0,0 +1,215 @@
+"""Utility for streaming frames to and from ffmpeg over pipes."""
+
+import json
+import subprocess
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class FFmpegWriter:
+  """Write BGR frames directly as H264 video using ffmpeg.
+
+  Raw frames are streamed over a pipe to a single libx264 encoder, so
+  the video is encoded only once and is playable in the browsers. The
+  interface mirrors `cv2.VideoWriter`.
+  """
+
+  def __init__(self,
+               file: str,
+               fps: float,
+               size: Tuple[int, int],
+               preset: str = 'medium',
+               bitrate: Optional[int] = None) -> None:
+    width, height = size
+    command = ['ffmpeg', '-loglevel', 'error', '-y',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+               '-s', f'{width}x{height}', '-r', str(fps or 30), '-i', '-',
+               '-an', '-vcodec', 'libx264', '-preset', preset,
+               # H264 with 4:2:0 chroma subsampling needs even dimensions.
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+               '-pix_fmt', 'yuv420p']
+
+    if bitrate:
+      command += ['-b:v', str(bitrate)]
+
+    self.size = (width, height)
+    self.process = subprocess.Popen(command + [file], stdin=subprocess.PIPE)
+
+  def isOpened(self) -> bool:
+    """Check if the encoder is still accepting frames."""
+    return self.process.poll() is None
+
+  def write(self, frame: np.ndarray) -> None:
+    """Write the frame to the encoder without copying it."""
+    self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+  def release(self) -> None:
+    """Finish encoding and wait for the encoder to exit."""
+    if self.process.stdin and not self.process.stdin.closed:
+      self.process.stdin.close()
+    self.process.wait()
+
+
+def _probe(file: str) -> Tuple[dict, float]:
+  """Return video stream & duration (in secs) from the container."""
+  output = subprocess.check_output(
+      ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+       'stream=width,height,avg_frame_rate,r_frame_rate,nb_frames:'
+       'format=duration', '-of', 'json', file])
+  probed = json.loads(output)
+  duration = probed.get('format', {}).get('duration', 'N/A')
+  return probed['streams'][0], float(duration) if duration != 'N/A' else 0.0
+
+
+def _timestamps(file: str) -> List[float]:
+  """Return presentation timestamps of the packets of the video."""
+  output = subprocess.check_output(
+      ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+       'packet=pts_time', '-of', 'json', file])
+  # Packets are stored in the decoding order, frames come out sorted.
+  return sorted(float(packet['pts_time'])
+                for packet in json.loads(output).get('packets', [])
+                if packet.get('pts_time', 'N/A') != 'N/A')
+
+
+def _rate(rate: str) -> float:
+  """Return frame rate from the ffprobe fraction."""
+  num, _, den = (rate or '0/1').partition('/')
+  return float(num) / float(den or 1) if float(den or 1) else 0.0
+
+
+class FFmpegReader:
+  """Read raw frames decoded by ffmpeg instead of OpenCV.
+
+  ffmpeg decodes the video using multiple threads and scales the frames
+  before piping them, so the loops get frames at the analysis resolution
+  without resizing them in Python. Frames have a fixed size and are read
+  from the pipe straight into the NumPy buffers. The interface mirrors
+  `cv2.VideoCapture`.
+
+  Only the stream & the container are probed up front. Positions of the
+  constant frame rate videos follow from their frame rate, while the
+  variable frame rate ones read the presentation timestamps of their
+  packets once a position is first asked for, so that they stay
+  accurate.
+  """
+
+  def __init__(self,
+               file: str,
+               width: Optional[int] = None,
+               threads: int = 0) -> None:
+    stream, duration = _probe(file)
+    source_width, source_height = int(stream['width']), int(stream['height'])
+    width = width or source_width
+    # Same height as resizing the frames with `rescale()`.
+    height = int(source_height * (width / float(source_width)))
+    average = _rate(stream.get('avg_frame_rate'))
+    self.fps = average or _rate(stream.get('r_frame_rate'))
+    # Average & base frame rates differ only if the frame rate varies.
+    self.variable = average != _rate(stream.get('r_frame_rate'))
+    frames = str(stream.get('nb_frames', ''))
+    # Containers which do not store the number of frames give N/A.
+    frames = int(frames) if frames.isdigit() else 0
+    self.frames = frames or int(round(duration * self.fps))
+    self.file = file
+    self.size = (width, height)
+    self.shape = (height, width, 3)
+    self.position = 0
+    self._timestamps: Optional[List[float]] = None
+    command = ['ffmpeg', '-loglevel', 'error', '-threads', str(threads),
+               '-i', file, '-an', '-vsync', 'passthrough']
+
+    if (width, height) != (source_width, source_height):
+      command += ['-vf', f'scale={width}:{height}:flags=area']
+
+    command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+    self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+
+  @property
+  def timestamps(self) -> List[float]:
+    """Timestamps (in secs) of the frames from the first one onwards."""
+    if self._timestamps is None:
+      timestamps = _timestamps(self.file)
+      # Video without any packet has no timestamps to begin from.
+      first = timestamps[0] if timestamps else 0.0
+      self._timestamps = [stamp - first for stamp in timestamps]
+    return self._timestamps
+
+  def isOpened(self) -> bool:
+    """Check if the decoder is still running or has frames left."""
+    return not self.process.stdout.closed
+
+  def read(self,
+           image: Optional[np.ndarray] = None
+           ) -> Tuple[bool, Optional[np.ndarray]]:
+    """Read the next frame into the image buffer if it fits."""
+    if (image is None or image.shape != self.shape or
+            image.dtype != np.uint8 or not image.flags.c_contiguous):
+      image = np.empty(self.shape, dtype=np.uint8)
+
+    view, filled = memoryview(image).cast('B'), 0
+
+    while filled < len(view):
+      count = self.process.stdout.readinto(view[filled:])
+
+      if not count:
+        return False, None
+      filled += count
+
+    self.position += 1
+    return True, image
+
+  def get(self, prop: int) -> float:
+    """Return the property of the stream like `cv2.VideoCapture.get()`."""
+    if prop == cv2.CAP_PROP_FPS:
+      return self.fps
+    if prop == cv2.CAP_PROP_FRAME_WIDTH:
+      return float(self.size[0])
+    if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+      return float(self.size[1])
+    if prop == cv2.CAP_PROP_FRAME_COUNT:
+      return float(self.frames or len(self.timestamps))
+    if prop == cv2.CAP_PROP_POS_FRAMES:
+      return float(self.position)
+    if prop == cv2.CAP_PROP_POS_MSEC:
+      if not self.position:
+        return 0.0
+      if self.variable and self.position <= len(self.timestamps):
+        return self.timestamps[self.position - 1] * 1000
+      return (self.position - 1) * 1000 / (self.fps or 30)
+    return 0.0
+
+  def release(self) -> None:
+    """Stop the decoder and wait for it to exit."""
+    if not self.process.stdout.closed:
+      self.process.stdout.close()
+
+    if self.process.poll() is None:
+      self.process.terminate()
+    self.process.wait()
+
+
+def open_stream(file: str,
+                reader: str = 'opencv',
+                width: Optional[int] = None,
+                threads: int = 0
+                ) -> Union[cv2.VideoCapture, FFmpegReader]:
+  """Return frame source of the video.
+
+  Args:
+    file: Path of video file.
+    reader: Frame source (default: opencv) of the video, `opencv` or
+            `ffmpeg`.
+    width: Width (default: None -> full width) of the frames decoded by
+           ffmpeg.
+    threads: Number (default: 0 -> auto) of ffmpeg decoding threads.
+
+  Returns:
+    `cv2.VideoCapture` or `FFmpegReader` of the video. Frames are scaled
+    only by the ffmpeg reader.
+  """
+  if reader == 'ffmpeg':
+    return FFmpegReader(file, width, threads)
+  return cv2.VideoCapture(file)
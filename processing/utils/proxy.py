@@ -0,0 +1,151 @@
+"""Utility for analyzing videos using their low resolution proxies."""
+
+import os
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing.utils.buffers import FramePool
+
+# Gap (in frames) after which the frames are skipped by seeking instead
+# of decoding them, about the keyframe interval of x264 by default.
+SEEK_AFTER = 250
+
+
+def make_proxy(file: str,
+               width: int = 640,
+               gop: int = 12,
+               directory: Optional[str] = None) -> Optional[str]:
+  """Encode low resolution analysis proxy of the video.
+
+  The proxy keeps every frame of the video, so the frames line up by
+  their index. It's encoded using the x264 `ultrafast` preset tuned for
+  fast decoding, with a short GOP and no B-frames so that it's cheap to
+  decode and to seek into.
+
+  Args:
+    file: Path of the video file.
+    width: Width (default: 640) of the proxy.
+    gop: Number of frames (default: 12) between the keyframes.
+    directory: Directory (default: None -> directory of the video) where
+               the proxy is saved.
+
+  Returns:
+    Path of the proxy, None if the video is not wider than the proxy or
+    the proxy could not be encoded.
+  """
+  stream = cv2.VideoCapture(file)
+  source_width = int(stream.get(cv2.CAP_PROP_FRAME_WIDTH))
+  stream.release()
+
+  if source_width <= width:
+    return None
+
+  directory = directory or os.path.dirname(file)
+  proxy = os.path.join(directory, f'{Path(file).stem}_proxy.mp4')
+
+  try:
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-i', file, '-an',
+                    '-vsync', 'passthrough',
+                    '-vf', f'scale={width}:-2:flags=area',
+                    '-vcodec', 'libx264', '-preset', 'ultrafast',
+                    '-tune', 'fastdecode', '-g', str(gop), '-bf', '0',
+                    '-pix_fmt', 'yuv420p', proxy], check=True)
+  except (OSError, subprocess.CalledProcessError):
+    # Partly encoded proxy would not line up with the video.
+    if os.path.isfile(proxy):
+      os.remove(proxy)
+    return None
+
+  return proxy if os.path.isfile(proxy) else None
+
+
+class ProxyStream:
+  """Frames of the analysis proxy in step with the frames of a video.
+
+  Video starting `start` frames into the source reads the proxy from
+  that frame onwards, one proxy frame for every frame of the video.
+  Boxes detected on the proxy frames are mapped back to the resolution
+  of the video frames before the pixels are edited.
+  """
+
+  def __init__(self, file: str, start: int = 0) -> None:
+    self.stream = cv2.VideoCapture(file)
+
+    if start:
+      self.stream.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    self.size = (int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                 int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+  def read(self) -> Optional[np.ndarray]:
+    """Return the next proxy frame or None if the proxy has ended."""
+    valid_frame, frame = self.stream.read()
+    return frame if valid_frame else None
+
+  def to_source(self,
+                boxes: List[Tuple],
+                width: int,
+                height: int) -> List[Tuple]:
+    """Return boxes mapped from the proxy to the frame of the size.
+
+    Values after the coordinates, like the scores, are kept as they are.
+    """
+    sx, sy = width / float(self.size[0]), height / float(self.size[1])
+    return [(int(x0 * sx), int(y0 * sy), int(np.ceil(x1 * sx)),
+             int(np.ceil(y1 * sy)), *extra)
+            for x0, y0, x1, y1, *extra in boxes]
+
+  def release(self) -> None:
+    """Close the proxy."""
+    self.stream.release()
+
+
+def proxy_stream(proxy: Optional[str],
+                 start: int = 0) -> Optional[ProxyStream]:
+  """Return frames of the proxy from the start frame if it's provided."""
+  return ProxyStream(proxy, start) if proxy else None
+
+
+class SourceFrames:
+  """Full resolution frames of a video decoded only when they are used.
+
+  The analysis runs on the proxy, so the frames of the video which are
+  never written need not be decoded. Frames are requested in order and
+  a gap longer than `seek_after` frames is skipped by seeking, which
+  only decodes from the keyframe before the requested frame. Frames in
+  shorter gaps are grabbed, which skips converting them to BGR.
+  """
+
+  def __init__(self,
+               stream: cv2.VideoCapture,
+               pool: FramePool,
+               seek_after: int = SEEK_AFTER) -> None:
+    self.stream = stream
+    self.pool = pool
+    self.seek_after = seek_after
+    self.position = 0
+    self.decoded = 0
+
+  def read(self, index: int) -> Optional[np.ndarray]:
+    """Return the frame at the index or None if the video has ended."""
+    if index < self.position or index - self.position > self.seek_after:
+      self.stream.set(cv2.CAP_PROP_POS_FRAMES, index)
+      self.position = index
+
+    while self.position < index:
+      if not self.stream.grab():
+        return None
+      self.position += 1
+
+    valid_frame, frame = self.pool.read(self.stream)
+
+    if not valid_frame or frame is None:
+      return None
+
+    self.position += 1
+    self.decoded += 1
+    return frame
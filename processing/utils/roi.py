@@ -0,0 +1,125 @@
+"""Utility for working with per camera regions of interest."""
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from processing.utils.paths import rois
+
+
+def camera_key(store_id: Union[int, str],
+               area_code: str,
+               camera_id: Union[int, str]) -> str:
+  """Return key of the camera as per the order JSON."""
+  return f'{store_id}_{area_code}_{camera_id}'
+
+
+class RegionOfInterest:
+  """Region of interest of the camera.
+
+  Polygons are stored in normalized (0 - 1) coordinates so that the same
+  region can be used irrespective of the resolution of the video. The
+  rasterised masks are cached for every resolution they are requested
+  for.
+  """
+
+  def __init__(self, polygons: Sequence[Sequence[Sequence[float]]]) -> None:
+    self.polygons = [np.array(polygon, dtype=np.float32)
+                     for polygon in polygons]
+    self._masks: Dict[Tuple[int, int], np.ndarray] = {}
+    self._boxes: Dict[Tuple[int, int], Tuple[int, int, int, int]] = {}
+
+  def mask(self, width: int, height: int) -> np.ndarray:
+    """Return rasterised mask of the region for the resolution."""
+    if (width, height) not in self._masks:
+      mask = np.zeros((height, width), dtype=np.uint8)
+      points = [np.round(polygon * [width, height]).astype(np.int32)
+                for polygon in self.polygons]
+      cv2.fillPoly(mask, points, 255)
+      self._masks[(width, height)] = mask
+    return self._masks[(width, height)]
+
+  def bbox(self, width: int, height: int) -> Tuple[int, int, int, int]:
+    """Return bounding box of the region for the resolution."""
+    if (width, height) not in self._boxes:
+      x0, y0, w, h = cv2.boundingRect(self.mask(width, height))
+      self._boxes[(width, height)] = (x0, y0, x0 + w, y0 + h)
+    return self._boxes[(width, height)]
+
+  def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Return view of the frame cropped to the region with it's origin."""
+    x0, y0, x1, y1 = self.bbox(frame.shape[1], frame.shape[0])
+    return frame[y0:y1, x0:x1], (x0, y0)
+
+  def cropped_mask(self, width: int, height: int) -> np.ndarray:
+    """Return mask of the region cropped to it's bounding box."""
+    return self.crop(self.mask(width, height))[0]
+
+  def restore(self,
+              boxes: Sequence[Sequence[int]],
+              width: int,
+              height: int) -> List[Tuple[int, int, int, int]]:
+    """Map boxes from the cropped frame back to the full frame.
+
+    Boxes whose center lies outside the region are dropped. Values after
+    the coordinates (like scores) are kept as they are.
+
+    Args:
+      boxes: Boxes (x0, y0, x1, y1) detected in the cropped frame.
+      width: Width of the full frame.
+      height: Height of the full frame.
+
+    Returns:
+      Boxes in the full frame coordinates.
+    """
+    x, y, _, _ = self.bbox(width, height)
+    return self.inside([(int(x0 + x), int(y0 + y), int(x1 + x), int(y1 + y),
+                         *extra) for x0, y0, x1, y1, *extra in boxes],
+                       width, height)
+
+  def inside(self,
+             boxes: Sequence[Sequence[int]],
+             width: int,
+             height: int) -> List[Tuple[int, int, int, int]]:
+    """Return boxes of the full frame whose center lies inside the region."""
+    mask = self.mask(width, height)
+    inside = []
+
+    for x0, y0, x1, y1, *extra in boxes:
+      cx = min(max(int(x0 + x1) // 2, 0), width - 1)
+      cy = min(max(int(y0 + y1) // 2, 0), height - 1)
+
+      if mask[cy, cx]:
+        inside.append((x0, y0, x1, y1, *extra))
+
+    return inside
+
+
+def camera_roi(store_id: Union[int, str],
+               area_code: str,
+               camera_id: Union[int, str],
+               registry: str = rois) -> Optional[RegionOfInterest]:
+  """Return region of interest of the camera if it is registered.
+
+  Args:
+    store_id: Store ID from the order JSON.
+    area_code: Area code from the order JSON.
+    camera_id: Camera ID from the order JSON.
+    registry: JSON file (default: ./processing/models/rois.json) with
+              list of polygons for every camera key.
+
+  Returns:
+    Region of interest of the camera or None if the camera should be
+    analyzed completely.
+  """
+  if not os.path.isfile(registry):
+    return None
+
+  with open(registry, 'r') as json_file:
+    polygons = json.load(json_file).get(camera_key(store_id, area_code,
+                                                   camera_id), None)
+
+  return RegionOfInterest(polygons) if polygons else None
@@ -0,0 +1,231 @@
+"""Utility for persisting detections of the analyzed videos."""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from processing.utils.paths import sidecars
+from processing.utils.roi import RegionOfInterest
+
+Detection = Tuple[int, float, Tuple[int, int, int, int]]
+
+# Disk space (in bytes) the saved detections may take up.
+SIDECARS_BUDGET = 5 * 1024 ** 3
+
+RECORD = np.dtype([('frame', np.uint32), ('label', np.uint16),
+                   ('score', np.float32), ('box', np.int32, (4,))])
+
+
+def fingerprint(model: str, params: Dict[str, Any]) -> str:
+  """Return short hash of the model and it's parameters."""
+  normalized = json.dumps({'model': model, **params}, sort_keys=True,
+                          default=lambda value: np.asarray(value).tolist())
+  return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class DetectionStore:
+  """Detections of a video keyed by it's content, model & thresholds.
+
+  Every stage saves the frames it analyzed as a separate compressed
+  segment, so the stages (or the processes of a stage) never write to
+  the same file. Frames are numbered as per the source video, clips cut
+  from the source only need their time offset to reuse the detections.
+  Frames which were analyzed but had no detection are stored as well,
+  so that they are not analyzed again. Once the saved detections outgrow
+  the budget, the ones of the least recently used videos are evicted.
+  """
+
+  def __init__(self,
+               source_hash: str,
+               model: str,
+               params: Optional[Dict[str, Any]] = None,
+               directory: str = sidecars,
+               budget: float = SIDECARS_BUDGET) -> None:
+    key = fingerprint(model, params or {})
+    self.root = directory
+    self.budget = budget
+    self.source = os.path.join(directory, source_hash)
+    self.directory = os.path.join(self.source, f'{model}_{key}')
+    self._detections: Optional[Dict[int, List[Detection]]] = None
+    self._records: List[Tuple] = []
+    self._frames: List[int] = []
+    self.hits = 0
+    self.misses = 0
+
+  def _load(self) -> Dict[int, List[Detection]]:
+    """Return detections of all the saved segments."""
+    if self._detections is not None:
+      return self._detections
+
+    self._detections = {}
+
+    if not os.path.isdir(self.directory):
+      return self._detections
+
+    try:
+      # Marks the detections of the video as recently used.
+      os.utime(self.source)
+    except OSError:
+      pass
+
+    for segment in sorted(os.listdir(self.directory)):
+      if not segment.endswith('.npz'):
+        continue
+
+      with np.load(os.path.join(self.directory, segment)) as saved:
+        for frame in saved['frames'].tolist():
+          self._detections.setdefault(frame, [])
+
+        for record in saved['records']:
+          self._detections[int(record['frame'])].append(
+              (int(record['label']), float(record['score']),
+               tuple(record['box'].tolist())))
+
+    return self._detections
+
+  def get(self, frame: int) -> Optional[List[Detection]]:
+    """Return detections of the frame or None if it was not analyzed."""
+    return self._load().get(frame)
+
+  def put(self, frame: int, detections: List[Detection]) -> None:
+    """Add detections of the analyzed frame."""
+    self._load()[frame] = list(detections)
+    self._frames.append(frame)
+    self._records.extend((frame, label, score, box)
+                         for label, score, box in detections)
+
+  def save(self) -> Optional[str]:
+    """Save the frames analyzed since the last save as a new segment."""
+    if not self._frames:
+      return None
+
+    os.makedirs(self.directory, exist_ok=True)
+    segment = os.path.join(self.directory,
+                           f'{min(self._frames):08d}_{max(self._frames):08d}_'
+                           f'{uuid4().hex[:8]}.npz')
+    temp = f'{segment}.tmp'
+
+    with open(temp, 'wb') as temp_file:
+      np.savez_compressed(temp_file,
+                          frames=np.array(self._frames, dtype=np.uint32),
+                          records=np.array(self._records, dtype=RECORD))
+
+    os.replace(temp, segment)
+    os.utime(self.source)
+    self._frames, self._records = [], []
+    evict_sidecars(self.root, self.budget)
+    return segment
+
+
+def evict_sidecars(directory: str = sidecars,
+                   budget: float = SIDECARS_BUDGET) -> None:
+  """Remove detections of the least recently used videos over budget."""
+  entries = []
+
+  for source in os.listdir(directory):
+    path = os.path.join(directory, source)
+
+    try:
+      size = sum(os.path.getsize(os.path.join(root, name))
+                 for root, _, names in os.walk(path) for name in names)
+      entries.append((os.path.getmtime(path), size, path))
+    except OSError:
+      # Detections were evicted by another order meanwhile.
+      continue
+
+  total = sum(size for _, size, _ in entries)
+
+  for _, size, path in sorted(entries):
+    if total <= budget:
+      break
+
+    shutil.rmtree(path, ignore_errors=True)
+    total -= size
+
+
+def detection_store(source_hash: Optional[str],
+                    model: str,
+                    roi: Optional[RegionOfInterest] = None,
+                    **params) -> Optional[DetectionStore]:
+  """Return store of the detections if the source hash is known.
+
+  Args:
+    source_hash: Content hash (default: None) of the source video.
+    model: Name of the detection model.
+    roi: Region of interest (default: None) the detections are limited
+         to.
+    params: Thresholds & other parameters which affect the detections.
+  """
+  if source_hash is None:
+    return None
+
+  if roi is not None:
+    params['roi'] = [polygon.tolist() for polygon in roi.polygons]
+  # Parameters which do not apply are left out of the fingerprint, so the
+  # new ones do not invalidate the saved detections.
+  params = {key: value for key, value in params.items() if value is not None}
+  return DetectionStore(source_hash, model, params)
+
+
+def encoded_hash(source_hash: Optional[str], **params) -> Optional[str]:
+  """Return key of the detections of the clips encoded with the params.
+
+  Clips re-encoded before the analysis, like the compressed ones, have
+  frames which differ from the ones of the source. So their detections
+  are kept apart for every encoding, along with the source hash.
+  """
+  params = {key: value for key, value in params.items() if value is not None}
+
+  if source_hash is None or not params:
+    return source_hash
+  return f'{source_hash}_{fingerprint("encoding", params)}'
+
+
+def as_detections(boxes: List[Tuple]) -> List[Detection]:
+  """Return boxes with their scores as detections of a single class."""
+  return [(0, float(box[4]), tuple(box[:4])) for box in boxes]
+
+
+def as_boxes(detections: List[Detection]) -> List[Tuple[int, int, int, int]]:
+  """Return boxes of the detections."""
+  return [box for _, _, box in detections]
+
+
+def frame_offset(offset: float, fps: float) -> int:
+  """Return index of the source frame at the offset (in secs) of a clip."""
+  return int(round(offset * fps)) if fps else 0
+
+
+def cached(store: Optional[DetectionStore],
+           frames: List[int],
+           detect: Callable[[List[int]], List[List[Detection]]]
+           ) -> List[List[Detection]]:
+  """Return detections of the frames, detecting only the unsaved ones.
+
+  Args:
+    store: Store (default: None -> detect every frame) of detections.
+    frames: Indices of the frames in the source video.
+    detect: Callable which detects objects in the frames at the given
+            positions of the list and returns their detections.
+
+  Returns:
+    Detections of every frame in the same order.
+  """
+  if store is None:
+    return detect(list(range(len(frames))))
+
+  missing = [pos for pos, frame in enumerate(frames)
+             if store.get(frame) is None]
+
+  if missing:
+    for pos, detections in zip(missing, detect(missing)):
+      store.put(frames[pos], detections)
+
+  store.hits += len(frames) - len(missing)
+  store.misses += len(missing)
+  return [store.get(frame) for frame in frames]
@@ -0,0 +1,235 @@
+"""Utility for propagating detections between frames using optical flow."""
+
+from collections import deque
+from typing import Any, Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing.utils.inference import iou_matrix
+
+Box = Tuple[int, int, int, int]
+
+
+def _expand(boxes: List[Box],
+            width: int,
+            height: int,
+            fraction: float = 0.1) -> List[Box]:
+  """Return boxes grown by the fraction of their size on every side."""
+  expanded = []
+
+  for x0, y0, x1, y1 in boxes:
+    dx, dy = int((x1 - x0) * fraction), int((y1 - y0) * fraction)
+    expanded.append((max(x0 - dx, 0), max(y0 - dy, 0),
+                     min(x1 + dx, width), min(y1 + dy, height)))
+  return expanded
+
+
+def _features(gray_frame: np.ndarray,
+              box: Box,
+              max_corners: int = 20) -> Optional[np.ndarray]:
+  """Return corners inside the box which are good for tracking."""
+  height, width = gray_frame.shape[:2]
+  x0, y0 = min(max(int(box[0]), 0), width), min(max(int(box[1]), 0), height)
+  x1, y1 = min(max(int(box[2]), 0), width), min(max(int(box[3]), 0), height)
+
+  if x1 - x0 < 2 or y1 - y0 < 2:
+    return None
+
+  corners = cv2.goodFeaturesToTrack(gray_frame[y0:y1, x0:x1], max_corners,
+                                    0.01, 3)
+
+  if corners is None:
+    return None
+  return (corners + np.array([x0, y0], dtype=np.float32)).astype(np.float32)
+
+
+def _flow(previous: np.ndarray,
+          current: np.ndarray,
+          tracks: List[Tuple[Box, Optional[np.ndarray]]],
+          max_error: float = 20.0
+          ) -> Tuple[List[Tuple[Box, Optional[np.ndarray]]], float]:
+  """Move the boxes from previous to current frame using optical flow.
+
+  Points of all the boxes are tracked with a single Lucas-Kanade call
+  and every box is shifted by the median displacement of it's points.
+  Points whose matching error is above `max_error` are considered lost.
+  Boxes without any points stay where they are.
+
+  Returns:
+    Moved boxes along with their points and the lowest fraction of the
+    points tracked for any box.
+  """
+  points = [track for _, track in tracks if track is not None]
+
+  if not points:
+    return tracks, 1.0
+
+  start = np.concatenate(points)
+  end, status, error = cv2.calcOpticalFlowPyrLK(previous, current, start,
+                                                None, winSize=(15, 15),
+                                                maxLevel=2)
+  status = status.ravel().astype(bool) & (error.ravel() < max_error)
+  moved, confidence, offset = [], 1.0, 0
+
+  for (x0, y0, x1, y1), track in tracks:
+    if track is None:
+      moved.append(((x0, y0, x1, y1), None))
+      continue
+
+    count = len(track)
+    good = status[offset:offset + count]
+    shift = end[offset:offset + count][good] - track[good]
+    offset += count
+    confidence = min(confidence, float(np.mean(good)))
+
+    if not good.any():
+      moved.append(((x0, y0, x1, y1), None))
+      continue
+
+    dx, dy = np.median(shift.reshape(-1, 2), axis=0)
+    moved.append(((int(round(x0 + dx)), int(round(y0 + dy)),
+                   int(round(x1 + dx)), int(round(y1 + dy))),
+                  end[offset - count:offset][good].reshape(-1, 1, 2)))
+
+  return moved, confidence
+
+
+class DetectionTracker:
+  """Run the detector every N frames and track the boxes in between.
+
+  Boxes are propagated to the frames between detections using sparse
+  optical flow and expanded slightly so that the redaction stays
+  conservative. The detector runs again immediately on a scene change
+  or when the tracked points are lost. Frames are held back until the
+  next detection so that the boxes detected there are also propagated
+  backwards, covering objects which appeared between the detections.
+  """
+
+  def __init__(self,
+               detector: Callable[[np.ndarray, Any], List[Box]],
+               interval: int = 5,
+               expand: float = 0.1,
+               min_confidence: float = 0.5,
+               scene_threshold: float = 40.0) -> None:
+    self.detector = detector
+    self.interval = max(int(interval), 1)
+    self.expand = expand
+    self.min_confidence = min_confidence
+    self.scene_threshold = scene_threshold
+    self.detections = 0
+    self._pending = deque()
+    self._tracks: List[Tuple[Box, Optional[np.ndarray]]] = []
+    self._gray: Optional[np.ndarray] = None
+    self._thumbnail: Optional[np.ndarray] = None
+    self._since = 0
+
+  def _scene_changed(self, gray_frame: np.ndarray) -> bool:
+    """Check if the frame belongs to a different scene than the last one."""
+    height, width = gray_frame.shape[:2]
+    thumbnail = cv2.resize(gray_frame, (64, max(int(64 * height / width), 1)),
+                           interpolation=cv2.INTER_AREA)
+    previous, self._thumbnail = self._thumbnail, thumbnail
+    return (previous is None or
+            float(np.mean(cv2.absdiff(previous, thumbnail))) >
+            self.scene_threshold)
+
+  def _detect(self,
+              frame: np.ndarray,
+              gray_frame: np.ndarray,
+              payload: Any = None) -> List[Box]:
+    """Run the detector and start tracking it's boxes."""
+    boxes = [tuple(map(int, box)) for box in self.detector(frame, payload)]
+    self._tracks = [(box, _features(gray_frame, box)) for box in boxes]
+    self.detections += 1
+    self._since = 0
+    return boxes
+
+  def _backfill(self, gray_frame: np.ndarray) -> None:
+    """Propagate the detected boxes backwards to the held back frames."""
+    tracks, current = self._tracks, gray_frame
+
+    for entry in reversed(self._pending):
+      moved, _ = _flow(current, entry[1], tracks)
+      # Boxes whose points are lost are not present in the older frames.
+      tracks = [(box, points) for (box, points), (_, old) in zip(moved, tracks)
+                if points is not None or old is None]
+
+      if not tracks:
+        break
+
+      height, width = entry[1].shape[:2]
+      boxes = _expand([box for box, _ in tracks], width, height, self.expand)
+
+      if entry[3]:
+        covered = iou_matrix(boxes, entry[3]).max(axis=1) >= 0.5
+        boxes = [box for box, skip in zip(boxes, covered) if not skip]
+
+      entry[3].extend(boxes)
+      current = entry[1]
+
+  def _release(self) -> List[Tuple[np.ndarray, Any, List[Box]]]:
+    """Return the held back frames with their boxes."""
+    released = [(frame, payload, boxes)
+                for frame, _, payload, boxes in self._pending]
+    self._pending.clear()
+    return released
+
+  def update(self,
+             frame: np.ndarray,
+             payload: Any = None,
+             gray_frame: Optional[np.ndarray] = None
+             ) -> List[Tuple[np.ndarray, Any, List[Box]]]:
+    """Add the frame and return the frames whose boxes are final.
+
+    Args:
+      frame: Numpy array of the image frame.
+      payload: Any value (default: None) passed to the detector and
+               returned along with the frame.
+      gray_frame: Grayscale (default: None) version of the frame.
+
+    Returns:
+      List of frames, their payload and boxes in the same order as they
+      were added.
+    """
+    if gray_frame is None:
+      gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    height, width = gray_frame.shape[:2]
+    released = []
+
+    if self._scene_changed(gray_frame):
+      released = self._release()
+      boxes = self._detect(frame, gray_frame, payload)
+    else:
+      tracks, confidence = _flow(self._gray, gray_frame, self._tracks)
+      self._since += 1
+
+      if self._since >= self.interval or confidence < self.min_confidence:
+        boxes = self._detect(frame, gray_frame, payload)
+        self._backfill(gray_frame)
+        released = self._release()
+        # Boxes still tracked from the previous detection are kept too, in
+        # case the detector misses them on this frame.
+        tracked = _expand([box for box, _ in tracks], width, height,
+                          self.expand)
+
+        if boxes and tracked:
+          covered = iou_matrix(tracked, boxes).max(axis=1) >= 0.5
+          tracked = [box for box, skip in zip(tracked, covered) if not skip]
+
+        boxes = boxes + tracked
+      else:
+        self._tracks = tracks
+        boxes = _expand([box for box, _ in tracks], width, height,
+                        self.expand)
+        self._pending.append([frame, gray_frame, payload, boxes])
+        self._gray = gray_frame
+        return released
+
+    self._gray = gray_frame
+    return released + [(frame, payload, boxes)]
+
+  def flush(self) -> List[Tuple[np.ndarray, Any, List[Box]]]:
+    """Return all the held back frames with their boxes."""
+    return self._release()
@@ -0,0 +1,55 @@
+"""Tests for persisting background model of the cameras."""
+
+import numpy as np
+
+from processing.utils.background import BackgroundModel
+
+HOUR = 3600.0
+RECORDED = 1_700_000_000.0
+
+
+def _model(directory, **kwargs):
+  """Return model of the camera learned from a single frame."""
+  model = BackgroundModel('camera', str(directory), **kwargs)
+  model.update(np.full((90, 160), 100, dtype=np.uint8))
+  return model
+
+
+def test_model_is_used_for_footage_recorded_around_the_same_time(tmp_path):
+  _model(tmp_path, recorded_at=RECORDED).save()
+  model = BackgroundModel('camera', str(tmp_path))
+
+  assert model.usable(RECORDED + 24 * HOUR)
+  assert not model.usable(RECORDED + 12 * HOUR)
+  assert model.load((90, 160), RECORDED + 24 * HOUR).shape == (90, 160)
+  assert model.load((90, 160), RECORDED + 12 * HOUR) is None
+  assert model.load((90, 160), RECORDED + 8 * 24 * HOUR) is None
+  assert model.load((90, 160), RECORDED - HOUR) is None
+  assert model.load((180, 320), RECORDED + 24 * HOUR) is None
+  # Footage to be analyzed is taken from the model by default.
+  model = BackgroundModel('camera', str(tmp_path),
+                          recorded_at=RECORDED + 24 * HOUR)
+  assert model.load((90, 160)) is not None
+
+
+def test_model_is_saved_atomically(tmp_path):
+  _model(tmp_path).save()
+  assert [path.name for path in tmp_path.iterdir()] == ['camera.npz']
+
+
+def test_unreadable_model_is_not_used(tmp_path):
+  (tmp_path / 'camera.npz').write_bytes(b'not a model')
+  model = BackgroundModel('camera', str(tmp_path))
+
+  assert not model.usable()
+  assert model.load((90, 160)) is None
+
+
+def test_model_is_dated_by_the_end_of_the_footage(tmp_path):
+  _model(tmp_path, recorded_at=RECORDED).save(duration=6 * HOUR)
+  model = BackgroundModel('camera', str(tmp_path))
+
+  # Footage recorded a day later around when the last one ended.
+  assert model.usable(RECORDED + 30 * HOUR)
+  assert not model.usable(RECORDED + 24 * HOUR)
+  assert not model.usable(RECORDED + HOUR)
@@ -0,0 +1,90 @@
+"""Tests for reusing the results of the videos processed before."""
+
+import os
+
+from processing.utils.cache import ResultCache
+
+
+def _clips(directory, *contents):
+  """Write the clips with the contents and return their paths."""
+  os.makedirs(directory, exist_ok=True)
+  paths = []
+
+  for idx, content in enumerate(contents):
+    path = os.path.join(directory, f'clip_{idx}.mp4')
+
+    with open(path, 'wb') as clip:
+      clip.write(content)
+    paths.append(path)
+  return paths
+
+
+def _age(cache, key, seconds):
+  """Mark the entry as last used the seconds ago."""
+  manifest = os.path.join(cache.directory, key, 'entry.json')
+  when = os.path.getmtime(manifest) - seconds
+  os.utime(manifest, (when, when))
+
+
+def test_key_follows_the_source_and_parameters():
+  params = {'compression': True, 'roi': [[0, 0], [5, 5]], 'preset': None}
+  key = ResultCache.key('clips', 'abc', params)
+
+  assert key.startswith('clips_')
+  assert key == ResultCache.key('clips', 'abc', dict(reversed(params.items())))
+  assert key != ResultCache.key('clips', 'abd', params)
+  assert key != ResultCache.key('clips', 'abc', {**params, 'preset': 'fast'})
+  assert key != ResultCache.key('motion', 'abc', params)
+
+
+def test_restored_files_keep_their_order(tmp_path):
+  cache = ResultCache(str(tmp_path / 'results'))
+  key = ResultCache.key('clips', 'abc', {})
+  cache.put(key, _clips(str(tmp_path / 'workspace'), b'first', b'second'))
+
+  target = str(tmp_path / 'restored')
+  os.makedirs(target)
+  restored = cache.restore(key, lambda idx: os.path.join(target,
+                                                         f'{idx}.mp4'))
+
+  assert [os.path.basename(path) for path in restored] == ['0.mp4', '1.mp4']
+  assert [open(path, 'rb').read() for path in restored] == [b'first',
+                                                            b'second']
+  assert not [name for name in os.listdir(cache.directory)
+              if name.endswith('.tmp')]
+
+
+def test_missing_entry_is_not_restored(tmp_path):
+  cache = ResultCache(str(tmp_path))
+  assert cache.restore('clips_missing', lambda idx: str(tmp_path)) is None
+
+
+def test_existing_entry_is_kept(tmp_path):
+  cache = ResultCache(str(tmp_path / 'results'))
+  key = ResultCache.key('clips', 'abc', {})
+  cache.put(key, _clips(str(tmp_path / 'first'), b'first'))
+  cache.put(key, _clips(str(tmp_path / 'second'), b'second'))
+
+  restored = cache.restore(key, lambda idx: str(tmp_path / 'restored.mp4'))
+  assert open(restored[0], 'rb').read() == b'first'
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+  cache = ResultCache(str(tmp_path / 'results'), budget=float('inf'))
+  workspace = str(tmp_path / 'workspace')
+  keys = [ResultCache.key('clips', source, {}) for source in 'abc']
+
+  for idx, key in enumerate(keys):
+    cache.put(key, _clips(os.path.join(workspace, key), b'x' * 1000))
+    _age(cache, key, 100 * (len(keys) - idx))
+
+  # Oldest entry is used again, so the second one is evicted instead.
+  assert cache.restore(keys[0], lambda idx: str(tmp_path / 'a.mp4'))
+  cache.budget = 2500
+  cache.evict()
+
+  assert sorted(os.listdir(cache.directory)) == sorted([keys[0], keys[2]])
+
+  cache.budget = 0
+  cache.evict()
+  assert os.listdir(cache.directory) == []
@@ -0,0 +1,76 @@
+"""Tests for resuming the orders from their last finished stage."""
+
+import logging
+
+import pytest
+
+from processing.core.pipeline import Stage, run_pipeline
+from processing.utils.checkpoint import Checkpoint, existing, succeeded
+
+log = logging.getLogger(__name__)
+
+
+def test_manifest_survives_a_restart(tmp_path):
+  checkpoint = Checkpoint(42, str(tmp_path))
+  checkpoint.save(motion_file='motion.csv')
+  checkpoint.record('compression', 1, 'b.mp4')
+  checkpoint.reach(3)
+  checkpoint.reach(3)
+
+  resumed = Checkpoint(42, str(tmp_path))
+  assert resumed.get('motion_file') == 'motion.csv'
+  assert resumed.clips('compression') == {1: 'b.mp4'}
+  assert resumed.clips('upload') == {}
+  assert resumed.reached(3) and not resumed.reached(5)
+  assert resumed.get('milestones') == [3]
+  assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_cleared_manifest_starts_over(tmp_path):
+  checkpoint = Checkpoint('order', str(tmp_path))
+  checkpoint.record('upload', 0, 'https://bucket/a.mp4')
+  checkpoint.clear()
+
+  assert not (tmp_path / 'order.json').exists()
+  assert Checkpoint('order', str(tmp_path)).clips('upload') == {}
+
+
+def test_only_present_and_successful_outputs_are_reused(tmp_path):
+  present = tmp_path / 'a.mp4'
+  present.write_bytes(b'clip')
+  outputs = {0: str(present), 1: str(tmp_path / 'b.mp4'), 2: None}
+
+  assert existing(outputs) == {0: str(present)}
+  assert succeeded({0: 'https://bucket/a.mp4', 1: None}) == {
+      0: 'https://bucket/a.mp4'}
+
+
+def test_resumed_pipeline_runs_only_the_unfinished_clips(tmp_path):
+  calls, crash = [], [True]
+
+  def compress(clip):
+    calls.append(clip)
+
+    if clip == 'c' and crash[0]:
+      raise OSError('crashed')
+    return f'{clip}-compressed'
+
+  def stages(checkpoint):
+    return [Stage('compression', compress, processes=False,
+                  done=checkpoint.clips('compression'),
+                  on_result=lambda idx, output: checkpoint.record(
+                      'compression', idx, output))]
+
+  with pytest.raises(OSError):
+    run_pipeline(['a', 'b', 'c'], stages(Checkpoint(7, str(tmp_path))), log)
+
+  # Clips finished before the crash are recorded, but not the crashed one.
+  finished = Checkpoint(7, str(tmp_path)).clips('compression')
+  assert 2 not in finished
+  calls.clear()
+  crash[0] = False
+  outputs = run_pipeline(['a', 'b', 'c'],
+                         stages(Checkpoint(7, str(tmp_path))), log)
+  assert calls == [clip for idx, clip in enumerate('abc')
+                   if idx not in finished]
+  assert outputs == [['a-compressed', 'b-compressed', 'c-compressed']]
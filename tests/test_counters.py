@@ -0,0 +1,54 @@
+"""Tests for counting detections per second of the video."""
+
+import os
+
+import numpy as np
+
+from processing.utils import counters
+from processing.utils.counters import DetectionCounter, report_file
+
+
+def test_counters_keep_the_maximum_and_sum():
+  counter = DetectionCounter(2, ['faces', 'plates'])
+  counter.update(0, [1, 0])
+  counter.update(0, [3, 1])
+  counter.update(5, [0, 2])
+
+  assert counter.max.tolist()[:6] == [[3, 1], [0, 0], [0, 0], [0, 0],
+                                      [0, 0], [0, 2]]
+  assert counter.sum[0].tolist() == [4, 1]
+  assert counter.frames[[0, 5]].tolist() == [2, 1]
+  assert counter.seconds().tolist() == [0, 5]
+
+
+def test_counters_of_the_portions_are_merged():
+  first, second = DetectionCounter(1), DetectionCounter(1)
+  first.update(0, 2)
+  second.update(3, 1)
+  merged = first.merge(second)
+
+  assert merged is first
+  assert merged.seconds().tolist() == [0, 3]
+  assert np.sum(merged.frames) == 2
+
+
+def test_counters_are_saved_as_numpy_and_csv(tmp_path):
+  counter = DetectionCounter(3)
+  counter.update(1, 2)
+  npz, report = counter.save(str(tmp_path / 'counts.csv'))
+
+  with np.load(npz) as saved:
+    assert saved['max'].ravel().tolist() == [0, 2, 0]
+
+  with open(report) as csv_file:
+    lines = csv_file.read().splitlines()
+  assert lines[1].endswith(',1,2,2')
+
+
+def test_reports_are_kept_outside_the_workspace(tmp_path, monkeypatch):
+  monkeypatch.setattr(counters, 'reports', str(tmp_path / 'reports'))
+  stem = report_file(str(tmp_path / 'bucket1_xa' / 'clip.mp4'), 'motion')
+  files = DetectionCounter(1, 'motion').save(stem)
+
+  assert stem == str(tmp_path / 'reports' / 'bucket1_xa' / 'clip_motion')
+  assert all(os.path.isfile(file) for file in files)
@@ -0,0 +1,43 @@
+"""Tests for the redaction effects."""
+
+import numpy as np
+
+from processing.utils.effects import redact_regions
+
+
+def _noise() -> np.ndarray:
+  return np.random.default_rng(0).integers(0, 255, (200, 300, 3),
+                                           dtype=np.uint8)
+
+
+def test_only_the_boxes_are_redacted():
+  frame = _noise()
+  original = frame.copy()
+  redact_regions(frame, [(0, 0, 20, 20), (10, 10, 30, 30),
+                         (250, 150, 300, 200)])
+  changed = (frame != original).any(axis=2)
+
+  # Overlapping boxes are redacted together, but not the pixels between.
+  assert changed[:20, :20].all() and changed[10:30, 10:30].all()
+  assert not changed[22:30, :8].any()
+  assert changed[150:, 250:].all()
+  assert not changed[40:140, 40:240].any()
+
+
+def test_boxes_are_pixelated_and_clipped_to_the_frame():
+  frame = _noise()
+  original = frame.copy()
+  redact_regions(frame, [(-10, -10, 40, 40), (280, 180, 400, 400)],
+                 smooth_blur=False)
+
+  assert not np.array_equal(frame[:40, :40], original[:40, :40])
+  assert not np.array_equal(frame[180:, 280:], original[180:, 280:])
+  assert np.array_equal(frame[50:170, 50:270], original[50:170, 50:270])
+
+
+def test_empty_boxes_leave_the_frame_as_is():
+  frame = _noise()
+  original = frame.copy()
+
+  assert redact_regions(frame, [(5, 5, 5, 20), (400, 400, 500, 500)]) is frame
+  assert np.array_equal(frame, original)
@@ -0,0 +1,20 @@
+"""Tests for merging the regions the detector runs on."""
+
+from processing.utils.gating import merge_regions
+
+
+def test_disjoint_regions_are_kept():
+  boxes = [(0, 0, 10, 10), (20, 20, 30, 30)]
+  assert merge_regions(boxes) == boxes
+
+
+def test_overlapping_regions_are_merged_transitively():
+  boxes = [(0, 0, 10, 10), (25, 0, 35, 10), (8, 0, 27, 5)]
+  assert merge_regions(boxes) == [(0, 0, 35, 10)]
+
+
+def test_too_many_regions_become_one():
+  boxes = [(idx * 20, 0, idx * 20 + 10, 10) for idx in range(5)]
+
+  assert merge_regions(boxes, max_crops=5) == boxes
+  assert merge_regions(boxes, max_crops=4) == [(0, 0, 90, 10)]
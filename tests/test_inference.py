@@ -0,0 +1,43 @@
+"""Tests for the helpers of the batched & tiled detection."""
+
+import numpy as np
+
+from processing.utils.inference import (iou_matrix, non_max_suppression,
+                                        tile_grid)
+
+
+def test_single_tile_is_the_whole_frame():
+  assert tile_grid(640, 360) == [(0, 0, 640, 360)]
+
+
+def test_tiles_overlap_and_cover_the_frame():
+  tiles = tile_grid(1920, 1080, (3, 2), overlap=0.2)
+  covered = np.zeros((1080, 1920), dtype=bool)
+
+  for x0, y0, x1, y1 in tiles:
+    covered[y0:y1, x0:x1] = True
+
+  assert len(tiles) == 6
+  assert covered.all()
+  assert tiles[0][2] > tiles[1][0] and tiles[0][3] > tiles[3][1]
+  assert max(x1 for _, _, x1, _ in tiles) == 1920
+  assert max(y1 for _, _, _, y1 in tiles) == 1080
+
+
+def test_duplicates_of_the_same_class_are_suppressed():
+  detections = np.array([[10, 10, 50, 50, 0.6, 1],
+                         [12, 12, 52, 52, 0.9, 1],
+                         [12, 12, 52, 52, 0.8, 2],
+                         [100, 100, 140, 140, 0.7, 1]], dtype=np.float32)
+  kept = non_max_suppression(detections)
+
+  assert kept.tolist() == detections[1:].tolist()
+  assert non_max_suppression(detections[:1]).tolist() == (
+      detections[:1].tolist())
+
+
+def test_iou_of_every_pair():
+  ious = iou_matrix([[0, 0, 10, 10], [0, 0, 0, 0]],
+                    [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]])
+
+  assert np.allclose(ious, [[1.0, 50 / 150, 0.0], [0.0, 0.0, 0.0]])
@@ -0,0 +1,52 @@
+"""Tests for the convenience helpers of OpenCV."""
+
+import numpy as np
+
+from processing.utils.opencvapi import draw_bounding_boxes
+
+
+def test_boxes_are_filled_and_outlined_in_place():
+  frame = np.full((100, 200, 3), 100, dtype=np.uint8)
+  drawn = draw_bounding_boxes(frame, [(10, 10, 30, 30), (150, 60, 190, 90)],
+                              [[0, 0, 0], [200, 200, 200]], alpha=0.5,
+                              thickness=1)
+
+  assert drawn is frame
+  # Fills are blended, outlines are drawn with the color of every box.
+  assert frame[20, 20].tolist() == [50, 50, 50]
+  assert frame[75, 170].tolist() == [150, 150, 150]
+  assert frame[10, 20].tolist() == [0, 0, 0]
+  assert frame[60, 170].tolist() == [200, 200, 200]
+
+
+def test_pixels_between_the_boxes_are_untouched():
+  frame = np.random.default_rng(0).integers(0, 255, (100, 200, 3),
+                                            dtype=np.uint8)
+  original = frame.copy()
+  draw_bounding_boxes(frame, [(0, 0, 10, 10), (180, 80, 199, 99)])
+
+  assert np.array_equal(frame[15:75, 15:175], original[15:75, 15:175])
+
+
+def test_labels_are_written_above_the_boxes():
+  frame = np.zeros((100, 200, 3), dtype=np.uint8)
+  draw_bounding_boxes(frame, [(50, 50, 100, 90)], labels=['face'],
+                      alpha=0.0)
+
+  assert frame[30:50, 50:100].any()
+  assert not frame[:30].any()
+
+
+def test_no_boxes_leave_the_frame_as_is():
+  frame = np.zeros((10, 10, 3), dtype=np.uint8)
+  assert draw_bounding_boxes(frame, []) is frame
+  assert not frame.any()
+
+
+def test_overlapping_fills_are_blended_once():
+  frame = np.full((100, 200, 3), 100, dtype=np.uint8)
+  draw_bounding_boxes(frame, [(10, 10, 50, 50), (30, 30, 70, 70)],
+                      [[0, 0, 0], [0, 0, 0]], alpha=0.5, thickness=1)
+
+  assert frame[40, 40].tolist() == [50, 50, 50]
+  assert frame[20, 60].tolist() == [100, 100, 100]
@@ -0,0 +1,124 @@
+"""Tests for moving the clips through the stages of the pipeline."""
+
+import logging
+import threading
+import time
+
+import pytest
+
+from processing.core.pipeline import Stage, StageFailure, run_pipeline
+
+log = logging.getLogger(__name__)
+
+
+def test_outputs_follow_the_order_of_the_clips():
+  delays = {'a': 0.05, 'b': 0.0, 'c': 0.02}
+
+  def slow(clip):
+    time.sleep(delays[clip])
+    return clip.upper()
+
+  stages = [Stage('first', slow, 3, processes=False),
+            Stage('second', lambda clip: f'{clip}!', 2, processes=False)]
+  assert run_pipeline(['a', 'b', 'c'], stages, log) == [['A', 'B', 'C'],
+                                                        ['A!', 'B!', 'C!']]
+
+
+def test_stages_complete_in_order():
+  completed = []
+  stages = [Stage(name, lambda clip: clip, 2, processes=False,
+                  on_complete=lambda name=name: completed.append(name))
+            for name in ('compression', 'analysis', 'upload')]
+  run_pipeline(['a', 'b', 'c', 'd'], stages, log)
+  assert completed == ['compression', 'analysis', 'upload']
+
+
+def test_stages_complete_without_clips():
+  completed = []
+  stages = [Stage('only', str, processes=False,
+                  on_complete=lambda: completed.append('only'))]
+  assert run_pipeline([], stages, log) == [[]]
+  assert completed == ['only']
+
+
+def test_clips_overlap_between_the_stages():
+  started = threading.Event()
+
+  def first(clip):
+    if clip == 'b':
+      # Second clip is held until the first one reaches the next stage.
+      assert started.wait(5)
+    return clip
+
+  def second(clip):
+    started.set()
+    return clip
+
+  stages = [Stage('first', first, 2, processes=False),
+            Stage('second', second, processes=False)]
+  assert run_pipeline(['a', 'b'], stages, log)[-1] == ['a', 'b']
+
+
+def test_fallback_passes_the_input_on():
+  def analyze(clip):
+    if clip == 'bad':
+      raise ValueError(clip)
+    return f'{clip}-analyzed'
+
+  stage = Stage('analysis', analyze, processes=False, fallback=True)
+  outputs = run_pipeline(['good', 'bad'], [stage], log)
+  assert outputs == [['good-analyzed', 'bad']]
+  assert stage.failed == [1]
+
+
+def test_fallback_passes_the_partial_output_on():
+  def analyze(clip):
+    raise StageFailure('redaction failed', f'{clip}-counted')
+
+  recorded = []
+  stage = Stage('analysis', analyze, processes=False, fallback=True,
+                on_result=lambda idx, output: recorded.append(idx))
+  upload = Stage('upload', lambda clip: f'{clip}-uploaded', processes=False)
+  outputs = run_pipeline(['a'], [stage, upload], log)
+  assert outputs == [['a-counted'], ['a-counted-uploaded']]
+  assert stage.failed == [0]
+  # Failed clips are not recorded, so that they are retried.
+  assert recorded == []
+
+
+def test_failure_without_fallback_fails_the_pipeline():
+  def compress(clip):
+    raise ValueError(clip)
+
+  with pytest.raises(ValueError):
+    run_pipeline(['a'], [Stage('compression', compress, processes=False)],
+                 log)
+
+
+def test_done_clips_are_not_run_again():
+  calls, recorded = [], []
+
+  def compress(clip):
+    calls.append(clip)
+    return f'{clip}-compressed'
+
+  stages = [Stage('compression', compress, processes=False,
+                  done={0: 'a-earlier'},
+                  on_result=lambda idx, output: recorded.append(idx)),
+            Stage('upload', lambda clip: f'{clip}-uploaded',
+                  processes=False)]
+  outputs = run_pipeline(['a', 'b'], stages, log)
+  assert calls == ['b']
+  assert recorded == [1]
+  assert outputs == [['a-earlier', 'b-compressed'],
+                     ['a-earlier-uploaded', 'b-compressed-uploaded']]
+
+
+def test_failures_are_pickled_back_from_the_processes():
+  stage = Stage('analysis', _fail_partially, fallback=True)
+  assert run_pipeline(['a'], [stage], log) == [['a-partial']]
+  assert stage.failed == [0]
+
+
+def _fail_partially(clip):
+  raise StageFailure('failed', f'{clip}-partial')
@@ -0,0 +1,74 @@
+"""Tests for streaming frames to and from ffmpeg over pipes."""
+
+import json
+
+import cv2
+
+from processing.utils import pipes
+
+
+class _Process:
+  """Decoder which never produces a frame."""
+
+  def __init__(self, *args, **kwargs):
+    self.stdout = open(__file__, 'rb')
+
+  def poll(self):
+    return 0
+
+  def wait(self):
+    return 0
+
+
+def _reader(monkeypatch, rate='25/1', frames='50', packets=()):
+  """Return reader of a probed video, with the probes run so far."""
+  probes = []
+
+  def check_output(command):
+    probes.append(command)
+
+    if 'packet=pts_time' in command:
+      return json.dumps({'packets': [{'pts_time': pts}
+                                     for pts in packets]}).encode()
+    return json.dumps({'streams': [{'width': 64, 'height': 48,
+                                    'avg_frame_rate': rate,
+                                    'r_frame_rate': '25/1',
+                                    'nb_frames': frames}],
+                       'format': {'duration': '2.0'}}).encode()
+
+  monkeypatch.setattr(pipes.subprocess, 'check_output', check_output)
+  monkeypatch.setattr(pipes.subprocess, 'Popen', _Process)
+  return pipes.FFmpegReader('video.mp4', 32), probes
+
+
+def test_constant_frame_rate_is_not_probed_per_packet(monkeypatch):
+  reader, probes = _reader(monkeypatch, frames='N/A')
+  reader.position = 26
+
+  assert reader.get(cv2.CAP_PROP_FRAME_COUNT) == 50
+  assert reader.get(cv2.CAP_PROP_POS_MSEC) == 1000
+  assert reader.size == (32, 24) and len(probes) == 1
+  reader.release()
+
+
+def test_variable_frame_rate_reads_the_timestamps_once(monkeypatch):
+  reader, probes = _reader(monkeypatch, rate='20/1',
+                           packets=['1.5', '1.0', 'N/A', '2.0'])
+
+  assert len(probes) == 1
+  reader.position = 2
+  assert reader.get(cv2.CAP_PROP_POS_MSEC) == 500
+  reader.position = 3
+  assert reader.get(cv2.CAP_PROP_POS_MSEC) == 1000
+  assert len(probes) == 2
+  reader.release()
+
+
+def test_video_without_packets_has_no_timestamps(monkeypatch):
+  reader, _ = _reader(monkeypatch, rate='20/1', frames='0')
+  reader.position = 3
+
+  assert reader.timestamps == []
+  assert reader.get(cv2.CAP_PROP_FRAME_COUNT) == 40
+  assert reader.get(cv2.CAP_PROP_POS_MSEC) == 100
+  reader.release()
@@ -0,0 +1,94 @@
+"""Tests for running the orders concurrently within the budgets."""
+
+import logging
+import os
+
+from processing.core.scheduler import OrderScheduler, order_cost
+
+log = logging.getLogger(__name__)
+
+
+def test_cost_grows_with_the_workers_and_size():
+  order = {'count_obj': True, 'stage_workers': {'analysis': 1}}
+  cpu, memory, work = order_cost(order)
+  more_cpu, more_memory, _ = order_cost({**order,
+                                         'stage_workers': {'analysis': 3}})
+  _, big_memory, big_work = order_cost(order, size=4 * 1024 ** 3)
+
+  assert more_cpu > cpu and more_memory > memory
+  assert big_memory > memory and big_work > work
+  assert order_cost({**order, 'file_size': 4 * 1024 ** 3}) == order_cost(
+      order, size=4 * 1024 ** 3)
+
+
+def test_cost_counts_the_compression_only_if_performed():
+  cpu, memory, _ = order_cost({'perform_compression': False})
+  assert order_cost({})[:2] > (cpu, memory)
+
+
+def test_parallel_motion_needs_every_cpu():
+  cpu, _, _ = order_cost({'analyze_motion': True, 'parallel_motion': True,
+                          'stage_workers': {'compress': 0, 'upload': 0}})
+  assert cpu == 1 + (os.cpu_count() or 1)
+
+
+def _scheduler(*orders, **kwargs):
+  """Return scheduler with the orders (with their cost) queued."""
+  scheduler = OrderScheduler(str, log, **kwargs)
+
+  for order in orders:
+    scheduler.submit(order)
+  return scheduler
+
+
+def test_orders_are_admitted_by_priority_and_usage():
+  scheduler = _scheduler({'db_pk': 1, 'customer_id': 'a'},
+                         {'db_pk': 2, 'customer_id': 'a', 'priority': 1},
+                         {'db_pk': 3, 'customer_id': 'b'},
+                         cpu_budget=100, memory=1e6)
+  scheduler.usage['a'] = 10.0
+  admitted = [scheduler._next(100, 1e6, False)['order']['db_pk']
+              for _ in range(3)]
+
+  assert admitted == [2, 3, 1]
+  assert scheduler._next(100, 1e6, False) is None
+
+
+def test_smaller_orders_skip_ahead_only_so_many_times():
+  big = {'db_pk': 1, 'analyze_face': True, 'stage_workers': {'analysis': 4}}
+  small = [{'db_pk': idx, 'perform_compression': False}
+           for idx in range(2, 5)]
+  scheduler = _scheduler(big, *small, max_skips=2)
+  free_cpu, free_memory, _ = order_cost(small[0])
+
+  assert scheduler._next(free_cpu, free_memory, False)['order']['db_pk'] == 2
+  assert scheduler._next(free_cpu, free_memory, False)['order']['db_pk'] == 3
+  # Budget is now kept for the big order, until the machine is idle.
+  assert scheduler._next(free_cpu, free_memory, False) is None
+  assert scheduler._next(free_cpu, free_memory, True)['order']['db_pk'] == 1
+
+
+def test_every_order_is_run():
+  scheduler = _scheduler({'db_pk': 1}, {'db_pk': 2, 'analyze_face': True},
+                         cpu_budget=2, memory=1)
+  scheduler.run()
+
+  assert not scheduler._queue
+  assert set(scheduler.usage) == {0}
+
+
+def test_budget_below_a_core_still_runs_the_orders():
+  scheduler = _scheduler({'db_pk': 1}, cpu_budget=0.5, memory=1)
+  scheduler.run()
+
+  assert not scheduler._queue
+
+
+def test_parallel_motion_is_held_within_the_budget():
+  order = {'analyze_motion': True, 'parallel_motion': True,
+           'stage_workers': {'compress': 0, 'upload': 0}}
+  scheduler = _scheduler(order, cpu_budget=3, memory=1e6)
+
+  assert scheduler._queue[0]['order']['motion_processes'] == 2
+  assert scheduler._queue[0]['cpu'] == 3
+  assert 'motion_processes' not in order
@@ -0,0 +1,82 @@
+"""Tests for persisting detections of the analyzed videos."""
+
+import os
+
+from processing.utils.sidecar import (DetectionStore, cached, detection_store,
+                                      encoded_hash)
+
+
+def test_saved_detections_are_loaded_back(tmp_path):
+  store = DetectionStore('abc', 'faces', {'confidence': 0.5}, str(tmp_path))
+  store.put(10, [(0, 0.9, (1, 2, 3, 4)), (1, 0.6, (5, 6, 7, 8))])
+  store.put(11, [])
+  store.save()
+  assert store.save() is None
+
+  loaded = DetectionStore('abc', 'faces', {'confidence': 0.5},
+                          str(tmp_path))
+  assert loaded.get(11) == []
+  assert loaded.get(12) is None
+  assert [(label, round(score, 2), box)
+          for label, score, box in loaded.get(10)] == [(0, 0.9, (1, 2, 3, 4)),
+                                                       (1, 0.6, (5, 6, 7, 8))]
+
+
+def test_detections_are_keyed_by_the_parameters(tmp_path):
+  store = DetectionStore('abc', 'faces', {'confidence': 0.5}, str(tmp_path))
+  store.put(0, [])
+  store.save()
+
+  other = DetectionStore('abc', 'faces', {'confidence': 0.7}, str(tmp_path))
+  assert other.get(0) is None
+
+
+def test_store_needs_the_source_hash():
+  assert detection_store(None, 'faces') is None
+  # Parameters which do not apply are left out of the key.
+  assert (detection_store('abc', 'faces', confidence=0.5, tiles=None)
+          .directory == detection_store('abc', 'faces',
+                                        confidence=0.5).directory)
+
+
+def test_only_unsaved_frames_are_detected(tmp_path):
+  store = DetectionStore('abc', 'plates', directory=str(tmp_path))
+  store.put(5, [(0, 0.8, (0, 0, 1, 1))])
+  detected = []
+
+  def detect(positions):
+    detected.extend(positions)
+    return [[] for _ in positions]
+
+  assert cached(store, [4, 5, 6], detect) == [[], [(0, 0.8, (0, 0, 1, 1))],
+                                              []]
+  assert detected == [0, 2]
+  assert (store.hits, store.misses) == (1, 2)
+  assert cached(None, [4, 5], detect) == [[], []]
+
+
+def test_detections_of_the_encodings_are_kept_apart():
+  assert encoded_hash(None, bitrate=1000) is None
+  assert encoded_hash('abc', bitrate=None) == 'abc'
+  assert encoded_hash('abc', bitrate=1000) != encoded_hash('abc',
+                                                           bitrate=2000)
+  assert encoded_hash('abc', bitrate=1000).startswith('abc_')
+
+
+def test_least_recently_used_videos_are_evicted(tmp_path):
+  for idx, source in enumerate(['old', 'used', 'new']):
+    store = DetectionStore(source, 'faces', directory=str(tmp_path))
+    store.put(0, [(0, 0.9, (1, 2, 3, 4))] * 50)
+    store.save()
+    os.utime(store.source, (idx, idx))
+
+  size = sum(os.path.getsize(os.path.join(root, name))
+             for root, _, names in os.walk(str(tmp_path / 'new'))
+             for name in names)
+  DetectionStore('used', 'faces', directory=str(tmp_path)).get(0)
+  store = DetectionStore('new', 'faces', directory=str(tmp_path),
+                         budget=3.5 * size)
+  store.put(1, [(0, 0.9, (1, 2, 3, 4))] * 50)
+  store.save()
+
+  assert sorted(os.listdir(str(tmp_path))) == ['new', 'used']
@@ -0,0 +1,66 @@
+"""Tests for propagating detections between frames."""
+
+import numpy as np
+
+from processing.utils.tracking import DetectionTracker
+
+
+def _frame(seed=0, shift=0):
+  """Return textured frame, shifted to the right by the pixels."""
+  rng = np.random.default_rng(seed)
+  texture = rng.integers(0, 255, (120, 160), dtype=np.uint8)
+  return np.roll(texture, shift, axis=1)[..., None].repeat(3, axis=2)
+
+
+def _tracker(**kwargs):
+  """Return tracker with a detector finding one box, and it's calls."""
+  calls = []
+
+  def detector(frame, payload):
+    calls.append(payload)
+    return [(40, 40, 80, 80)]
+
+  return DetectionTracker(detector, **kwargs), calls
+
+
+def test_detector_runs_every_interval():
+  tracker, calls = _tracker(interval=3)
+  released = []
+
+  for idx in range(7):
+    released += tracker.update(_frame(shift=idx), idx)
+
+  released += tracker.flush()
+  assert calls == [0, 3, 6]
+  assert tracker.detections == 3
+  assert [payload for _, payload, _ in released] == list(range(7))
+  assert all(boxes for _, _, boxes in released)
+
+
+def test_frames_are_held_back_until_the_next_detection():
+  tracker, _ = _tracker(interval=3)
+
+  assert len(tracker.update(_frame(), 0)) == 1
+  assert tracker.update(_frame(shift=1), 1) == []
+  assert tracker.update(_frame(shift=2), 2) == []
+  assert [payload for _, payload, _ in
+          tracker.update(_frame(shift=3), 3)] == [1, 2, 3]
+
+
+def test_boxes_follow_the_motion():
+  tracker, _ = _tracker(interval=10, expand=0.0)
+  tracker.update(_frame(), 0)
+  tracker.update(_frame(shift=4), 1)
+  (_, _, boxes), = tracker.flush()
+
+  assert boxes == [(44, 40, 84, 80)]
+
+
+def test_scene_change_runs_the_detector():
+  tracker, calls = _tracker(interval=10)
+  tracker.update(_frame(seed=0), 0)
+  tracker.update(_frame(seed=0, shift=1), 1)
+  released = tracker.update(_frame(seed=1), 2)
+
+  assert calls == [0, 2]
+  assert [payload for _, payload, _ in released] == [1, 2]